@@ -5,7 +5,6 @@ Created on Fri Jan 14 15:09:31 2022
 @author: JH_Lin
 """
 import numpy as np
-import random
 import itertools
 import networkx as nx
 from networkx.algorithms import approximation
@@ -17,10 +16,246 @@ import pandas as pd
 import seaborn as sns
 import time
 from queue import Queue
+from collections.abc import Sequence
 import logging
+import os
+import sys
+import json
+import gzip
+import pickle
+import threading
+import multiprocessing
+import hashlib
+import traceback
+###################################################################################################################################################
+class indexed_site_set(Sequence):
+    '''
+    a set of microsite positions (len_id, wid_id) with O(1) add, remove, membership test and uniform random choice.
+    the positions are kept in a list and a dict maps each position to its index in the list; remove() moves the last position into the freed slot.
+    it is a read-only sequence, so len(), iteration, indexing and rng_sample() work as they do on a list. the order of the positions is arbitrary.
+    '''
+    def __init__(self, pos_ls=()):
+        self.pos_ls = []
+        self.index_dir = {}
+        for pos in pos_ls:
+            self.add(pos)
+    
+    def __len__(self):
+        return len(self.pos_ls)
+    
+    def __getitem__(self, index):
+        return self.pos_ls[index]
+    
+    def __iter__(self):
+        return iter(self.pos_ls)
+    
+    def __contains__(self, pos):
+        return pos in self.index_dir
+    
+    def __str__(self):
+        return str(self.pos_ls)
+    
+    def add(self, pos):
+        if pos in self.index_dir:
+            return 0
+        self.index_dir[pos] = len(self.pos_ls)
+        self.pos_ls.append(pos)
+        return 1
+    
+    def remove(self, pos):
+        try:
+            index = self.index_dir.pop(pos)
+        except KeyError:
+            raise ValueError('the site position %s inputed is no found.'%str(pos))
+        last_pos = self.pos_ls.pop()
+        if index < len(self.pos_ls):
+            self.pos_ls[index] = last_pos
+            self.index_dir[last_pos] = index
+        return 1
+    
+    def random_choice(self, rng):
+        ''' return a uniformly random position drawn from the np.random.Generator rng '''
+        return self.pos_ls[rng.integers(len(self.pos_ls))]
+    
+    def tolist(self):
+        return list(self.pos_ls)
+
+class site_pos_array(Sequence):
+    '''
+    a read-only sequence of the microsite positions (len_id, wid_id) of an array_habitat kept as an array of the site indexes (site = len_id*width+wid_id),
+    get_sites() returns the site indexes for the array-native methods.
+    '''
+    def __init__(self, sites, width):
+        self.site_arr = np.asarray(sites, dtype=int)
+        self.num = len(self.site_arr)
+        self.width = width
+
+    def __len__(self):
+        return self.num
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.num
+        if not 0 <= index < self.num:
+            raise IndexError('the index inputed is out of range.')
+        return divmod(int(self.site_arr[index]), self.width)
+
+    def __iter__(self):
+        return (divmod(site, self.width) for site in self.site_arr[:self.num].tolist())
+
+    def __str__(self):
+        return str(list(self))
+
+    def get_sites(self):
+        return self.site_arr[:self.num]
+
+    def tolist(self):
+        return list(self)
+
+class indexed_site_array(site_pos_array):
+    '''
+    the indexed_site_set of the microsites of an array_habitat, the sites are kept in the first num entries of site_arr (grown by doubling)
+    and index_arr maps each site of the habitat to its index in site_arr (-1 for the sites in no set).
+    index_arr may be shared by disjoint sets of the same habitat, e.g., the species_category of array_habitat, since a site is in one of them at most.
+    add_sites() and remove_sites() change many sites at once by array operations, remove() and remove_sites() move the last sites into the freed slots
+    as indexed_site_set.remove(), thus a removal is O(1) per site and the order of the sites is arbitrary.
+    '''
+    def __init__(self, size, width, sites=(), index_arr=None):
+        sites = np.asarray(sites, dtype=int)
+        site_pos_array.__init__(self, np.empty(max(len(sites), 4), dtype=int), width)
+        self.num = 0
+        self.index_arr = np.full(size, -1, dtype=int) if index_arr is None else index_arr
+        self.add_sites(sites)
+
+    def __contains__(self, pos):
+        site = pos[0]*self.width + pos[1]
+        index = self.index_arr[site]
+        return 0 <= index < self.num and self.site_arr[index] == site
+
+    def contains_sites(self, sites):
+        ''' return the mask of the sites in the set, a site in another set sharing index_arr is not in it '''
+        index = self.index_arr[sites]
+        return (index >= 0) & (index < self.num) & (self.site_arr[np.clip(index, 0, len(self.site_arr)-1)] == sites)
+
+    def add(self, pos):
+        return self.add_sites(np.array([pos[0]*self.width + pos[1]]))
+
+    def remove(self, pos):
+        site = pos[0]*self.width + pos[1]
+        index = self.index_arr[site]
+        if not (0 <= index < self.num and self.site_arr[index] == site):
+            raise ValueError('the site position %s inputed is no found.'%str(pos))
+        self.num -= 1
+        last_site = self.site_arr[self.num]
+        self.site_arr[index] = last_site
+        self.index_arr[last_site] = index
+        self.index_arr[site] = -1
+        return 1
+
+    def add_sites(self, sites):
+        ''' the sites already in the set are skipped, return the number of added sites '''
+        sites = sites[~self.contains_sites(sites)]
+        if self.num + len(sites) > len(self.site_arr):
+            site_arr = np.empty(max(2*len(self.site_arr), self.num + len(sites)), dtype=int)
+            site_arr[:self.num] = self.site_arr[:self.num]
+            self.site_arr = site_arr
+        self.site_arr[self.num:self.num+len(sites)] = sites
+        self.index_arr[sites] = np.arange(self.num, self.num+len(sites))
+        self.num += len(sites)
+        return len(sites)
+
+    def remove_sites(self, sites):
+        ''' the sites must be in the set, return the number of removed sites.
+        the slots of the removed sites below the new num are refilled with the remaining sites of the last slots. '''
+        missing = ~self.contains_sites(sites)
+        if missing.any():
+            raise ValueError('the site %d inputed is no found.'%sites[missing][0])
+        index = self.index_arr[sites]
+        self.num -= len(sites)
+        self.index_arr[sites] = -1
+        tail_sites = self.site_arr[self.num:self.num+len(sites)]
+        moved_sites = tail_sites[self.index_arr[tail_sites] != -1]
+        freed_index = np.sort(index[index < self.num])
+        self.site_arr[freed_index] = moved_sites
+        self.index_arr[moved_sites] = freed_index
+        return len(sites)
+
+def rng_sample(rng, population, num):
+    ''' random.sample() drawn from the np.random.Generator rng, population is a sequence, e.g., a list, a range or an indexed_site_set,
+    or an array whose rows are sampled (returned as an array). '''
+    index_arr = rng.choice(len(population), num, replace=False)
+    if isinstance(population, np.ndarray):
+        return population[index_arr]
+    return [population[index] for index in index_arr]
+
+class lazy_log_message():
+    '''
+    a log message which is formatted only when it is emitted, the values are read (e.g., from the cached counters) when the message is made.
+    it is passed as an argument of the logging call, e.g., logging.info('Dead selection process done! \n%s', log_info),
+    thus nothing is formatted when the level is disabled. it is not a string, thus a concatenation with a string raises TypeError.
+    '''
+    def __init__(self, fmt, *args):
+        self.fmt = fmt
+        self.args = args
+
+    def __str__(self):
+        return self.fmt % self.args
+
+###################################################################################################################################################
+class species_registry():
+    '''
+    dense integer species codes (0, 1, 2, ...) of the species_id strings and the optimum phenotypes of the species.
+    the hot paths key the species by code, the species_id strings are only used for input and output.
+    the species_id value is the number in the species_id as in the distribution data, e.g., 'sp12' -> 12.
+    '''
+    def __init__(self):
+        self.species_id_ls = []              # species code -> species_id
+        self.code_dir = {}                   # species_id -> species code
+        self.value_ls = []                   # species code -> species_id value
+        self.value_arr = np.array([np.nan])  # value_ls as an array plus np.nan at the end, thus the code -1 of empty sites gets np.nan
+        self.optimum_phenotype_dir = {}      # tuple of optimum phenotypes -> species code
+
+    def get_code(self, species_id):
+        ''' return the code of the species_id, an unknown species_id is registered '''
+        code = self.code_dir.get(species_id)
+        if code is None:
+            code = self.code_dir[species_id] = len(self.species_id_ls)
+            self.species_id_ls.append(species_id)
+            self.value_ls.append(int(re.findall(r"\d+",species_id)[0]))
+            self.value_arr = None
+        return code
+
+    def register(self, species_id, optimum_phenotype):
+        code = self.get_code(species_id)
+        self.optimum_phenotype_dir[tuple(optimum_phenotype)] = code
+        return code
+
+    def get_species_id(self, code):
+        return self.species_id_ls[code]
+
+    def get_value_arr(self):
+        ''' return the array of the species_id values indexed by the species codes, np.nan for the code -1 '''
+        if self.value_arr is None:
+            self.value_arr = np.array(self.value_ls + [np.nan])
+        return self.value_arr
+
+    def get_code_by_optimum_phenotype(self, optimum_phenotype, species_2_phenotype_ls=None):
+        ''' return the code of the species whose optimum phenotypes are optimum_phenotype.
+        if the phenotypes are unknown, the species of species_2_phenotype_ls (species_id='sp%d'%(index+1)) are registered first. '''
+        code = self.optimum_phenotype_dir.get(tuple(optimum_phenotype))
+        if code is None and species_2_phenotype_ls is not None:
+            for i, phenotype in enumerate(species_2_phenotype_ls):
+                self.optimum_phenotype_dir.setdefault(tuple(phenotype), self.get_code('sp%d'%(i+1)))
+            code = self.optimum_phenotype_dir.get(tuple(optimum_phenotype))
+        if code is None:
+            raise ValueError('optimum_phenotype inputed is no found.')
+        return code
+
+species_registry_object = species_registry()      # the registry of all the species in the model, filled by generating_mainland_species_pool()
+
 ###################################################################################################################################################
 class habitat():
-    def __init__(self, hab_name, num_env_types, env_types_name, mean_env_ls, var_env_ls, length, width):
+    def __init__(self, hab_name, num_env_types, env_types_name, mean_env_ls, var_env_ls, length, width, rng=None):
         '''
         int num_env_types is the number of environment types in the habitat.
         env_types_name is the list of names of env_types.
@@ -29,6 +264,7 @@ class habitat():
         int length is the length of the habitat.
         int width is the width of the habitat.
         int size is the the number of microsites within a habitat.
+        rng is the np.random.Generator of all the random draws of the habitat, the habitats of a patch share the generator of the patch.
         '''
         self.name = hab_name
         self.num_env_types = num_env_types
@@ -38,17 +274,22 @@ class habitat():
         self.length = length
         self.width = width
         self.size = length*width
+        self.rng = np.random.default_rng() if rng is None else rng
         self.set = {}                     # self.data_set={} # to be improved
         self.indi_num = 0
         self.offspring_pool = []
         self.dormancy_pool = []
-        self.species_category = {}
-        self.occupied_site_pos_ls = []
-        self.empty_site_pos_ls = [(i, j) for i in range(length) for j in range(width)]
+        self.species_category = {}        # {species_code: {gender: indexed_site_set of (len_id, wid_id)}}
+        self.occupied_site_pos_ls = indexed_site_set()
+        self.empty_site_pos_ls = indexed_site_set((i, j) for i in range(length) for j in range(width))
         
         self.reproduction_mode_threhold = 0.897
         self.asexual_parent_pos_ls = []                           # If an individual can fit its environment condition well, it goes through asexual reproduction.
         self.species_category_for_sexual_parents_pos = {}         # If an individual can not fit its environmet condition, it goes through sexual reproduction.
+        self.sexual_pairwise_parents_cache = None                 # one random pairing of species_category, kept until an individual is added or removed or the next dead selection.
+        self.mixed_sexual_pairwise_parents_cache = None           # one random pairing of species_category_for_sexual_parents_pos, kept until the next dead selection.
+        self.owner = None                                         # the patch object which the habitat belongs to, it receives the changes of the counters.
+        self.counters = {'individuals':0, 'empty_sites':self.size, 'asexual_parents':0, 'mating_pairs':0, 'mixed_mating_pairs':0}
 
         ####### to be improve #######
         self.dormancy_pool_max_size = 25
@@ -58,8 +299,9 @@ class habitat():
             mean_e_index = self.mean_env_ls[index]
             var_e_index = self.var_env_ls[index]
             name_e_index = self.env_types_name[index]
-            microsite_e_values = np.random.normal(loc=0, scale=var_e_index, size=(self.length, self.width)) + mean_e_index
+            microsite_e_values = self.rng.normal(loc=0, scale=var_e_index, size=(self.length, self.width)) + mean_e_index
             self.set[name_e_index] = microsite_e_values
+        self.env_val_arr = np.stack([self.set[env_name].reshape(-1) for env_name in self.env_types_name], axis=1) # [sites x env_types], site = len_id*width+wid_id
 
         microsite_individuals = [[None for i in range(self.length)] for i in range(self.width)]
         self.set['microsite_individuals'] = microsite_individuals
@@ -67,23 +309,62 @@ class habitat():
     def __str__(self):
         return str(self.set)
     
+    def update_counters(self, key, delta):
+        ''' add delta to the counter of the habitat and to the counters of the patch and metacommunity it belongs to '''
+        self.counters[key] += delta
+        if self.owner is not None:
+            self.owner.update_counters(key, delta)
+
+    def set_counter(self, key, value):
+        self.update_counters(key, value - self.counters[key])
+
+    def occupy_site(self, species_code, gender, len_id, wid_id):
+        ''' bookkeeping of empty and occupied sites, species_category and the counters when an individual settles in the microsite '''
+        self.empty_site_pos_ls.remove((len_id, wid_id))
+        self.occupied_site_pos_ls.add((len_id, wid_id))
+        self.indi_num +=1
+        self.sexual_pairwise_parents_cache = None
+        self.update_counters('individuals', 1)
+        self.update_counters('empty_sites', -1)
+
+        if species_code in self.species_category.keys():
+            if gender in self.species_category[species_code].keys():
+                self.species_category[species_code][gender].add((len_id, wid_id))
+            else:
+                self.species_category[species_code][gender] = indexed_site_set([(len_id, wid_id)])
+        else:
+            self.species_category[species_code] = {gender:indexed_site_set([(len_id, wid_id)])}
+        if len(self.species_category[species_code][gender]) <= len(self.species_category[species_code].get(self.other_gender(gender), ())):
+            self.update_counters('mating_pairs', 1)
+            
+    def vacate_site(self, species_code, gender, len_id, wid_id):
+        ''' bookkeeping of empty and occupied sites, species_category and the counters when the individual in the microsite is removed '''
+        self.empty_site_pos_ls.add((len_id, wid_id))
+        self.occupied_site_pos_ls.remove((len_id, wid_id))
+        self.indi_num -=1
+        self.clear_pairwise_parents_cache()
+        self.update_counters('individuals', -1)
+        self.update_counters('empty_sites', 1)
+        if len(self.species_category[species_code][gender]) <= len(self.species_category[species_code].get(self.other_gender(gender), ())):
+            self.update_counters('mating_pairs', -1)
+        self.species_category[species_code][gender].remove((len_id, wid_id))
+
+    def other_gender(self, gender):
+        if gender == 'female': return 'male'
+        if gender == 'male': return 'female'
+
+    def update_parents_counters(self):
+        ''' the asexual parents and the sexual parents of the mixed reproduction are sorted out in the dead selection '''
+        self.set_counter('asexual_parents', len(self.asexual_parent_pos_ls))
+        self.set_counter('mixed_mating_pairs', self.pairwise_parents_num(self.species_category_for_sexual_parents_pos))
+    
     def add_individual(self, indi_object, len_id, wid_id):
        
         if self.set['microsite_individuals'][len_id][wid_id] != None:
             print('the microsite in the habitat is occupied.')
         else:
             self.set['microsite_individuals'][len_id][wid_id] = indi_object
-            self.empty_site_pos_ls.remove((len_id, wid_id))
-            self.occupied_site_pos_ls.append((len_id, wid_id))
-            self.indi_num +=1
-
-            if indi_object.species_id in self.species_category.keys():
-                if indi_object.gender in self.species_category[indi_object.species_id].keys():
-                    self.species_category[indi_object.species_id][indi_object.gender].append((len_id, wid_id))
-                else:
-                    self.species_category[indi_object.species_id][indi_object.gender] = [(len_id, wid_id)]             
-            else:
-                self.species_category[indi_object.species_id] = {indi_object.gender:[(len_id, wid_id)]}
+            self.occupy_site(indi_object.species_code, indi_object.gender, len_id, wid_id)
                 
     def del_individual(self, len_id, wid_id):
         if self.set['microsite_individuals'][len_id][wid_id] == None:
@@ -91,21 +372,32 @@ class habitat():
         else:
             indi_object = self.set['microsite_individuals'][len_id][wid_id]
             self.set['microsite_individuals'][len_id][wid_id] = None
-            self.empty_site_pos_ls.append((len_id, wid_id))
-            self.occupied_site_pos_ls.remove((len_id, wid_id))
-            self.indi_num -=1 
-            self.species_category[indi_object.species_id][indi_object.gender].remove((len_id, wid_id))
+            self.vacate_site(indi_object.species_code, indi_object.gender, len_id, wid_id)
+    
+    def get_individual(self, len_id, wid_id):
+        ''' return the individual object in the microsite or None if the microsite is empty '''
+        return self.set['microsite_individuals'][len_id][wid_id]
+
+    def hab_empty_sites(self):
+        ''' the empty sites as they are sampled by the processes of the patch, i.e., the positions (len_id, wid_id) or the site indexes of array_habitat '''
+        return self.empty_site_pos_ls
+
+    def clear_pairwise_parents_cache(self):
+        ''' forget the cached pairings of sexual parents, they are made again on the next request '''
+        self.sexual_pairwise_parents_cache = None
+        self.mixed_sexual_pairwise_parents_cache = None
                                 
     def hab_initialize(self, traits_num, pheno_names_ls, pheno_var_ls, geno_len_ls, reproduce_mode, species_2_phenotype_ls):
         mean_pheno_val_ls = self.mean_env_ls
-        species_id = 'sp%d'%(species_2_phenotype_ls.index(mean_pheno_val_ls)+1)
+        species_id = species_registry_object.get_species_id(species_registry_object.get_code_by_optimum_phenotype(mean_pheno_val_ls, species_2_phenotype_ls))
         
+        gender_arr = self.rng.integers(0, 2, size=(self.length, self.width))
         for row in range(self.length):
             for col in range(self.width):
                 if reproduce_mode == 'asexual': gender = 'female'
-                if reproduce_mode == 'sexual': gender = random.sample(('male', 'female'), 1)[0]
+                if reproduce_mode == 'sexual': gender = ('male', 'female')[gender_arr[row, col]]
                 indi_object = individual(species_id=species_id, traits_num=traits_num, pheno_names_ls=pheno_names_ls, gender=gender)
-                indi_object.random_init_indi(mean_pheno_val_ls, pheno_var_ls, geno_len_ls)
+                indi_object.random_init_indi(mean_pheno_val_ls, pheno_var_ls, geno_len_ls, self.rng)
                 self.add_individual(indi_object, row, col)
         return 0
         
@@ -117,6 +409,38 @@ class habitat():
             env_val_ls.append(env_val)
         return env_val_ls
     
+    def get_hab_microsites_species_codes(self, out=None):
+        ''' return the species codes (see species_registry) of the microsites as a [size] int array in the order of site = len_id*width+wid_id, -1 for the empty sites. '''
+        if out is None:
+            out = np.empty(self.size, dtype=int)
+        out[:] = -1
+        microsite_individuals = self.set['microsite_individuals']
+        for len_id, wid_id in self.occupied_site_pos_ls:
+            out[len_id*self.width + wid_id] = microsite_individuals[len_id][wid_id].species_code
+        return out
+
+    def get_hab_microsites_sp_id_values(self, out=None):
+        ''' return the species_id values of the microsites as a [size] array in the order of site = len_id*width+wid_id, np.nan for the empty sites.
+        out is an optional float array of [size] to be filled in place. '''
+        if out is None:
+            out = np.empty(self.size)
+        out[:] = np.nan
+        microsite_individuals = self.set['microsite_individuals']
+        value_arr = species_registry_object.get_value_arr()
+        for len_id, wid_id in self.occupied_site_pos_ls:
+            out[len_id*self.width + wid_id] = value_arr[microsite_individuals[len_id][wid_id].species_code]
+        return out
+
+    def get_hab_microsites_phenotype_values(self, trait_name, out=None):
+        ''' return the phenotype (trait_name) of the microsites as a [size] array, np.nan for the empty sites. '''
+        if out is None:
+            out = np.empty(self.size)
+        out[:] = np.nan
+        microsite_individuals = self.set['microsite_individuals']
+        for len_id, wid_id in self.occupied_site_pos_ls:
+            out[len_id*self.width + wid_id] = microsite_individuals[len_id][wid_id].phenotype_set[trait_name]
+        return out
+
     def get_hab_pairwise_empty_site_pos_ls(self):
         ''' return as [((len_id, wid_id), (len_id, wid_id)) ...]'''
         
@@ -124,14 +448,17 @@ class habitat():
         if len(self.empty_site_pos_ls) < 2:
             return hab_pairwise_empty_sites_pos_ls
         else:
-            empty_sites_pos_ls = copy.deepcopy(self.empty_site_pos_ls) 
-            random.shuffle(empty_sites_pos_ls)
+            empty_sites_pos_ls = rng_sample(self.rng, self.empty_site_pos_ls, len(self.empty_site_pos_ls))
             for i in range(0, len(empty_sites_pos_ls)-1, 2):
                 empty_site_1_pos = empty_sites_pos_ls[i]
                 empty_site_2_pos = empty_sites_pos_ls[i+1]
                 
                 hab_pairwise_empty_sites_pos_ls.append((empty_site_1_pos, empty_site_2_pos))
             return hab_pairwise_empty_sites_pos_ls
+
+    def hab_pairwise_empty_sites_num(self):
+        ''' the number of pairs get_hab_pairwise_empty_site_pos_ls() makes, counted without pairing '''
+        return self.counters['empty_sites']//2
                 
 ######################################################################################################
     
@@ -168,248 +495,128 @@ class habitat():
         return survival_rate
     '''
 ####################################################################################################
+    def survival_rate_arr(self, d, phenotype_arr, env_val_arr, w = 0.5):
+        ''' survival_rate() of many individuals at once. 
+        phenotype_arr is the [individuals x traits] phenotype matrix, env_val_arr is the [individuals x env_types] environment values of their microsites. '''
+        traits_num = phenotype_arr.shape[1]
+        return (1-d) * np.exp(-np.mean(((phenotype_arr - env_val_arr[:, :traits_num])/w)**2, axis=1))
+    
     def hab_dead_selection(self, base_dead_rate, fitness_wid):
+        self.clear_pairwise_parents_cache()
         self.asexual_parent_pos_ls = []                           # If an individual can fit its environment condition well, it goes through asexual reproduction.
         self.species_category_for_sexual_parents_pos = {}         # If an individual can not fit its environmet condition, it goes through sexual reproduction.
-        counter = 0
-        for row in range(self.length):
-            for col in range(self.width):
-                env_val_ls = self.get_microsite_env_val_ls(row, col)
-                
-                if self.set['microsite_individuals'][row][col] != None:
-                    individual_object = self.set['microsite_individuals'][row][col]
-                    phenotype_ls = individual_object.get_indi_phenotype_ls()
-                    survival_rate = self.survival_rate(d=base_dead_rate, phenotype_ls=phenotype_ls, env_val_ls=env_val_ls, w = fitness_wid)
-                    
-                    if survival_rate < np.random.uniform(0,1,1)[0]:
-                        self.del_individual(len_id=row, wid_id=col)
-                        counter += 1
-                    else:
-                        if survival_rate >= self.reproduction_mode_threhold: 
-                            self.asexual_parent_pos_ls.append((row, col))     # the individual fits its local environment
-                        else:
-                            if individual_object.species_id in self.species_category_for_sexual_parents_pos.keys():
-                                if individual_object.gender in self.species_category_for_sexual_parents_pos[individual_object.species_id].keys():
-                                    self.species_category_for_sexual_parents_pos[individual_object.species_id][individual_object.gender].append((row, col))
-                                else:
-                                    self.species_category_for_sexual_parents_pos[individual_object.species_id][individual_object.gender] = [(row, col)]
-                            else:
-                                self.species_category_for_sexual_parents_pos[individual_object.species_id] = {individual_object.gender:[(row, col)]}         
-                else:
-                    continue
-        return counter
+        if self.indi_num == 0:
+            self.update_parents_counters()
+            return 0
+        occupied_pos_ls = sorted(self.occupied_site_pos_ls)       # row by row as the microsites are visited
+        indi_object_ls = [self.set['microsite_individuals'][row][col] for row, col in occupied_pos_ls]
+        sites = np.array([row*self.width + col for row, col in occupied_pos_ls])
+        phenotype_arr = np.array([individual_object.get_indi_phenotype_ls() for individual_object in indi_object_ls])
+        
+        survival_rate = self.survival_rate_arr(d=base_dead_rate, phenotype_arr=phenotype_arr, env_val_arr=self.env_val_arr[sites], w=fitness_wid)
+        dead_mask = survival_rate < self.rng.random(len(sites))
+        asexual_mask = (~dead_mask) & (survival_rate >= self.reproduction_mode_threhold)   # the individual fits its local environment
+        sexual_mask = (~dead_mask) & (survival_rate < self.reproduction_mode_threhold)
+        
+        for index in np.flatnonzero(dead_mask):
+            row, col = occupied_pos_ls[index]
+            self.del_individual(len_id=row, wid_id=col)
+        self.asexual_parent_pos_ls = [occupied_pos_ls[index] for index in np.flatnonzero(asexual_mask)]
+        for index in np.flatnonzero(sexual_mask):
+            individual_object = indi_object_ls[index]
+            sp_id_val = self.species_category_for_sexual_parents_pos.setdefault(individual_object.species_code, {})
+            sp_id_val.setdefault(individual_object.gender, []).append(occupied_pos_ls[index])
+        self.update_parents_counters()
+        return int(dead_mask.sum())
 
     def hab_asex_reproduce_mutate(self, asexual_birth_rate, mutation_rate, pheno_var_ls):
-        self.offspring_pool = []
         nums = int(asexual_birth_rate)
         rate = asexual_birth_rate - nums
-        for row in range(self.length):
-            for col in range(self.width):
-                if self.set['microsite_individuals'][row][col] == None:
-                    continue
-                else:
-                    individual_object = self.set['microsite_individuals'][row][col]
-                    for num in range(nums):
-                        new_indivi_object = copy.deepcopy(individual_object)
-                        for i in range(new_indivi_object.traits_num):
-                            pheno_name = new_indivi_object.pheno_names_ls[i]
-                            var = pheno_var_ls[i] #### to be improved ####
-                            genotype = new_indivi_object.genotype_set[pheno_name]
-                            phenotype = np.mean(genotype) + random.gauss(0, var)
-                            new_indivi_object.phenotype_set[pheno_name] = phenotype
-                        #print(individual_object, '\n'), print(new_indivi_object, '\n'), print('\n\n\n\n\n\n')
-                        new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-                        self.offspring_pool.append(new_indivi_object)
-                        
-                    if rate > np.random.uniform(0,1,1)[0]:
-                        new_indivi_object = copy.deepcopy(individual_object)
-                        for i in range(new_indivi_object.traits_num):
-                            pheno_name = new_indivi_object.pheno_names_ls[i]
-                            var = pheno_var_ls[i] #### to be improved ####
-                            genotype = new_indivi_object.genotype_set[pheno_name]
-                            phenotype = np.mean(genotype) + random.gauss(0, var)
-                            new_indivi_object.phenotype_set[pheno_name] = phenotype
-                        #print(individual_object, '\n'), print(new_indivi_object, '\n'), print('\n\n\n\n\n\n')
-                        new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-                        self.offspring_pool.append(new_indivi_object)
+        parent_pos_ls = sorted(self.occupied_site_pos_ls)          # row by row as the microsites are visited
+        offs_nums = nums + (rate > self.rng.random(len(parent_pos_ls)))
+        parent_ls = [self.set['microsite_individuals'][row][col] for (row, col), offs_num in zip(parent_pos_ls, offs_nums) for num in range(offs_num)]
+        self.offspring_pool = asexual_offspring_ls(parent_ls, pheno_var_ls, self.rng)
+        batch_mutation(self.offspring_pool, mutation_rate, pheno_var_ls, self.rng)
         return 0
     
+    def hab_asex_offspring_ls(self, parent_pos_ls, mutation_rate, pheno_var_ls):
+        ''' one mutated asexual offspring of each parent in parent_pos_ls [(len_id, wid_id) ...] '''
+        parent_ls = [self.set['microsite_individuals'][row][col] for row, col in parent_pos_ls]
+        hab_disp_pool = asexual_offspring_ls(parent_ls, pheno_var_ls, self.rng)
+        batch_mutation(hab_disp_pool, mutation_rate, pheno_var_ls, self.rng)
+        return hab_disp_pool
+    
+    def hab_sex_offspring_ls(self, pairwise_parents_pos_ls, mutation_rate, pheno_var_ls):
+        ''' one mutated sexual offspring of each pair in pairwise_parents_pos_ls [((len_id, wid_id), (len_id, wid_id)) ...] '''
+        microsite_individuals = self.set['microsite_individuals']
+        pairwise_parents_ls = [(microsite_individuals[female_pos[0]][female_pos[1]], microsite_individuals[male_pos[0]][male_pos[1]]) for female_pos, male_pos in pairwise_parents_pos_ls]
+        hab_disp_pool = sexual_offspring_ls(pairwise_parents_ls, pheno_var_ls, self.rng)
+        batch_mutation(hab_disp_pool, mutation_rate, pheno_var_ls, self.rng)
+        return hab_disp_pool
+    
     def hab_asex_reproduce_mutate_with_num(self, mutation_rate, pheno_var_ls, num):
         ''' asexual reproduction for dispersal controlled by the parameter, num '''
-        hab_disp_pool = []
-        parent_pos_ls = random.sample(self.occupied_site_pos_ls, num)
-        
-        for parent_pos in parent_pos_ls:
-            row = parent_pos[0]
-            col = parent_pos[1]
-            individual_object = self.set['microsite_individuals'][row][col]
-            new_indivi_object = copy.deepcopy(individual_object)
-            for i in range(new_indivi_object.traits_num):
-                pheno_name = new_indivi_object.pheno_names_ls[i]
-                var = pheno_var_ls[i] #### to be improved #### 
-                genotype = new_indivi_object.genotype_set[pheno_name]
-                phenotype = np.mean(genotype) + random.gauss(0, var)
-                new_indivi_object.phenotype_set[pheno_name] = phenotype
-            new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-            hab_disp_pool.append(new_indivi_object)
-        return hab_disp_pool
+        return self.hab_asex_offspring_ls(rng_sample(self.rng, self.occupied_site_pos_ls, num), mutation_rate, pheno_var_ls)
     
     def hab_sex_reproduce_mutate_with_num(self, mutation_rate, pheno_var_ls, num):
         ''' asexual reproduction for dispersal controlled by the parameter, num '''
-        hab_disp_pool = []
-        pairwise_parents_pos_ls = random.sample(self.hab_sexual_pairwise_parents_ls(), num)
-        
-        for female_pos, male_pos in pairwise_parents_pos_ls:
-            female_row, female_col = female_pos[0], female_pos[1]
-            male_row, male_col = male_pos[0], male_pos[1]
-            female_indi_obj = self.set['microsite_individuals'][female_row][female_col]
-            male_indi_obj = self.set['microsite_individuals'][male_row][male_col]
-            
-            new_indivi_object = copy.deepcopy(female_indi_obj)
-            new_indivi_object.gender = random.sample(('male', 'female'), 1)[0]
-            for i in range(new_indivi_object.traits_num):
-                pheno_name = new_indivi_object.pheno_names_ls[i]
-                var = pheno_var_ls[i] ##### to be improved  #####
-                
-                female_bi_genotype = female_indi_obj.genotype_set[pheno_name]
-                genotype1 = random.sample(female_bi_genotype, 1)[0]
-                
-                male_bi_genotype = male_indi_obj.genotype_set[pheno_name]
-                genotype2 = random.sample(male_bi_genotype, 1)[0]
-                
-                new_bi_genotype = [genotype1, genotype2]
-                phenotype = np.mean(new_bi_genotype) + random.gauss(0, var)
-                
-                new_indivi_object.genotype_set[pheno_name] = new_bi_genotype
-                new_indivi_object.phenotype_set[pheno_name] = phenotype
-                
-            new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-            hab_disp_pool.append(new_indivi_object)
-        return hab_disp_pool
+        return self.hab_sex_offspring_ls(rng_sample(self.rng, self.hab_sexual_pairwise_parents_ls(), num), mutation_rate, pheno_var_ls)
     
     def hab_mix_asex_reproduce_mutate_with_num(self, mutation_rate, pheno_var_ls, num):
         ''' mixed asexual reproduction for dispersal controlled by the parameter, num '''
-        hab_disp_pool = []
-        parent_pos_ls = random.sample(self.asexual_parent_pos_ls, num)
-        
-        for parent_pos in parent_pos_ls:
-            row = parent_pos[0]
-            col = parent_pos[1]
-            individual_object = self.set['microsite_individuals'][row][col]
-            new_indivi_object = copy.deepcopy(individual_object)
-            for i in range(new_indivi_object.traits_num):
-                pheno_name = new_indivi_object.pheno_names_ls[i]
-                var = pheno_var_ls[i] #### to be improved #### 
-                genotype = new_indivi_object.genotype_set[pheno_name]
-                phenotype = np.mean(genotype) + random.gauss(0, var)
-                new_indivi_object.phenotype_set[pheno_name] = phenotype
-            new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-            hab_disp_pool.append(new_indivi_object)
-        return hab_disp_pool
+        return self.hab_asex_offspring_ls(rng_sample(self.rng, self.asexual_parent_pos_ls, num), mutation_rate, pheno_var_ls)
     
     def hab_mix_sex_reproduce_mutate_with_num(self, mutation_rate, pheno_var_ls, num):
         ''' mixed sexual reproduction for dispersal controlled by the parameter, num '''
+        return self.hab_sex_offspring_ls(rng_sample(self.rng, self.hab_mixed_sexual_pairwise_parents_ls(), num), mutation_rate, pheno_var_ls)
+    
+    def hab_parents_num(self, reproduce_kind):
+        ''' the number of parents (pairs of parents for the sexual kinds) of reproduce_kind ('asexual', 'sexual', 'mixed_asexual' or 'mixed_sexual') '''
+        if reproduce_kind == 'asexual':
+            return self.indi_num
+        elif reproduce_kind == 'sexual':
+            return self.hab_sexual_pairwise_parents_num()
+        elif reproduce_kind == 'mixed_asexual':
+            return self.hab_mixed_asexual_parent_num()
+        elif reproduce_kind == 'mixed_sexual':
+            return self.hab_mixed_sexual_pairwse_parents_num()
+        else:
+            raise ValueError('reproduce_kind inputed is no found.')
+
+    def hab_reproduce_mutate_for_emigrants(self, reproduce_kind, mutation_rate, pheno_var_ls, num):
+        ''' return num offspring of reproduce_kind (see hab_parents_num()) for dispersal among patches.
+        the parents are sampled without replacement in rounds, thus num may exceed the number of parents. '''
+        parents_num = self.hab_parents_num(reproduce_kind)
+        reproduce_mutate_with_num = {'asexual':self.hab_asex_reproduce_mutate_with_num, 'sexual':self.hab_sex_reproduce_mutate_with_num,
+                                     'mixed_asexual':self.hab_mix_asex_reproduce_mutate_with_num, 'mixed_sexual':self.hab_mix_sex_reproduce_mutate_with_num}[reproduce_kind]
         hab_disp_pool = []
-        pairwise_parents_pos_ls = random.sample(self.hab_mixed_sexual_pairwise_parents_ls(), num)
-        
-        for female_pos, male_pos in pairwise_parents_pos_ls:
-            female_row, female_col = female_pos[0], female_pos[1]
-            male_row, male_col = male_pos[0], male_pos[1]
-            female_indi_obj = self.set['microsite_individuals'][female_row][female_col]
-            male_indi_obj = self.set['microsite_individuals'][male_row][male_col]
-            
-            new_indivi_object = copy.deepcopy(female_indi_obj)
-            new_indivi_object.gender = random.sample(('male', 'female'), 1)[0]
-            for i in range(new_indivi_object.traits_num):
-                pheno_name = new_indivi_object.pheno_names_ls[i]
-                var = pheno_var_ls[i] ##### to be improved  #####
-                
-                female_bi_genotype = female_indi_obj.genotype_set[pheno_name]
-                genotype1 = random.sample(female_bi_genotype, 1)[0]
-                
-                male_bi_genotype = male_indi_obj.genotype_set[pheno_name]
-                genotype2 = random.sample(male_bi_genotype, 1)[0]
-                
-                new_bi_genotype = [genotype1, genotype2]
-                phenotype = np.mean(new_bi_genotype) + random.gauss(0, var)
-                
-                new_indivi_object.genotype_set[pheno_name] = new_bi_genotype
-                new_indivi_object.phenotype_set[pheno_name] = phenotype
-                
-            new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-            hab_disp_pool.append(new_indivi_object)
+        while num > 0 and parents_num > 0:
+            hab_disp_pool += reproduce_mutate_with_num(mutation_rate, pheno_var_ls, min(num, parents_num))
+            num -= min(num, parents_num)
         return hab_disp_pool
-    
+
+    def offspring_num(self, offspring):
+        ''' the number of offsprings returned by hab_reproduce_mutate_for_emigrants() '''
+        return len(offspring)
+
+    def split_offspring(self, offspring, nums):
+        ''' split the offsprings returned by hab_reproduce_mutate_for_emigrants() into consecutive parts of nums offsprings '''
+        bounds = np.cumsum(nums)
+        return [offspring[start:stop] for start, stop in zip(bounds-np.asarray(nums), bounds)]
+
     def hab_sex_reproduce_mutate(self, sexual_birth_rate, mutation_rate, pheno_var_ls):
         nums = int(sexual_birth_rate)
         rate = sexual_birth_rate - nums
-        self.offspring_pool = []
-        for sp_id, sp_id_val in self.species_category.items():
-            try:
-                sp_id_female_ls = sp_id_val['female']
-            except:
-                continue
-            try:
-                sp_id_male_ls = sp_id_val['male']
-            except:
-                continue
-            
-            random.shuffle(sp_id_female_ls) # list of individuals location in habitat, i.e., (len_id, wid_id)
-            random.shuffle(sp_id_male_ls) # random sample of pairwise parents in sexual reproduction
-            
-            for female_pos, male_pos in list(zip(sp_id_female_ls, sp_id_male_ls)):
-                female_indi_obj = self.set['microsite_individuals'][female_pos[0]][female_pos[1]]
-                male_indi_obj = self.set['microsite_individuals'][male_pos[0]][male_pos[1]]
-                for num in range(nums):
-                    new_indivi_object = copy.deepcopy(female_indi_obj)
-                    new_indivi_object.gender = random.sample(('male', 'female'), 1)[0]
-                    for i in range(new_indivi_object.traits_num):
-                        pheno_name = new_indivi_object.pheno_names_ls[i]
-                        var = pheno_var_ls[i] ##### to be improved  #####
-
-                        female_bi_genotype = female_indi_obj.genotype_set[pheno_name]
-                        genotype1 = random.sample(female_bi_genotype, 1)[0]
-                        
-                        male_bi_genotype = male_indi_obj.genotype_set[pheno_name]
-                        genotype2 = random.sample(male_bi_genotype, 1)[0]
-                                               
-                        new_bi_genotype = [genotype1, genotype2]
-                        phenotype = np.mean(new_bi_genotype) + random.gauss(0, var)
-                        
-                        new_indivi_object.genotype_set[pheno_name] = new_bi_genotype
-                        new_indivi_object.phenotype_set[pheno_name] = phenotype
-                    #print('female_indi_obj', female_indi_obj, '\n'), print('male_indi_obj', male_indi_obj, '\n'), print('new_indivi_object', new_indivi_object, '\n\n\n\n\n\n')    
-                    new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-                    self.offspring_pool.append(new_indivi_object)
-                
-                if rate > np.random.uniform(0,1,1)[0]:
-                    new_indivi_object = copy.deepcopy(female_indi_obj)
-                    new_indivi_object.gender = random.sample(('male', 'female'), 1)[0]
-                    for i in range(new_indivi_object.traits_num):
-                        pheno_name = new_indivi_object.pheno_names_ls[i]
-                        var = pheno_var_ls[i] ##### to be improved  #####
-
-                        female_bi_genotype = female_indi_obj.genotype_set[pheno_name]
-                        genotype1 = random.sample(female_bi_genotype, 1)[0]
-                        
-                        male_bi_genotype = male_indi_obj.genotype_set[pheno_name]
-                        genotype2 = random.sample(male_bi_genotype, 1)[0]
-                                               
-                        new_bi_genotype = [genotype1, genotype2]
-                        phenotype = np.mean(new_bi_genotype) + random.gauss(0, var)
-                        
-                        new_indivi_object.genotype_set[pheno_name] = new_bi_genotype
-                        new_indivi_object.phenotype_set[pheno_name] = phenotype
-                    #print('female_indi_obj', female_indi_obj, '\n'), print('male_indi_obj', male_indi_obj, '\n'), print('new_indivi_object', new_indivi_object, '\n\n\n\n\n\n')    
-                    new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-                    self.offspring_pool.append(new_indivi_object)
-                else:
-                    continue
+        pairwise_parents_pos_ls = self.hab_sexual_pairwise_parents_ls()
+        offs_nums = nums + (rate > self.rng.random(len(pairwise_parents_pos_ls)))
+        self.offspring_pool = self.hab_sex_offspring_ls([pairwise_parents_pos for pairwise_parents_pos, offs_num in zip(pairwise_parents_pos_ls, offs_nums) for num in range(offs_num)], 
+                                                        mutation_rate, pheno_var_ls)
         return 0                 
     
-    def hab_sexual_pairwise_parents_ls(self):
+    def pairwise_parents_pos_ls(self, species_category):
+        ''' random pairing of the females and males of each species in species_category, return as [((len_id, wid_id), (len_id, wid_id)) ...] '''
         pair_parents_ls = []
-        for sp_id, sp_id_val in self.species_category.items():
+        for sp_id, sp_id_val in species_category.items():
             try:
                 sp_id_female_ls = sp_id_val['female']
             except:
@@ -418,48 +625,48 @@ class habitat():
                 sp_id_male_ls = sp_id_val['male']
             except:
                 continue
-            
-            random.shuffle(sp_id_female_ls) #list of individuals location in habitat, i.e., (len_id, wid_id)
-            random.shuffle(sp_id_male_ls)   #random sample of pairwise parents in sexual reproduction
-            
+
+            sp_id_female_ls = rng_sample(self.rng, sp_id_female_ls, len(sp_id_female_ls)) #list of individuals location in habitat, i.e., (len_id, wid_id)
+            sp_id_male_ls = rng_sample(self.rng, sp_id_male_ls, len(sp_id_male_ls))   #random sample of pairwise parents in sexual reproduction
+
             pair_parents_ls += list(zip(sp_id_female_ls, sp_id_male_ls))
         return pair_parents_ls
-    
+
+    def pairwise_parents_num(self, species_category):
+        ''' the number of pairs pairwise_parents_pos_ls() makes of species_category, counted without pairing '''
+        num = 0
+        for sp_id, sp_id_val in species_category.items():
+            num += min(len(sp_id_val.get('female', ())), len(sp_id_val.get('male', ())))
+        return num
+
+    def hab_sexual_pairwise_parents_ls(self):
+        ''' the pairing is made once and reused until an individual is added or removed, the list should not be modified by the caller '''
+        if self.sexual_pairwise_parents_cache is None:
+            self.sexual_pairwise_parents_cache = self.pairwise_parents_pos_ls(self.species_category)
+        return self.sexual_pairwise_parents_cache
+
     def hab_sexual_pairwise_parents_num(self):
-        return len(self.hab_sexual_pairwise_parents_ls())
-    
+        return self.counters['mating_pairs']
+
     def hab_mixed_sexual_pairwise_parents_ls(self):
-        pair_parents_ls = []
-        for sp_id, sp_id_val in self.species_category_for_sexual_parents_pos.items():
-            try:
-                sp_id_female_ls = sp_id_val['female']
-            except:
-                continue
-            try:
-                sp_id_male_ls = sp_id_val['male']
-            except:
-                continue
-            
-            random.shuffle(sp_id_female_ls) #list of individuals location in habitat, i.e., (len_id, wid_id)
-            random.shuffle(sp_id_male_ls)   #random sample of pairwise parents in sexual reproduction
-            
-            pair_parents_ls += list(zip(sp_id_female_ls, sp_id_male_ls))
-        return pair_parents_ls
-    
+        ''' the pairing is made once and reused until the next dead selection, the list should not be modified by the caller '''
+        if self.mixed_sexual_pairwise_parents_cache is None:
+            self.mixed_sexual_pairwise_parents_cache = self.pairwise_parents_pos_ls(self.species_category_for_sexual_parents_pos)
+        return self.mixed_sexual_pairwise_parents_cache
+
     def hab_mixed_sexual_pairwse_parents_num(self):
-        return len(self.hab_mixed_sexual_pairwise_parents_ls())
-    
+        return self.counters['mixed_mating_pairs']
+
     def hab_mixed_asexual_parent_num(self):
-        return len(self.asexual_parent_pos_ls)
+        return self.counters['asexual_parents']
 
     def hab_germinate_from_offsprings_pool(self):
         ''' the offsprings in the habitat offsprings pool germinates in the empty microsite in the habitat'''
         counter = 0
-        empty_sites_pos_ls = self.empty_site_pos_ls
-        random.shuffle(empty_sites_pos_ls)
+        empty_sites_pos_ls = rng_sample(self.rng, self.empty_site_pos_ls, len(self.empty_site_pos_ls))
         
         hab_offsprings_pool = self.offspring_pool
-        random.shuffle(hab_offsprings_pool)
+        self.rng.shuffle(hab_offsprings_pool)
         
         for pos, indi_object in list(zip(empty_sites_pos_ls, hab_offsprings_pool)):
             len_id = pos[0]
@@ -477,8 +684,8 @@ class habitat():
             num = int(self.indi_num * asexual_birth_rate)  
         hab_offsprings_for_germinate = self.hab_asex_reproduce_mutate_with_num(mutation_rate, pheno_var_ls, num)
         
-        random.shuffle(empty_sites_pos_ls)
-        random.shuffle(hab_offsprings_for_germinate)
+        empty_sites_pos_ls = rng_sample(self.rng, empty_sites_pos_ls, len(empty_sites_pos_ls))
+        self.rng.shuffle(hab_offsprings_for_germinate)
         
         for pos, indi_object in list(zip(empty_sites_pos_ls, hab_offsprings_for_germinate)):
             len_id = pos[0]
@@ -490,14 +697,15 @@ class habitat():
     def hab_sexual_reprodece_germinate(self, sexual_birth_rate, mutation_rate, pheno_var_ls):
         counter = 0
         empty_sites_pos_ls = self.empty_site_pos_ls
-        if len(empty_sites_pos_ls) < int(self.hab_sexual_pairwise_parents_num() * sexual_birth_rate): 
+        sexual_pairwise_parents_num = self.hab_sexual_pairwise_parents_num()
+        if len(empty_sites_pos_ls) < int(sexual_pairwise_parents_num * sexual_birth_rate):
             num = len(empty_sites_pos_ls)
-        elif len(empty_sites_pos_ls) >= int(self.hab_sexual_pairwise_parents_num() * sexual_birth_rate): 
-            num = int(self.hab_sexual_pairwise_parents_num() * sexual_birth_rate)  
+        elif len(empty_sites_pos_ls) >= int(sexual_pairwise_parents_num * sexual_birth_rate):
+            num = int(sexual_pairwise_parents_num * sexual_birth_rate)
         hab_offsprings_for_germinate = self.hab_sex_reproduce_mutate_with_num(mutation_rate, pheno_var_ls, num)
     
-        random.shuffle(empty_sites_pos_ls)
-        random.shuffle(hab_offsprings_for_germinate)
+        empty_sites_pos_ls = rng_sample(self.rng, empty_sites_pos_ls, len(empty_sites_pos_ls))
+        self.rng.shuffle(hab_offsprings_for_germinate)
         
         for pos, indi_object in list(zip(empty_sites_pos_ls, hab_offsprings_for_germinate)):
             len_id = pos[0]
@@ -536,14 +744,453 @@ class habitat():
         if len(self.offspring_pool) + len(self.dormancy_pool) <= self.dormancy_pool_max_size:
             self.dormancy_pool = self.dormancy_pool + self.offspring_pool
         else: 
-            hab_dormancy_pool = random.sample(self.dormancy_pool,(self.dormancy_pool_max_size-len(self.offspring_pool)))
+            hab_dormancy_pool = rng_sample(self.rng, self.dormancy_pool, (self.dormancy_pool_max_size-len(self.offspring_pool)))
             self.dormancy_pool = hab_dormancy_pool + self.offspring_pool
             
         self.offspring_pool = []
         return 0
         
+class array_habitat(habitat):
+    '''
+    habitat storing the individuals as contiguous numpy arrays (structure of arrays) instead of individual objects.
+    the microsite (len_id, wid_id) is the site index len_id*width+wid_id in the arrays.
+    species_code_arr (int) is the species code (see species_registry) of the individual in each site and -1 means the site is empty.
+    gender_arr (uint8) is 0 for female and 1 for male.
+    phenotype_arr (float) is the [sites x traits] phenotype matrix and np.nan for empty sites.
+    genotype_arr (uint64) is the [sites x traits x 2 x words] bit-packed bi-genotypes, see pack_genotype().
+    the site lists (empty and occupied sites, species_category and the parents sorted out in the dead selection) are indexed_site_array and site_pos_array,
+    and the pairwise parents are [pairs x 2] arrays of (female site, male site), thus the bookkeeping of many sites is made by array operations.
+    offsprings are handled as dicts of arrays with the same keys as the habitat arrays,
+    and only turned into individual objects for the processes of the offsprings pool.
+    '''
+    gender_ls = ('female', 'male')
+
+    def __init__(self, hab_name, num_env_types, env_types_name, mean_env_ls, var_env_ls, length, width, rng=None):
+        habitat.__init__(self, hab_name, num_env_types, env_types_name, mean_env_ls, var_env_ls, length, width, rng)
+        del self.set['microsite_individuals']     # the individuals are kept in the arrays, see get_individual()
+        self.occupied_site_pos_ls = indexed_site_array(self.size, self.width)
+        self.empty_site_pos_ls = indexed_site_array(self.size, self.width, np.arange(self.size))
+        self.category_index_arr = np.full(self.size, -1, dtype=int)   # the index of each occupied site in its set of species_category, see indexed_site_array
+        self.asexual_parent_pos_ls = site_pos_array((), self.width)
+        self.species_code_arr = np.full(self.size, -1, dtype=int)
+        self.gender_arr = np.zeros(self.size, dtype=np.uint8)
+        self.phenotype_arr = None                 # allocated when the traits are known, see init_storage()
+        self.genotype_arr = None
+        self.pheno_names_ls = None
+        self.geno_len_arr = None
+        self.loci_mask = None                     # [traits x loci], False for the padding loci of the shorter genotypes
+
+    def init_storage(self, pheno_names_ls, geno_len_ls):
+        ''' allocate the phenotype and genotype arrays once the traits and the genotype length are known '''
+        if self.phenotype_arr is not None:
+            return 0
+        traits_num = len(pheno_names_ls)
+        self.pheno_names_ls = tuple(pheno_names_ls)
+        self.geno_len_arr = np.array(geno_len_ls, dtype=int)
+        self.loci_mask = np.arange(self.geno_len_arr.max()) < self.geno_len_arr[:, None]
+        self.phenotype_arr = np.full((self.size, traits_num), np.nan)
+        self.genotype_arr = np.zeros((self.size, traits_num, 2, genotype_words_num(self.geno_len_arr.max())), dtype=np.uint64)
+        return 0
+
+    def share_storage(self, pheno_names_ls, geno_len_ls):
+        ''' move the arrays of the habitat into shared memory (see shared_memory_array()), the arrays are changed in place afterwards,
+        thus the processes forked from this one and this process see the same individuals '''
+        self.init_storage(pheno_names_ls, geno_len_ls)
+        self.species_code_arr = shared_memory_array(self.species_code_arr)
+        self.gender_arr = shared_memory_array(self.gender_arr)
+        self.phenotype_arr = shared_memory_array(self.phenotype_arr)
+        self.genotype_arr = shared_memory_array(self.genotype_arr)
+        return 0
+
+    def get_hab_microsites_species_codes(self, out=None):
+        if out is None:
+            return self.species_code_arr.copy()
+        out[:] = self.species_code_arr
+        return out
+
+    def get_hab_microsites_sp_id_values(self, out=None):
+        ''' the species_id values are looked up from the species codes of the sites '''
+        if out is None:
+            out = np.empty(self.size)
+        out[:] = species_registry_object.get_value_arr()[self.species_code_arr]
+        return out
+
+    def get_hab_microsites_phenotype_values(self, trait_name, out=None):
+        ''' return a view of the phenotype array if out is None, np.nan for the empty sites '''
+        if self.phenotype_arr is None:
+            if out is None:
+                out = np.empty(self.size)
+            out[:] = np.nan
+            return out
+        values = self.phenotype_arr[:, self.pheno_names_ls.index(trait_name)]
+        if out is None:
+            return values
+        out[:] = values
+        return out
+
+    def site_pos(self, site):
+        ''' site index -> (len_id, wid_id) '''
+        return divmod(int(site), self.width)
+
+    def pos_ls_to_sites(self, pos_ls):
+        ''' [(len_id, wid_id), ...] -> array of site index '''
+        pos_arr = np.array(pos_ls, dtype=int).reshape(-1, 2)
+        return pos_arr[:, 0]*self.width + pos_arr[:, 1]
+
+    def occupy_site(self, species_code, gender, len_id, wid_id):
+        return self.occupy_sites(np.array([len_id*self.width + wid_id]), np.array([species_code]), np.array([self.gender_ls.index(gender)]))
+
+    def vacate_site(self, species_code, gender, len_id, wid_id):
+        return self.vacate_sites(np.array([len_id*self.width + wid_id]), np.array([species_code]), np.array([self.gender_ls.index(gender)]))
+
+    def occupy_sites(self, sites, species_codes, gender_codes):
+        ''' habitat.occupy_site() of all the sites at once, the counters are updated once per key '''
+        self.empty_site_pos_ls.remove_sites(sites)
+        self.occupied_site_pos_ls.add_sites(sites)
+        self.indi_num += len(sites)
+        self.sexual_pairwise_parents_cache = None
+        self.update_counters('individuals', len(sites))
+        self.update_counters('empty_sites', -len(sites))
+        self.update_species_category(sites, species_codes, gender_codes, add=True)
+        return len(sites)
+
+    def vacate_sites(self, sites, species_codes, gender_codes):
+        ''' habitat.vacate_site() of all the sites at once, the counters are updated once per key '''
+        self.empty_site_pos_ls.add_sites(sites)
+        self.occupied_site_pos_ls.remove_sites(sites)
+        self.indi_num -= len(sites)
+        self.clear_pairwise_parents_cache()
+        self.update_counters('individuals', -len(sites))
+        self.update_counters('empty_sites', len(sites))
+        self.update_species_category(sites, species_codes, gender_codes, add=False)
+        return len(sites)
+
+    def update_species_category(self, sites, species_codes, gender_codes, add):
+        ''' add (or remove) the sites to (or from) species_category, the mating_pairs counter is changed by the number of pairs of each species.
+        the sets of species_category share category_index_arr and grow with their sites, the empty ones are dropped. '''
+        mating_pairs_delta = 0
+        for species_code in np.unique(species_codes):
+            sp_id_val = self.species_category.setdefault(int(species_code), {})
+            pairs_num = min(len(sp_id_val.get('female', ())), len(sp_id_val.get('male', ())))
+            species_mask = species_codes == species_code
+            for gender_code, gender in enumerate(self.gender_ls):
+                gender_sites = sites[species_mask & (gender_codes == gender_code)]
+                if len(gender_sites) == 0:
+                    continue
+                if add:
+                    if gender not in sp_id_val:
+                        sp_id_val[gender] = indexed_site_array(self.size, self.width, index_arr=self.category_index_arr)
+                    sp_id_val[gender].add_sites(gender_sites)
+                else:
+                    sp_id_val[gender].remove_sites(gender_sites)
+                    if len(sp_id_val[gender]) == 0:
+                        del sp_id_val[gender]
+            mating_pairs_delta += min(len(sp_id_val.get('female', ())), len(sp_id_val.get('male', ()))) - pairs_num
+            if len(sp_id_val) == 0:
+                del self.species_category[int(species_code)]
+        if mating_pairs_delta != 0:
+            self.update_counters('mating_pairs', mating_pairs_delta)
+        return 0
+
+    def add_individual(self, indi_object, len_id, wid_id):
+        site = len_id*self.width + wid_id
+        if self.species_code_arr[site] != -1:
+            print('the microsite in the habitat is occupied.')
+        else:
+            self.init_storage(indi_object.pheno_names_ls, indi_object.geno_len_ls)
+            self.species_code_arr[site] = indi_object.species_code
+            self.gender_arr[site] = self.gender_ls.index(indi_object.gender)
+            for i, pheno_name in enumerate(self.pheno_names_ls):
+                self.phenotype_arr[site, i] = indi_object.phenotype_set[pheno_name]
+                bi_genotype = indi_object.genotype_set[pheno_name]
+                self.genotype_arr[site, i, :, :bi_genotype.shape[-1]] = bi_genotype
+            self.occupy_site(indi_object.species_code, indi_object.gender, len_id, wid_id)
+
+    def del_individual(self, len_id, wid_id):
+        site = len_id*self.width + wid_id
+        if self.species_code_arr[site] == -1:
+            print('the microsite in the habitat is empty.')
+        else:
+            self.remove_sites(np.array([site]))
+
+    def get_individual(self, len_id, wid_id):
+        ''' return a new individual object built from the arrays or None if the microsite is empty,
+        the changes of the object are not written back, use del_individual() and add_individual() instead. '''
+        site = len_id*self.width + wid_id
+        if self.species_code_arr[site] == -1:
+            return None
+        else:
+            return self.offspring_arrays_to_individuals(self.get_sites_arrays(np.array([site])))[0]
+
+    def get_sites_arrays(self, sites):
+        ''' return the individuals in the sites as a dict of arrays (copies) '''
+        return {'species_code':self.species_code_arr[sites], 'gender':self.gender_arr[sites],
+                'phenotype':self.phenotype_arr[sites], 'genotype':self.genotype_arr[sites]}
+
+    def place_offspring_arrays(self, sites, offs):
+        ''' put the offsprings (dict of arrays) into the empty sites, the n-th offspring into sites[n], the arrays must be allocated (see init_storage()) '''
+        if self.phenotype_arr is None:
+            raise ValueError('the arrays of the habitat %s are not allocated.'%self.name)
+        self.species_code_arr[sites] = offs['species_code']
+        self.gender_arr[sites] = offs['gender']
+        self.phenotype_arr[sites] = offs['phenotype']
+        self.genotype_arr[sites] = offs['genotype']
+        return self.occupy_sites(sites, offs['species_code'], offs['gender'])
+
+    def remove_sites(self, sites):
+        ''' remove the individuals in the occupied sites in bulk '''
+        self.vacate_sites(sites, self.species_code_arr[sites], self.gender_arr[sites])
+        self.species_code_arr[sites] = -1
+        self.gender_arr[sites] = 0
+        self.phenotype_arr[sites] = np.nan
+        self.genotype_arr[sites] = 0
+        return len(sites)
+
+    def offspring_arrays_to_individuals(self, offs):
+        ''' turn the offsprings (dict of arrays) into a list of individual objects, e.g., for the offsprings pool '''
+        indi_object_ls = []
+        for n in range(len(offs['species_code'])):
+            genotype_set = {}
+            phenotype_set = {}
+            for i, pheno_name in enumerate(self.pheno_names_ls):
+                genotype_set[pheno_name] = offs['genotype'][n, i, :, :genotype_words_num(self.geno_len_arr[i])].copy()
+                phenotype_set[pheno_name] = float(offs['phenotype'][n, i])
+            indi_object = individual(species_id=species_registry_object.get_species_id(offs['species_code'][n]), traits_num=len(self.pheno_names_ls), pheno_names_ls=self.pheno_names_ls,
+                                     gender=self.gender_ls[offs['gender'][n]], genotype_set=genotype_set, phenotype_set=phenotype_set, geno_len_ls=tuple(self.geno_len_arr))
+            indi_object_ls.append(indi_object)
+        return indi_object_ls
+
+    def concat_offspring_arrays(self, offs_1, offs_2):
+        return {key:np.concatenate((offs_1[key], offs_2[key])) for key in offs_1.keys()}
+
+    def take_offspring_arrays(self, offs, index):
+        ''' the offsprings of index (an index array or a slice) as a dict of arrays '''
+        return {key:value[index] for key, value in offs.items()}
+
+    def offspring_num(self, offspring):
+        return len(offspring['species_code'])
+
+    def split_offspring(self, offspring, nums):
+        bounds = np.cumsum(nums)
+        return [self.take_offspring_arrays(offspring, slice(start, stop)) for start, stop in zip(bounds-np.asarray(nums), bounds)]
+
+    def genotype_mean_arr(self, genotype):
+        ''' the mean of the bi-genotypes of each trait, i.e., np.mean(bi_genotype) for every offspring and trait, counted by popcount '''
+        return popcount(genotype).sum(axis=(2, 3))/(2*self.geno_len_arr)
+
+    def mutate_offspring_arrays(self, offs, mutation_rate, pheno_var_ls):
+        ''' every locus of every allele flips with the probability of mutation_rate,
+        the phenotype of the mutated trait is drawn again from the new genotype '''
+        batch_mutation_arrays(offs['genotype'], offs['phenotype'], self.geno_len_arr, mutation_rate, pheno_var_ls, self.rng)
+        return 0
+
+    def asex_offspring_arrays(self, parent_sites, mutation_rate, pheno_var_ls):
+        ''' array-native asexual reproduction of the individuals in parent_sites, one offspring per site '''
+        offs = self.get_sites_arrays(parent_sites)
+        offs['phenotype'] = self.genotype_mean_arr(offs['genotype']) + self.rng.normal(0, pheno_var_ls, size=offs['phenotype'].shape)
+        self.mutate_offspring_arrays(offs, mutation_rate, pheno_var_ls)
+        return offs
+
+    def sex_offspring_arrays(self, female_sites, male_sites, mutation_rate, pheno_var_ls):
+        ''' array-native sexual reproduction, one offspring per (female_site, male_site) pair.
+        the offspring takes one of the two alleles of each parent for every trait. '''
+        num = len(female_sites)
+        traits_num = len(self.pheno_names_ls)
+        trait_index = np.arange(traits_num)[None, :]
+        female_allele = self.rng.integers(0, 2, size=(num, traits_num))
+        male_allele = self.rng.integers(0, 2, size=(num, traits_num))
+
+        genotype = np.empty((num, traits_num, 2, self.genotype_arr.shape[-1]), dtype=np.uint64)
+        genotype[:, :, 0] = self.genotype_arr[female_sites[:, None], trait_index, female_allele]
+        genotype[:, :, 1] = self.genotype_arr[male_sites[:, None], trait_index, male_allele]
+
+        offs = {'species_code':self.species_code_arr[female_sites], 'gender':self.rng.integers(0, 2, size=num).astype(np.uint8), 'genotype':genotype}
+        offs['phenotype'] = self.genotype_mean_arr(genotype) + self.rng.normal(0, pheno_var_ls, size=(num, traits_num))
+        self.mutate_offspring_arrays(offs, mutation_rate, pheno_var_ls)
+        return offs
+
+    def pairwise_parents_pos_ls(self, species_category):
+        ''' habitat.pairwise_parents_pos_ls() with the same draws, the pairs are returned as a [pairs x 2] array of (female site, male site) '''
+        pairs_ls = [np.empty((0, 2), dtype=int)]
+        for sp_id, sp_id_val in species_category.items():
+            if 'female' not in sp_id_val or 'male' not in sp_id_val:
+                continue
+            female_sites = rng_sample(self.rng, sp_id_val['female'].get_sites(), len(sp_id_val['female']))
+            male_sites = rng_sample(self.rng, sp_id_val['male'].get_sites(), len(sp_id_val['male']))
+            pairs_num = min(len(female_sites), len(male_sites))
+            pairs_ls.append(np.stack((female_sites[:pairs_num], male_sites[:pairs_num]), axis=1))
+        return np.concatenate(pairs_ls)
+
+    def hab_empty_sites(self):
+        return self.empty_site_pos_ls.get_sites()
+
+    def germinate_offspring_arrays(self, offs):
+        ''' the offsprings (dict of arrays) germinate in the randomly chosen empty microsites '''
+        num = min(len(offs['species_code']), len(self.empty_site_pos_ls))
+        empty_sites = rng_sample(self.rng, self.empty_site_pos_ls.get_sites(), num)
+        return self.place_offspring_arrays(empty_sites, self.take_offspring_arrays(offs, slice(0, num)))
+
+    def hab_initialize(self, traits_num, pheno_names_ls, pheno_var_ls, geno_len_ls, reproduce_mode, species_2_phenotype_ls):
+        mean_pheno_val_ls = self.mean_env_ls
+        species_id = species_registry_object.get_species_id(species_registry_object.get_code_by_optimum_phenotype(mean_pheno_val_ls, species_2_phenotype_ls))
+        self.init_storage(pheno_names_ls, geno_len_ls)
+        sites = self.empty_site_pos_ls.get_sites().copy()
+        num = len(sites)
+
+        if reproduce_mode == 'asexual': gender = np.zeros(num, dtype=np.uint8)
+        if reproduce_mode == 'sexual': gender = self.rng.integers(0, 2, size=num).astype(np.uint8)
+
+        # as individual.random_init_indi(), int(mean*geno_len) random loci of each allele are 1
+        ones_num = (np.array(mean_pheno_val_ls[:traits_num]) * self.geno_len_arr).astype(int)
+        random_keys = np.where(self.loci_mask[None, :, None, :], self.rng.random((num, traits_num, 2, self.loci_mask.shape[1])), 2)
+        loci_rank = random_keys.argsort(axis=-1).argsort(axis=-1)
+        genotype = pack_genotype(loci_rank < ones_num[None, :, None, None])
+        phenotype = np.array(mean_pheno_val_ls[:traits_num]) + self.rng.normal(0, pheno_var_ls, size=(num, traits_num))
+
+        offs = {'species_code':np.full(num, species_registry_object.get_code(species_id)), 'gender':gender, 'phenotype':phenotype, 'genotype':genotype}
+        self.place_offspring_arrays(sites, offs)
+        return 0
+
+    def hab_dead_selection(self, base_dead_rate, fitness_wid):
+        if self.phenotype_arr is None:
+            return 0
+        self.clear_pairwise_parents_cache()
+        self.asexual_parent_pos_ls = site_pos_array((), self.width)   # If an individual can fit its environment condition well, it goes through asexual reproduction.
+        self.species_category_for_sexual_parents_pos = {}             # If an individual can not fit its environmet condition, it goes through sexual reproduction.
+        occupied_sites = np.flatnonzero(self.species_code_arr != -1)
+        if len(occupied_sites) == 0:
+            self.update_parents_counters()
+            return 0
+        survival_rate = self.survival_rate_arr(d=base_dead_rate, phenotype_arr=self.phenotype_arr[occupied_sites], env_val_arr=self.env_val_arr[occupied_sites], w=fitness_wid)
+        dead_mask = survival_rate < self.rng.random(len(occupied_sites))
+        self.remove_sites(occupied_sites[dead_mask])
+
+        asexual_mask = (~dead_mask) & (survival_rate >= self.reproduction_mode_threhold)
+        sexual_mask = (~dead_mask) & (survival_rate < self.reproduction_mode_threhold)
+        self.asexual_parent_pos_ls = site_pos_array(occupied_sites[asexual_mask], self.width)
+
+        sexual_sites = occupied_sites[sexual_mask]
+        for species_code in np.unique(self.species_code_arr[sexual_sites]):
+            self.species_category_for_sexual_parents_pos[int(species_code)] = {}
+            for gender_code, gender in enumerate(self.gender_ls):
+                sites = sexual_sites[(self.species_code_arr[sexual_sites] == species_code) & (self.gender_arr[sexual_sites] == gender_code)]
+                if len(sites) > 0:
+                    self.species_category_for_sexual_parents_pos[int(species_code)][gender] = site_pos_array(sites, self.width)
+        self.update_parents_counters()
+        return int(dead_mask.sum())
+
+    def hab_asex_reproduce_mutate(self, asexual_birth_rate, mutation_rate, pheno_var_ls):
+        self.offspring_pool = []
+        if self.phenotype_arr is None:
+            return 0
+        nums = int(asexual_birth_rate)
+        rate = asexual_birth_rate - nums
+        occupied_sites = np.flatnonzero(self.species_code_arr != -1)
+        offs_nums = nums + (rate > self.rng.random(len(occupied_sites)))
+        offs = self.asex_offspring_arrays(np.repeat(occupied_sites, offs_nums), mutation_rate, pheno_var_ls)
+        self.offspring_pool = self.offspring_arrays_to_individuals(offs)
+        return 0
+
+    def hab_sex_reproduce_mutate(self, sexual_birth_rate, mutation_rate, pheno_var_ls):
+        self.offspring_pool = []
+        if self.phenotype_arr is None:
+            return 0
+        nums = int(sexual_birth_rate)
+        rate = sexual_birth_rate - nums
+        pairs = self.hab_sexual_pairwise_parents_ls()
+        offs_nums = nums + (rate > self.rng.random(len(pairs)))
+        offs = self.sex_offspring_arrays(np.repeat(pairs[:, 0], offs_nums), np.repeat(pairs[:, 1], offs_nums), mutation_rate, pheno_var_ls)
+        self.offspring_pool = self.offspring_arrays_to_individuals(offs)
+        return 0
+
+    def hab_parent_sites(self, reproduce_kind):
+        ''' the parents of reproduce_kind (see habitat.hab_parents_num()) as the rows of a [parents x 1] array of their sites
+        or of a [pairs x 2] array of (female site, male site) for the sexual kinds '''
+        if reproduce_kind == 'asexual':
+            return self.occupied_site_pos_ls.get_sites()[:, None]
+        elif reproduce_kind == 'mixed_asexual':
+            return self.asexual_parent_pos_ls.get_sites()[:, None]
+        elif reproduce_kind == 'sexual':
+            return self.hab_sexual_pairwise_parents_ls()
+        elif reproduce_kind == 'mixed_sexual':
+            return self.hab_mixed_sexual_pairwise_parents_ls()
+        else:
+            raise ValueError('reproduce_kind inputed is no found.')
+
+    def hab_offspring_arrays(self, parent_sites, mutation_rate, pheno_var_ls):
+        ''' one offspring of every row of parent_sites (see hab_parent_sites()), asexual for the rows of one site and sexual for the rows of two '''
+        if parent_sites.shape[1] == 1:
+            return self.asex_offspring_arrays(parent_sites[:, 0], mutation_rate, pheno_var_ls)
+        return self.sex_offspring_arrays(parent_sites[:, 0], parent_sites[:, 1], mutation_rate, pheno_var_ls)
+
+    def hab_offspring_arrays_with_num(self, reproduce_kind, mutation_rate, pheno_var_ls, num):
+        ''' array-native reproduction of num offsprings of reproduce_kind, the parents are sampled without replacement '''
+        return self.hab_offspring_arrays(rng_sample(self.rng, self.hab_parent_sites(reproduce_kind), num), mutation_rate, pheno_var_ls)
+
+    def hab_asex_reproduce_mutate_with_num(self, mutation_rate, pheno_var_ls, num):
+        if self.phenotype_arr is None:
+            return []
+        return self.offspring_arrays_to_individuals(self.hab_offspring_arrays_with_num('asexual', mutation_rate, pheno_var_ls, num))
+
+    def hab_sex_reproduce_mutate_with_num(self, mutation_rate, pheno_var_ls, num):
+        if self.phenotype_arr is None:
+            return []
+        return self.offspring_arrays_to_individuals(self.hab_offspring_arrays_with_num('sexual', mutation_rate, pheno_var_ls, num))
+
+    def hab_mix_asex_reproduce_mutate_with_num(self, mutation_rate, pheno_var_ls, num):
+        if self.phenotype_arr is None:
+            return []
+        return self.offspring_arrays_to_individuals(self.hab_offspring_arrays_with_num('mixed_asexual', mutation_rate, pheno_var_ls, num))
+
+    def hab_mix_sex_reproduce_mutate_with_num(self, mutation_rate, pheno_var_ls, num):
+        if self.phenotype_arr is None:
+            return []
+        return self.offspring_arrays_to_individuals(self.hab_offspring_arrays_with_num('mixed_sexual', mutation_rate, pheno_var_ls, num))
+
+    def hab_reproduce_mutate_for_emigrants(self, reproduce_kind, mutation_rate, pheno_var_ls, num):
+        ''' habitat.hab_reproduce_mutate_for_emigrants() with the offsprings returned as a dict of arrays '''
+        parents_num = self.hab_parents_num(reproduce_kind)
+        offs = self.hab_offspring_arrays_with_num(reproduce_kind, mutation_rate, pheno_var_ls, min(num, parents_num))
+        num -= min(num, parents_num)
+        while num > 0 and parents_num > 0:
+            offs = self.concat_offspring_arrays(offs, self.hab_offspring_arrays_with_num(reproduce_kind, mutation_rate, pheno_var_ls, min(num, parents_num)))
+            num -= min(num, parents_num)
+        return offs
+
+    def hab_asexual_reprodece_germinate(self, asexual_birth_rate, mutation_rate, pheno_var_ls):
+        if self.phenotype_arr is None:
+            return 0
+        num = min(len(self.empty_site_pos_ls), int(self.indi_num * asexual_birth_rate))
+        return self.germinate_offspring_arrays(self.hab_offspring_arrays_with_num('asexual', mutation_rate, pheno_var_ls, num))
+
+    def hab_sexual_reprodece_germinate(self, sexual_birth_rate, mutation_rate, pheno_var_ls):
+        if self.phenotype_arr is None:
+            return 0
+        num = min(len(self.empty_site_pos_ls), int(len(self.hab_sexual_pairwise_parents_ls()) * sexual_birth_rate))
+        return self.germinate_offspring_arrays(self.hab_offspring_arrays_with_num('sexual', mutation_rate, pheno_var_ls, num))
+
+    def hab_mixed_reproduce_germinate(self, asexual_birth_rate, sexual_birth_rate, mutation_rate, pheno_var_ls):
+        if self.phenotype_arr is None:
+            return 0
+        empty_sites_num = len(self.empty_site_pos_ls)
+        pairs = self.hab_mixed_sexual_pairwise_parents_ls()
+
+        asex_offs_expectation_num = int(np.around(len(self.asexual_parent_pos_ls) * asexual_birth_rate))
+        sex_offs_expectation_num = int(np.around(len(pairs) * sexual_birth_rate))
+
+        if empty_sites_num < asex_offs_expectation_num + sex_offs_expectation_num:
+            asex_num = int(np.around(empty_sites_num * asex_offs_expectation_num/(asex_offs_expectation_num + sex_offs_expectation_num)))
+            sex_num = int(np.around(empty_sites_num * sex_offs_expectation_num/(asex_offs_expectation_num + sex_offs_expectation_num)))
+        else:
+            asex_num = asex_offs_expectation_num
+            sex_num = sex_offs_expectation_num
+
+        offs = self.concat_offspring_arrays(self.hab_offspring_arrays_with_num('mixed_asexual', mutation_rate, pheno_var_ls, asex_num),
+                                            self.hab_offspring_arrays_with_num('mixed_sexual', mutation_rate, pheno_var_ls, sex_num))
+        return self.germinate_offspring_arrays(offs)
+
 class patch():
-    def __init__(self, patch_name, patch_index, location, asexual_birth_rate, sexual_birth_rate):
+    def __init__(self, patch_name, patch_index, location, asexual_birth_rate, sexual_birth_rate, rng=None):
         self.name = patch_name
         self.index = patch_index
         self.set = {}            # self.data_set={} # to be improved
@@ -551,6 +1198,10 @@ class patch():
         self.location = location
         self.asexual_birth_rate = asexual_birth_rate  # to be improved
         self.sexual_birth_rate = sexual_birth_rate    # to be improved
+        self.owner = None             # the metacommunity object which the patch belongs to
+        self.counters = {'individuals':0, 'empty_sites':0, 'asexual_parents':0, 'mating_pairs':0, 'mixed_mating_pairs':0} # sums of the counters of the habitats
+        self.rng = np.random.default_rng() if rng is None else rng     # the np.random.Generator of the patch and its habitats
+        self.habitat_storage = None   # 'object' or 'array', the same for all the habitats of the patch
         
     def get_data(self):
         output = {}
@@ -558,63 +1209,54 @@ class patch():
             output[key]=value.set
         return output
 
-    def get_patch_microsites_individals_sp_id_values(self):
-        ''' get species_id, phenotypes distribution in the patch as values set '''
-        values_set = np.array([], dtype=int)
-        for h_id, h_object in self.set.items():
-            hab_len = h_object.length
-            hab_wid = h_object.width
-            for row in range(hab_len):
-                for col in range(hab_wid):
-                    individual_object = h_object.set['microsite_individuals'][row][col]
-                    if individual_object ==None:
-                        values_set = np.append(values_set, np.nan)
-                    else:
-                        species_id = individual_object.species_id
-                        species_id_value = int(re.findall(r"\d+",species_id)[0])
-                        values_set = np.append(values_set, species_id_value)
-        values_set = values_set.reshape(self.hab_num, h_object.size)
-        return values_set
-    
-    def get_patch_microsites_individals_phenotype_values(self, trait_name):
-        ''' get species_id, phenotypes distribution in the patch as values set '''
-        values_set = []
+    def set_rng(self, rng):
+        ''' the patch and its habitats draw from the np.random.Generator rng '''
+        self.rng = rng
         for h_id, h_object in self.set.items():
-            hab_len = h_object.length
-            hab_wid = h_object.width
-            for row in range(hab_len):
-                for col in range(hab_wid):
-                    individual_object = h_object.set['microsite_individuals'][row][col]
-                    if individual_object ==None:
-                        values_set.append(np.nan)
-                    else:
-                        phenotype = individual_object.phenotype_set[trait_name]
-                        values_set.append(phenotype)
-        values_set = np.array(values_set).reshape(self.hab_num, h_object.size)
-        return values_set
-    
-    def get_patch_microsites_environment_values(self, environment_name):
-        ''' get microsite environment values distribution in the patch as values set '''
-        values_array = np.array([])
-        for h_id, h_object in self.set.items():
-            hab_environment_values_array = h_object.set[environment_name] 
-            values_array = np.append(values_array, hab_environment_values_array) # dimension of the return of np.append() is always in dim=1
-        values_array = values_array.reshape(self.hab_num, h_object.size)
-        return values_array
-    
-    def get_patch_microsites_optimum_sp_id_value_array(self, species_2_phenotype_ls):
+            h_object.rng = rng
+        return 0
+
+    def patch_values_out(self, out, dtype=float):
+        ''' return out, or a new [hab_num x hab_size] array when out is None. the habitats in a patch have the same size. '''
+        if out is None:
+            out = np.empty((self.hab_num, self.get_patch_size()//max(self.hab_num, 1)), dtype=dtype)
+        return out
+
+    def get_patch_microsites_species_codes(self, out=None):
+        ''' get species codes distribution in the patch as [hab_num x hab_size] int array, -1 for the empty sites '''
+        out = self.patch_values_out(out, dtype=int)
+        for row, h_object in enumerate(self.set.values()):
+            h_object.get_hab_microsites_species_codes(out=out[row])
+        return out
+
+    def get_patch_microsites_individals_sp_id_values(self, out=None):
+        ''' get species_id distribution in the patch as values set of [hab_num x hab_size], np.nan for the empty sites.
+        out is an optional [hab_num x hab_size] float array to be filled in place. '''
+        out = self.patch_values_out(out)
+        for row, h_object in enumerate(self.set.values()):
+            h_object.get_hab_microsites_sp_id_values(out=out[row])
+        return out
+
+    def get_patch_microsites_individals_phenotype_values(self, trait_name, out=None):
+        ''' get phenotypes distribution in the patch as values set of [hab_num x hab_size], np.nan for the empty sites '''
+        out = self.patch_values_out(out)
+        for row, h_object in enumerate(self.set.values()):
+            h_object.get_hab_microsites_phenotype_values(trait_name, out=out[row])
+        return out
+
+    def get_patch_microsites_environment_values(self, environment_name, out=None):
+        ''' get microsite environment values distribution in the patch as values set of [hab_num x hab_size] '''
+        out = self.patch_values_out(out)
+        for row, h_object in enumerate(self.set.values()):
+            out[row] = h_object.set[environment_name].reshape(-1)
+        return out
+
+    def get_patch_microsites_optimum_sp_id_value_array(self, species_2_phenotype_ls, out=None):
         ''''''
-        values_array = np.array([], dtype=int)
-        for h_id, h_object in self.set.items():
-            hab_len = h_object.length
-            hab_wid = h_object.width
-            mean_env_tuple = h_object.mean_env_ls
-            hab_sp_id_val = species_2_phenotype_ls.index(mean_env_tuple)+1
-            hab_sp_id_val_array = np.ones(hab_len*hab_wid, dtype=int)*hab_sp_id_val
-            values_array = np.append(values_array, hab_sp_id_val_array)
-        
-        values_array = values_array.reshape(self.hab_num, h_object.size)
-        return values_array
+        out = self.patch_values_out(out, dtype=int)
+        for row, h_object in enumerate(self.set.values()):
+            out[row] = species_registry_object.get_value_arr()[species_registry_object.get_code_by_optimum_phenotype(h_object.mean_env_ls, species_2_phenotype_ls)]
+        return out
                     
     def __str__(self):
         return str(self.get_data())
@@ -625,29 +1267,22 @@ class patch():
             patch_size += value.size
         return patch_size
     
+    def update_counters(self, key, delta):
+        self.counters[key] += delta
+        if self.owner is not None:
+            self.owner.update_counters(key, delta)
+
     def get_patch_individual_num(self):
-        num = 0
-        for key, value in self.set.items():
-            num += value.indi_num
-        return num
-    
+        return self.counters['individuals']
+
     def get_patch_sexual_pairwise_parents_num(self):
-        num = 0
-        for h_id, h_object in self.set.items():
-            num += h_object.hab_sexual_pairwise_parents_num()
-        return num
-    
+        return self.counters['mating_pairs']
+
     def get_patch_mixed_sexual_pairwise_parents_num(self):
-        num = 0
-        for h_id, h_object in self.set.items():
-            num += h_object.hab_mixed_sexual_pairwse_parents_num()
-        return num
-    
+        return self.counters['mixed_mating_pairs']
+
     def get_patch_mixed_asexual_parent_num(self):
-        num = 0
-        for h_id, h_object in self.set.items():
-            num += h_object.hab_mixed_asexual_parent_num()
-        return num
+        return self.counters['asexual_parents']
 
     def get_disp_within_offsprings_pool(self, target_hab_object):
         ''' return all the offspring (individual objects) in the patch, 
@@ -661,6 +1296,8 @@ class patch():
         return disp_within_patch_offsprings_pool
     
     def get_disp_within_asex_parent_pos_ls(self, target_hab_object):
+        if self.habitat_storage == 'array':
+            return self.get_disp_within_parent_sites(target_hab_object, 'asexual')
         disp_within_patch_parent_pos_ls = []
         for h_id, h_object in self.set.items():
             if h_id != target_hab_object.name:
@@ -673,6 +1310,8 @@ class patch():
         return disp_within_patch_parent_pos_ls
     
     def get_disp_within_sex_pairwise_parents_pos_ls(self, target_hab_object):
+        if self.habitat_storage == 'array':
+            return self.get_disp_within_parent_sites(target_hab_object, 'sexual')
         disp_within_patch_parent_pos_ls = []
         for h_id, h_object in self.set.items():
             if h_id != target_hab_object.name:
@@ -687,7 +1326,9 @@ class patch():
                 continue
         return disp_within_patch_parent_pos_ls
     
-    def get_disp_within_mixed_asex_parent_pos_ls(self, target_hab_object):
+    def get_disp_within_mixed_asex_parent_pos_ls(self, target_hab_object, patch_parent_sites=None):
+        if self.habitat_storage == 'array':
+            return self.get_disp_within_parent_sites(target_hab_object, 'mixed_asexual', patch_parent_sites)
         disp_within_patch_parent_pos_ls = []
         for h_id, h_object in self.set.items():
             if h_id != target_hab_object.name:
@@ -699,7 +1340,9 @@ class patch():
                 continue
         return disp_within_patch_parent_pos_ls
     
-    def get_disp_within_mixed_sex_pairwise_parents_pos_ls(self, target_hab_object):
+    def get_disp_within_mixed_sex_pairwise_parents_pos_ls(self, target_hab_object, patch_parent_sites=None):
+        if self.habitat_storage == 'array':
+            return self.get_disp_within_parent_sites(target_hab_object, 'mixed_sexual', patch_parent_sites)
         disp_within_patch_parent_pos_ls = []
         for h_id, h_object in self.set.items():
             if h_id != target_hab_object.name:
@@ -714,6 +1357,80 @@ class patch():
                 continue
         return disp_within_patch_parent_pos_ls
 
+    def get_patch_parent_sites(self, reproduce_kind):
+        ''' array habitats: the parents of reproduce_kind (see array_habitat.hab_parent_sites()) in the patch
+        as the rows of their sites prefixed with the index of their habitat in the patch '''
+        parent_sites_ls = [np.empty((0, 2 if reproduce_kind in ('asexual', 'mixed_asexual') else 3), dtype=int)]
+        for k, (h_id, h_object) in enumerate(self.set.items()):
+            parent_sites = h_object.hab_parent_sites(reproduce_kind)
+            parent_sites_ls.append(np.column_stack((np.full(len(parent_sites), k), parent_sites)))
+        return np.concatenate(parent_sites_ls)
+
+    def get_disp_within_parent_sites(self, target_hab_object, reproduce_kind, patch_parent_sites=None):
+        ''' array habitats: the rows of get_patch_parent_sites() in the exception of the target hab,
+        patch_parent_sites is the result of get_patch_parent_sites() if it is made once for all the target habs '''
+        if patch_parent_sites is None:
+            patch_parent_sites = self.get_patch_parent_sites(reproduce_kind)
+        return patch_parent_sites[patch_parent_sites[:, 0] != list(self.set.keys()).index(target_hab_object.name)]
+
+    def disp_within_germinate(self, h_object, mutation_rate, pheno_var_ls, asex_sites=(), asex_parent_pos_ls=(), sex_sites=(), pairwise_parents_pos_ls=()):
+        ''' the offsprings of the parents of the other habitats (sampled from the get_disp_within_*() methods) germinate in the sites of h_object,
+        the n-th asexual (sexual) offspring in asex_sites[n] (sex_sites[n]). return the number of offsprings. '''
+        asex_parent_pos_ls, pairwise_parents_pos_ls = asex_parent_pos_ls[:len(asex_sites)], pairwise_parents_pos_ls[:len(sex_sites)]
+        if self.habitat_storage == 'array':
+            asex_sites, sex_sites = np.asarray(asex_sites, dtype=int), np.asarray(sex_sites, dtype=int)
+            asex_parent_pos_ls, pairwise_parents_pos_ls = np.asarray(asex_parent_pos_ls, dtype=int).reshape(-1, 2), np.asarray(pairwise_parents_pos_ls, dtype=int).reshape(-1, 3)
+            counter = 0
+            h_object_ls = list(self.set.values())
+            for k in np.unique(np.concatenate((asex_parent_pos_ls[:, 0], pairwise_parents_pos_ls[:, 0]))):
+                source_h_object = h_object_ls[k]
+                asex_index = np.flatnonzero(asex_parent_pos_ls[:, 0] == k)
+                sex_index = np.flatnonzero(pairwise_parents_pos_ls[:, 0] == k)
+                h_object.init_storage(source_h_object.pheno_names_ls, source_h_object.geno_len_arr)
+                offs = source_h_object.concat_offspring_arrays(source_h_object.hab_offspring_arrays(asex_parent_pos_ls[asex_index, 1:], mutation_rate, pheno_var_ls),
+                                                               source_h_object.hab_offspring_arrays(pairwise_parents_pos_ls[sex_index, 1:], mutation_rate, pheno_var_ls))
+                counter += h_object.place_offspring_arrays(np.concatenate((asex_sites[asex_index], sex_sites[sex_index])), offs)
+            return counter
+        
+        parent_indi_object_ls = [self.set[parent_h_id].get_individual(parent_row, parent_col) for parent_h_id, parent_row, parent_col in asex_parent_pos_ls]
+        pairwise_parents_indi_object_ls = [(self.set[female_pos[0]].get_individual(female_pos[1], female_pos[2]), self.set[male_pos[0]].get_individual(male_pos[1], male_pos[2]))
+                                           for female_pos, male_pos in pairwise_parents_pos_ls]
+        disp_within_offs_ls = asexual_offspring_ls(parent_indi_object_ls, pheno_var_ls, self.rng) + sexual_offspring_ls(pairwise_parents_indi_object_ls, pheno_var_ls, self.rng)
+        batch_mutation(disp_within_offs_ls, mutation_rate, pheno_var_ls, self.rng)
+        for (len_id, wid_id), indi_object in zip(list(asex_sites) + list(sex_sites), disp_within_offs_ls):
+            h_object.add_individual(indi_object=indi_object, len_id=len_id, wid_id=wid_id)
+        return len(disp_within_offs_ls)
+
+    def get_patch_empty_sites_arr(self):
+        ''' array habitats: the empty sites of the patch as the rows of (index of the habitat in the patch, site) '''
+        empty_sites_ls = [np.empty((0, 2), dtype=int)]
+        for k, (h_id, h_object) in enumerate(self.set.items()):
+            empty_sites = h_object.hab_empty_sites()
+            empty_sites_ls.append(np.column_stack((np.full(len(empty_sites), k), empty_sites)))
+        return np.concatenate(empty_sites_ls)
+
+    def settle_migrants(self, migrants_ls):
+        ''' the migrants (a list of the parts returned by habitat.split_offspring()) settle in random empty sites of the patch, return their number '''
+        if self.habitat_storage == 'array':
+            offs_ls = [offs for offs in migrants_ls if len(offs['species_code']) > 0]
+            if len(offs_ls) == 0:
+                return 0
+            offs = {key:np.concatenate([part[key] for part in offs_ls]) for key in offs_ls[0].keys()}
+            empty_sites = rng_sample(self.rng, self.get_patch_empty_sites_arr(), len(offs['species_code']))
+            for k, (h_id, h_object) in enumerate(self.set.items()):
+                index = np.flatnonzero(empty_sites[:, 0] == k)
+                if len(index) > 0:
+                    h_object.place_offspring_arrays(empty_sites[index, 1], h_object.take_offspring_arrays(offs, index))
+            return len(offs['species_code'])
+        
+        migrants_indi_object_ls = [migrants_object for migrants in migrants_ls for migrants_object in migrants]
+        if len(migrants_indi_object_ls) == 0:
+            return 0
+        patch_empty_site_ls = rng_sample(self.rng, self.get_patch_empty_sites_ls(), len(migrants_indi_object_ls))
+        for (h_id, len_id, wid_id), migrants_object in list(zip(patch_empty_site_ls, migrants_indi_object_ls)):
+            self.set[h_id].add_individual(indi_object=migrants_object, len_id=len_id, wid_id=wid_id)
+        return len(migrants_indi_object_ls)
+
     def get_patch_offsprings_pool(self):
         ''' return all the offspring (individual objects) in the patch as a list for dispersal among patches'''
         patch_offsprings_pool = []
@@ -737,7 +1454,7 @@ class patch():
     
     def patch_empty_sites_num(self):
         ''' return the number of empty microsite in the patches '''
-        return len(self.get_patch_empty_sites_ls())
+        return self.counters['empty_sites']
     
     def get_patch_pairwise_empty_sites_ls(self):
         ''' return patch_empty_pos_ls as [((h_id, len_id, wid_id), (h_id, len_id, wid_id))...] '''
@@ -750,11 +1467,50 @@ class patch():
                 patch_pairwise_empty_pos_ls.append((empty_site_1_pos, empty_site_2_pos))
         return patch_pairwise_empty_pos_ls
     
-    def add_habitat(self, hab_name, num_env_types, env_types_name, mean_env_ls, var_env_ls, length, width):
-        h_object = habitat(hab_name, num_env_types, env_types_name, mean_env_ls, var_env_ls, length, width)
+    def get_patch_pairwise_empty_sites_num(self):
+        ''' the number of pairs get_patch_pairwise_empty_sites_ls() makes, counted without pairing '''
+        return sum(h_object.hab_pairwise_empty_sites_num() for h_object in self.set.values())
+
+    def pairwise_empty_sites_colonize(self, colonization_ls):
+        ''' colonization_ls is [(pair_index, female_obj, male_obj)], pair_index numbers the pairwise empty sites of the habitats in turn (see get_patch_pairwise_empty_sites_num()).
+        the pairs are exchangeable within a habitat, thus the female and male of the n-th pair of a habitat settle in the sites 2n and 2n+1 of rng_sample() of its empty sites
+        instead of pairing all its empty sites. return the number of individuals added. '''
+        pairs_num_arr = np.array([h_object.hab_pairwise_empty_sites_num() for h_object in self.set.values()])
+        hab_index_arr = np.searchsorted(np.cumsum(pairs_num_arr), [pair_index for pair_index, female_obj, male_obj in colonization_ls], side='right')
+        for k, h_object in enumerate(self.set.values()):
+            hab_colonization_ls = [(female_obj, male_obj) for (pair_index, female_obj, male_obj), index in zip(colonization_ls, hab_index_arr) if index == k]
+            if len(hab_colonization_ls) == 0:
+                continue
+            empty_sites_pos_ls = rng_sample(self.rng, h_object.empty_site_pos_ls, 2*len(hab_colonization_ls))
+            for n, (female_obj, male_obj) in enumerate(hab_colonization_ls):
+                h_object.add_individual(indi_object=female_obj, len_id=empty_sites_pos_ls[2*n][0], wid_id=empty_sites_pos_ls[2*n][1])
+                h_object.add_individual(indi_object=male_obj, len_id=empty_sites_pos_ls[2*n+1][0], wid_id=empty_sites_pos_ls[2*n+1][1])
+        return 2*len(colonization_ls)
+
+    def add_habitat(self, hab_name, num_env_types, env_types_name, mean_env_ls, var_env_ls, length, width, habitat_storage='object'):
+        ''' habitat_storage is 'object' for one individual object per microsite or 'array' for the array-backed population store '''
+        if habitat_storage == 'object':
+            h_object = habitat(hab_name, num_env_types, env_types_name, mean_env_ls, var_env_ls, length, width, rng=self.rng)
+        elif habitat_storage == 'array':
+            h_object = array_habitat(hab_name, num_env_types, env_types_name, mean_env_ls, var_env_ls, length, width, rng=self.rng)
+        else:
+            raise ValueError('habitat_storage inputed is no found.')
+        if self.habitat_storage not in (None, habitat_storage):
+            raise ValueError('the habitats of a patch must have the same habitat_storage.')
+        self.habitat_storage = habitat_storage
         self.set[hab_name] = h_object
         self.hab_num += 1
+        h_object.owner = self
+        for key, value in h_object.counters.items():
+            self.update_counters(key, value)
         
+    def init_storage(self, pheno_names_ls, geno_len_ls):
+        ''' allocate the arrays of the array habitats, see array_habitat.init_storage() '''
+        if self.habitat_storage == 'array':
+            for h_id, h_object in self.set.items():
+                h_object.init_storage(pheno_names_ls, geno_len_ls)
+        return 0
+
     def patch_initialize(self, traits_num, pheno_names_ls, pheno_var_ls, geno_len_ls, reproduce_mode, species_2_phenotype_ls):
         for h_id, h_object in self.set.items():
             h_object.hab_initialize(traits_num, pheno_names_ls, pheno_var_ls, geno_len_ls, reproduce_mode, species_2_phenotype_ls)
@@ -785,13 +1541,14 @@ class patch():
         if patch_offs_num == 0 or patch_indi_num == 0:
             return patch_disp_among_pool
         else:
-            for h_id, h_object in self.set.items():
+            probability_arr = self.rng.random(self.hab_num)
+            for k, (h_id, h_object) in enumerate(self.set.items()):
                 hab_offs_raw_num = patch_offs_num * (h_object.indi_num/patch_indi_num)
                 hab_offs_num = int(hab_offs_raw_num) # 整数部分表示后代个体数
                 patch_disp_among_pool += h_object.hab_asex_reproduce_mutate_with_num(mutation_rate, pheno_var_ls, hab_offs_num)
                 
                 hab_offs_probability = hab_offs_raw_num - hab_offs_num # 小数部分表示概率
-                if hab_offs_probability >= np.random.uniform(0,1,1)[0]:
+                if hab_offs_probability >= probability_arr[k]:
                     patch_disp_among_pool += h_object.hab_asex_reproduce_mutate_with_num(mutation_rate, pheno_var_ls, num=1)
             #print('patch_offs_num=', patch_offs_num, 'len of patch_disp_among_pool=', len(patch_disp_among_pool))
             return patch_disp_among_pool
@@ -802,13 +1559,14 @@ class patch():
         if patch_offs_num == 0 or patch_pairwise_parents_num == 0:
             return patch_disp_among_pool
         else:
-            for h_id, h_object in self.set.items():
+            probability_arr = self.rng.random(self.hab_num)
+            for k, (h_id, h_object) in enumerate(self.set.items()):
                 hab_offs_raw_num = patch_offs_num * (h_object.hab_sexual_pairwise_parents_num()/patch_pairwise_parents_num)
                 hab_offs_num = int(hab_offs_raw_num)  # 整数部分表示后代个体数
                 patch_disp_among_pool += h_object.hab_sex_reproduce_mutate_with_num(mutation_rate, pheno_var_ls, hab_offs_num)
                 
                 hab_offs_probability = hab_offs_raw_num - hab_offs_num # 小数部分表示概率
-                if hab_offs_probability >= np.random.uniform(0,1,1)[0]:
+                if hab_offs_probability >= probability_arr[k]:
                     patch_disp_among_pool += h_object.hab_sex_reproduce_mutate_with_num(mutation_rate, pheno_var_ls, num=1)
             #print('patch_offs_num=', patch_offs_num, 'len of patch_disp_among_pool=', len(patch_disp_among_pool))
             return patch_disp_among_pool
@@ -826,14 +1584,15 @@ class patch():
             patch_asexual_mixed_offs_num = int(np.around(patch_offs_num * (patch_asexual_mixed_parents_num * self.asexual_birth_rate)/(patch_asexual_mixed_parents_num * self.asexual_birth_rate + patch_sexual_mixed_pairwise_parents_num * self.sexual_birth_rate)))
             patch_sexual_mixed_offs_num = int(np.around(patch_offs_num * (patch_sexual_mixed_pairwise_parents_num * self.sexual_birth_rate)/(patch_asexual_mixed_parents_num * self.asexual_birth_rate + patch_sexual_mixed_pairwise_parents_num * self.sexual_birth_rate)))
 
-            for h_id, h_object in self.set.items():
+            probability_arr = self.rng.random((self.hab_num, 2))
+            for k, (h_id, h_object) in enumerate(self.set.items()):
                 if patch_asexual_mixed_parents_num != 0: 
                     hab_asexual_mixed_offs_raw_num = patch_asexual_mixed_offs_num * (h_object.hab_mixed_asexual_parent_num()/patch_asexual_mixed_parents_num) # 期望值
                     hab_asexual_mixed_offs_num = int(hab_asexual_mixed_offs_raw_num) # 整数部分
                     hab_asexual_mixed_offs_probability = hab_asexual_mixed_offs_raw_num - hab_asexual_mixed_offs_num # 小数部分表示概率
                     patch_disp_among_pool += h_object.hab_mix_asex_reproduce_mutate_with_num(mutation_rate, pheno_var_ls, hab_asexual_mixed_offs_num)
 
-                    if hab_asexual_mixed_offs_probability >= np.random.uniform(0,1,1)[0]:
+                    if hab_asexual_mixed_offs_probability >= probability_arr[k, 0]:
                         patch_disp_among_pool += h_object.hab_mix_asex_reproduce_mutate_with_num(mutation_rate, pheno_var_ls, num=1)
                         hab_asexual_mixed_offs_num += 1
                     #print(h_id, 'hab_asexual_mixed_offs_raw_num=', hab_asexual_mixed_offs_raw_num, 'hab_asexual_mixed_offs_num=', hab_asexual_mixed_offs_num)
@@ -844,31 +1603,47 @@ class patch():
                     hab_sexual_mixed_offs_probability = hab_sexual_mixed_offs_raw_num - hab_sexual_mixed_offs_num # 小数部分表示概率
                     patch_disp_among_pool += h_object.hab_mix_sex_reproduce_mutate_with_num(mutation_rate, pheno_var_ls, hab_sexual_mixed_offs_num)
 
-                    if hab_sexual_mixed_offs_probability >= np.random.uniform(0,1,1)[0]:
+                    if hab_sexual_mixed_offs_probability >= probability_arr[k, 1]:
                         patch_disp_among_pool += h_object.hab_mix_sex_reproduce_mutate_with_num(mutation_rate, pheno_var_ls, num=1)
                         hab_sexual_mixed_offs_num += 1
                     #print(h_id, 'hab_sexual_mixed_offs_raw_num=', hab_sexual_mixed_offs_raw_num, 'hab_sexual_mixed_offs_num=', hab_sexual_mixed_offs_num)
   
             return patch_disp_among_pool
                 
+    def get_emigrant_sources_ls(self, reproduce_mode):
+        ''' return [(h_object, reproduce_kind, offs_expectation_num)] of the habitats in the patch for the dispersal among patches,
+        in the mixed mode every habitat has an asexual and a sexual source. '''
+        sources_ls = []
+        for h_id, h_object in self.set.items():
+            if reproduce_mode == 'asexual':
+                sources_ls.append((h_object, 'asexual', h_object.indi_num * self.asexual_birth_rate))
+            elif reproduce_mode == 'sexual':
+                sources_ls.append((h_object, 'sexual', h_object.hab_sexual_pairwise_parents_num() * self.sexual_birth_rate))
+            elif reproduce_mode == 'mixed':
+                sources_ls.append((h_object, 'mixed_asexual', h_object.hab_mixed_asexual_parent_num() * self.asexual_birth_rate))
+                sources_ls.append((h_object, 'mixed_sexual', h_object.hab_mixed_sexual_pairwse_parents_num() * self.sexual_birth_rate))
+            else:
+                raise ValueError('reproduce_mode inputed is no found.')
+        return sources_ls
+
     def patch_disp_within_from_offsprings_pool(self, disp_within_rate, counter):
         ''''''
         for h_id, h_object in self.set.items():
             h_offspring_pool = h_object.offspring_pool # 本地生境后代个体对象列表
-            disp_within_pool = random.sample(self.get_disp_within_offsprings_pool(h_object), int(len(self.get_disp_within_offsprings_pool(h_object))*disp_within_rate/(self.hab_num-1))) # 斑块内非本地生境后代迁入个体对象列表
+            disp_within_pool = rng_sample(self.rng, self.get_disp_within_offsprings_pool(h_object), int(len(self.get_disp_within_offsprings_pool(h_object))*disp_within_rate/(self.hab_num-1))) # 斑块内非本地生境后代迁入个体对象列表
             
             h_empty_site_ls = h_object.empty_site_pos_ls
             if (len(h_offspring_pool)+len(disp_within_pool)) != 0:
                 disp_within_empty_site_num = int(np.around(len(h_empty_site_ls) * len(disp_within_pool)/(len(h_offspring_pool)+len(disp_within_pool))))
-                disp_within_sites = random.sample(h_empty_site_ls, disp_within_empty_site_num)
+                disp_within_sites = rng_sample(self.rng, h_empty_site_ls, disp_within_empty_site_num)
             else:
                 disp_within_sites = []
             
             if len(disp_within_pool) > len(disp_within_sites):
-                disp_within_indi_ls = random.sample(disp_within_pool, len(disp_within_sites))
+                disp_within_indi_ls = rng_sample(self.rng, disp_within_pool, len(disp_within_sites))
             else:
                 disp_within_indi_ls = disp_within_pool
-                random.shuffle(disp_within_indi_ls)
+                self.rng.shuffle(disp_within_indi_ls)
             
             for empty_site_pos, disp_indi_object in list(zip(disp_within_sites, disp_within_indi_ls)):
                 len_id = empty_site_pos[0]
@@ -889,35 +1664,20 @@ class patch():
             asex_parent_pos_ls = self.get_disp_within_asex_parent_pos_ls(h_object) # 斑块内外来生境的无性繁殖母本位置列表
             offsprings_expection_num = int(np.around(len(asex_parent_pos_ls) * asexual_birth_rate * disp_within_rate / (self.hab_num-1))) # 斑块内非本地生境无性生殖后代迁入至当前生境个体数期望值
             
-            h_empty_site_ls = h_object.empty_site_pos_ls # 生境的空白斑块编号列表
+            h_empty_site_ls = h_object.hab_empty_sites() # 生境的空白斑块编号列表
             if (h_asex_offs_expectation_num + offsprings_expection_num) != 0:
                 disp_within_empty_site_num = int(np.around(len(h_empty_site_ls) * offsprings_expection_num/(h_asex_offs_expectation_num + offsprings_expection_num)))
             else:
                 disp_within_empty_site_num = 0
             
             if offsprings_expection_num > disp_within_empty_site_num:
-                disp_within_sites = random.sample(h_empty_site_ls, disp_within_empty_site_num)
-                disp_within_parent_pos_ls = random.sample(asex_parent_pos_ls, disp_within_empty_site_num)
+                disp_within_sites = rng_sample(self.rng, h_empty_site_ls, disp_within_empty_site_num)
+                disp_within_parent_pos_ls = rng_sample(self.rng, asex_parent_pos_ls, disp_within_empty_site_num)
             else:
-                disp_within_sites = random.sample(h_empty_site_ls, offsprings_expection_num)
-                disp_within_parent_pos_ls = random.sample(asex_parent_pos_ls, offsprings_expection_num)
-                
-            for empty_site_pos, parent_pos in list(zip(disp_within_sites, disp_within_parent_pos_ls)):
-                empty_len_id, empty_wid_id = empty_site_pos[0], empty_site_pos[1]
-                parent_h_id, parent_row, parent_col = parent_pos[0], parent_pos[1], parent_pos[2]
-                
-                parent_indi_object = self.set[parent_h_id].set['microsite_individuals'][parent_row][parent_col]
-                new_indivi_object = copy.deepcopy(parent_indi_object)
+                disp_within_sites = rng_sample(self.rng, h_empty_site_ls, offsprings_expection_num)
+                disp_within_parent_pos_ls = rng_sample(self.rng, asex_parent_pos_ls, offsprings_expection_num)
                 
-                for i in range(new_indivi_object.traits_num):
-                    pheno_name = new_indivi_object.pheno_names_ls[i]
-                    var = pheno_var_ls[i] #### to be improved #### 
-                    genotype = new_indivi_object.genotype_set[pheno_name]
-                    phenotype = np.mean(genotype) + random.gauss(0, var)
-                    new_indivi_object.phenotype_set[pheno_name] = phenotype
-                    new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-                self.set[h_id].add_individual(indi_object=new_indivi_object, len_id=empty_len_id, wid_id=empty_wid_id)
-                counter += 1
+            counter += self.disp_within_germinate(h_object, mutation_rate, pheno_var_ls, asex_sites=disp_within_sites, asex_parent_pos_ls=disp_within_parent_pos_ls)
         return counter
             
     def sex_reproduce_mutate_for_dispersal_within_patch(self, mutation_rate, pheno_var_ls, disp_within_rate):
@@ -931,47 +1691,20 @@ class patch():
             sex_pairwise_parents_pos_ls = self.get_disp_within_sex_pairwise_parents_pos_ls(h_object) # 斑块内外来生境的有性繁殖父母本位置对列表
             offsprings_expection_num = int(np.around(len(sex_pairwise_parents_pos_ls) * sexual_birth_rate * disp_within_rate / (self.hab_num-1))) # 斑块内非本地有性生殖后代迁入个体数期望值
             
-            h_empty_site_ls = h_object.empty_site_pos_ls # 生境的空白斑块编号列表
+            h_empty_site_ls = h_object.hab_empty_sites() # 生境的空白斑块编号列表
             if (h_sex_offs_expectation_num + offsprings_expection_num) != 0:
                 disp_within_empty_site_num = int(np.around(len(h_empty_site_ls) * offsprings_expection_num/(h_sex_offs_expectation_num + offsprings_expection_num)))
             else:
                 disp_within_empty_site_num = 0
             
             if offsprings_expection_num > disp_within_empty_site_num:
-                disp_within_sites = random.sample(h_empty_site_ls, disp_within_empty_site_num)
-                disp_within_pairwise_parent_pos_ls = random.sample(sex_pairwise_parents_pos_ls, disp_within_empty_site_num)
+                disp_within_sites = rng_sample(self.rng, h_empty_site_ls, disp_within_empty_site_num)
+                disp_within_pairwise_parent_pos_ls = rng_sample(self.rng, sex_pairwise_parents_pos_ls, disp_within_empty_site_num)
             else:
-                disp_within_sites = random.sample(h_empty_site_ls, offsprings_expection_num)
-                disp_within_pairwise_parent_pos_ls = random.sample(sex_pairwise_parents_pos_ls, offsprings_expection_num)
+                disp_within_sites = rng_sample(self.rng, h_empty_site_ls, offsprings_expection_num)
+                disp_within_pairwise_parent_pos_ls = rng_sample(self.rng, sex_pairwise_parents_pos_ls, offsprings_expection_num)
             
-            for empty_site_pos, pairwise_parents_pos in list(zip(disp_within_sites, disp_within_pairwise_parent_pos_ls)):
-                empty_len_id, empty_wid_id = empty_site_pos[0], empty_site_pos[1]
-                female_parent_h_id, female_parent_row, female_parent_col = pairwise_parents_pos[0][0], pairwise_parents_pos[0][1], pairwise_parents_pos[0][2]
-                male_parent_h_id, male_parent_row, male_parent_col = pairwise_parents_pos[1][0], pairwise_parents_pos[1][1], pairwise_parents_pos[1][2]
-                
-                female_parent_indi_object = self.set[female_parent_h_id].set['microsite_individuals'][female_parent_row][female_parent_col]
-                male_parent_indi_object = self.set[male_parent_h_id].set['microsite_individuals'][male_parent_row][male_parent_col]
-                
-                new_indivi_object = copy.deepcopy(female_parent_indi_object)
-                new_indivi_object.gender = random.sample(('male', 'female'), 1)[0]
-                for i in range(new_indivi_object.traits_num):
-                    pheno_name = new_indivi_object.pheno_names_ls[i]
-                    var = pheno_var_ls[i] # to be improved
-                    
-                    female_bi_genotype = female_parent_indi_object.genotype_set[pheno_name]
-                    genotype1 = random.sample(female_bi_genotype, 1)[0]
-                    
-                    male_bi_genotype = male_parent_indi_object.genotype_set[pheno_name]
-                    genotype2 = random.sample(male_bi_genotype, 1)[0]
-                    
-                    new_bi_genotype = [genotype1, genotype2]
-                    phenotype = np.mean(new_bi_genotype) + random.gauss(0, var)
-                    
-                    new_indivi_object.genotype_set[pheno_name] = new_bi_genotype
-                    new_indivi_object.phenotype_set[pheno_name] = phenotype
-                new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-                self.set[h_id].add_individual(indi_object=new_indivi_object, len_id=empty_len_id, wid_id=empty_wid_id)
-                counter += 1
+            counter += self.disp_within_germinate(h_object, mutation_rate, pheno_var_ls, sex_sites=disp_within_sites, pairwise_parents_pos_ls=disp_within_pairwise_parent_pos_ls)
         return counter
     
     def mixed_reproduce_mutate_for_dispersal_within_patch(self, mutation_rate, pheno_var_ls, disp_within_rate):
@@ -979,6 +1712,9 @@ class patch():
         asexual_birth_rate = self.asexual_birth_rate
         sexual_birth_rate = self.sexual_birth_rate
         counter = 0
+        # the mixed parents are sorted out in the dead selection and are not changed by the offsprings settled here, thus the parents of array habitats are collected once
+        patch_asex_parent_sites = self.get_patch_parent_sites('mixed_asexual') if self.habitat_storage == 'array' else None
+        patch_sex_parent_sites = self.get_patch_parent_sites('mixed_sexual') if self.habitat_storage == 'array' else None
         for h_id, h_object in self.set.items():
             
             h_asexual_parent_num = h_object.hab_mixed_asexual_parent_num() # 本地无性生殖母本个数
@@ -986,12 +1722,12 @@ class patch():
             h_asex_offs_expectation_num = h_asexual_parent_num * asexual_birth_rate # 本地无性繁殖子代数
             h_sex_offs_expectation_num = h_sexual_pairwise_parents_num * sexual_birth_rate # 本地有性生殖子代数
             
-            mixed_asex_parent_pos_ls = self.get_disp_within_mixed_asex_parent_pos_ls(h_object) # 斑块内外来生境的无性繁殖母本位置列表
-            mixed_sex_pairwise_parents_pos_ls = self.get_disp_within_mixed_sex_pairwise_parents_pos_ls(h_object) # 斑块内外来生境的有性繁殖父母本位置对列表
+            mixed_asex_parent_pos_ls = self.get_disp_within_mixed_asex_parent_pos_ls(h_object, patch_asex_parent_sites) # 斑块内外来生境的无性繁殖母本位置列表
+            mixed_sex_pairwise_parents_pos_ls = self.get_disp_within_mixed_sex_pairwise_parents_pos_ls(h_object, patch_sex_parent_sites) # 斑块内外来生境的有性繁殖父母本位置对列表
             asex_offs_expectation_num = int(np.around(len(mixed_asex_parent_pos_ls) * asexual_birth_rate * disp_within_rate / (self.hab_num-1))) # 斑块内非本地生境无性生殖后代迁入个体数期望值
             sex_offs_expectation_num = int(np.around(len(mixed_sex_pairwise_parents_pos_ls) * sexual_birth_rate * disp_within_rate / (self.hab_num-1))) # 斑块内非本地有性生殖后代迁入个体数期望值
             
-            h_empty_site_ls = h_object.empty_site_pos_ls # 生境的空白斑块编号列表
+            h_empty_site_ls = h_object.hab_empty_sites() # 生境的空白斑块编号列表
             if (h_asex_offs_expectation_num + h_sex_offs_expectation_num + asex_offs_expectation_num + sex_offs_expectation_num) != 0:
                 disp_within_empty_site_num = int(np.around(len(h_empty_site_ls) * (asex_offs_expectation_num + sex_offs_expectation_num)/(h_asex_offs_expectation_num + h_sex_offs_expectation_num + asex_offs_expectation_num + sex_offs_expectation_num)))
                 # 计算可以用于迁移拓殖的空白板块期望值：只有空白的微位点可以被拓殖，本地后代和斑块内被本地的迁移后代共同按比例竞争这些空白斑块
@@ -1002,67 +1738,22 @@ class patch():
                 asex_disp_num = int(np.around((disp_within_empty_site_num * asex_offs_expectation_num/(asex_offs_expectation_num + sex_offs_expectation_num))))
                 sex_disp_num = int(np.around(disp_within_empty_site_num * sex_offs_expectation_num/(asex_offs_expectation_num + sex_offs_expectation_num)))
                 
-                disp_within_sites = random.sample(h_empty_site_ls, asex_disp_num + sex_disp_num)
+                disp_within_sites = rng_sample(self.rng, h_empty_site_ls, asex_disp_num + sex_disp_num)
                 disp_within_asex_sites = disp_within_sites[:asex_disp_num]
                 disp_within_sex_sites = disp_within_sites[asex_disp_num:asex_disp_num + sex_disp_num]
                 
-                disp_within_asexual_parent_pos_ls = random.sample(mixed_asex_parent_pos_ls, asex_disp_num)
-                disp_within_pairwise_parent_pos_ls = random.sample(mixed_sex_pairwise_parents_pos_ls, sex_disp_num)
+                disp_within_asexual_parent_pos_ls = rng_sample(self.rng, mixed_asex_parent_pos_ls, asex_disp_num)
+                disp_within_pairwise_parent_pos_ls = rng_sample(self.rng, mixed_sex_pairwise_parents_pos_ls, sex_disp_num)
             else:                                                                                   # 迁移者比空白斑块少
-                disp_within_sites = random.sample(h_empty_site_ls, asex_offs_expectation_num + sex_offs_expectation_num)
+                disp_within_sites = rng_sample(self.rng, h_empty_site_ls, asex_offs_expectation_num + sex_offs_expectation_num)
                 disp_within_asex_sites = disp_within_sites[:asex_offs_expectation_num]
                 disp_within_sex_sites = disp_within_sites[asex_offs_expectation_num:asex_offs_expectation_num + sex_offs_expectation_num]
                 
-                disp_within_asexual_parent_pos_ls = random.sample(mixed_asex_parent_pos_ls, asex_offs_expectation_num)
-                disp_within_pairwise_parent_pos_ls = random.sample(mixed_sex_pairwise_parents_pos_ls, sex_offs_expectation_num)
+                disp_within_asexual_parent_pos_ls = rng_sample(self.rng, mixed_asex_parent_pos_ls, asex_offs_expectation_num)
+                disp_within_pairwise_parent_pos_ls = rng_sample(self.rng, mixed_sex_pairwise_parents_pos_ls, sex_offs_expectation_num)
                 
-            for empty_site_pos, parent_pos in list(zip(disp_within_asex_sites, disp_within_asexual_parent_pos_ls)):
-                ''' asexual reproduction'''
-                empty_len_id, empty_wid_id = empty_site_pos[0], empty_site_pos[1]
-                parent_h_id, parent_row, parent_col = parent_pos[0], parent_pos[1], parent_pos[2]
-                
-                parent_indi_object = self.set[parent_h_id].set['microsite_individuals'][parent_row][parent_col]
-                new_indivi_object = copy.deepcopy(parent_indi_object)
-                
-                for i in range(new_indivi_object.traits_num):
-                    pheno_name = new_indivi_object.pheno_names_ls[i]
-                    var = pheno_var_ls[i] #### to be improved #### 
-                    genotype = new_indivi_object.genotype_set[pheno_name]
-                    phenotype = np.mean(genotype) + random.gauss(0, var)
-                    new_indivi_object.phenotype_set[pheno_name] = phenotype
-                    new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-                self.set[h_id].add_individual(indi_object=new_indivi_object, len_id=empty_len_id, wid_id=empty_wid_id)
-                counter += 1
-                
-            for empty_site_pos, pairwise_parents_pos in list(zip(disp_within_sex_sites, disp_within_pairwise_parent_pos_ls)):
-                ''' sexual reproduction '''
-                empty_len_id, empty_wid_id = empty_site_pos[0], empty_site_pos[1]
-                female_parent_h_id, female_parent_row, female_parent_col = pairwise_parents_pos[0][0], pairwise_parents_pos[0][1], pairwise_parents_pos[0][2]
-                male_parent_h_id, male_parent_row, male_parent_col = pairwise_parents_pos[1][0], pairwise_parents_pos[1][1], pairwise_parents_pos[1][2]
-                
-                female_parent_indi_object = self.set[female_parent_h_id].set['microsite_individuals'][female_parent_row][female_parent_col]
-                male_parent_indi_object = self.set[male_parent_h_id].set['microsite_individuals'][male_parent_row][male_parent_col]
-                
-                new_indivi_object = copy.deepcopy(female_parent_indi_object)
-                new_indivi_object.gender = random.sample(('male', 'female'), 1)[0]
-                for i in range(new_indivi_object.traits_num):
-                    pheno_name = new_indivi_object.pheno_names_ls[i]
-                    var = pheno_var_ls[i] # to be improved
-                    
-                    female_bi_genotype = female_parent_indi_object.genotype_set[pheno_name]
-                    genotype1 = random.sample(female_bi_genotype, 1)[0]
-                    
-                    male_bi_genotype = male_parent_indi_object.genotype_set[pheno_name]
-                    genotype2 = random.sample(male_bi_genotype, 1)[0]
-                    
-                    new_bi_genotype = [genotype1, genotype2]
-                    phenotype = np.mean(new_bi_genotype) + random.gauss(0, var)
-                    
-                    new_indivi_object.genotype_set[pheno_name] = new_bi_genotype
-                    new_indivi_object.phenotype_set[pheno_name] = phenotype
-                new_indivi_object.mutation(rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-                self.set[h_id].add_individual(indi_object=new_indivi_object, len_id=empty_len_id, wid_id=empty_wid_id)
-                counter += 1
+            counter += self.disp_within_germinate(h_object, mutation_rate, pheno_var_ls, asex_sites=disp_within_asex_sites, asex_parent_pos_ls=disp_within_asexual_parent_pos_ls, 
+                                                  sex_sites=disp_within_sex_sites, pairwise_parents_pos_ls=disp_within_pairwise_parent_pos_ls)
         return counter
 
     def patch_dormancy_processes(self):
@@ -1099,14 +1790,19 @@ class patch():
         return counter
         
 class metacommunity():
-    def __init__(self, metacommunity_name):
+    def __init__(self, metacommunity_name, rng=None):
         self.set = {}                       # self.data_set={} # to be improved
         self.patch_num = 0
         self.meta_map = nx.Graph()
         self.metacommunity_name = metacommunity_name
-        self.patch_id_ls = []
+        self.patch_id_ls = []               # patch order of the rows and columns of the dispersal matrices, i.e., the order of self.meta_map.nodes()
         self.patch_id_2_index_dir = {}
+        self.patch_id_2_row_dir = {}
+        self.patch_object_ls = []
         self.disp_current_matrix = np.matrix([])
+        self.counters = {'individuals':0, 'empty_sites':0, 'asexual_parents':0, 'mating_pairs':0, 'mixed_mating_pairs':0} # sums of the counters of the patches
+        self.disp_kernal_cache = {}         # {(id(graph_object), disp_kernal, total_disp_among_rate): (graph_object, graph_shape_key, disp_rate_matrix)}
+        self.rng = np.random.default_rng() if rng is None else rng     # the np.random.Generator of the draws among patches, the patches have their own ones
     
     def get_data(self):
         output = {}
@@ -1116,15 +1812,32 @@ class metacommunity():
     
     def __str__(self):
         return str(self.get_data())
+
+    def seed_rng(self, seed_sequence):
+        ''' seed the generator of the metacommunity by the np.random.SeedSequence and give every patch (and its habitats) 
+        its own stream spawned from seed_sequence, thus the draws of a patch do not depend on the other patches '''
+        self.rng = np.random.default_rng(seed_sequence)
+        for patch_object, patch_seed_sequence in zip(self.patch_object_ls, seed_sequence.spawn(self.patch_num)):
+            patch_object.set_rng(np.random.default_rng(patch_seed_sequence))
+        return 0
         
     def add_patch(self, patch_name, patch_object):
         ''' add new patch to the metacommunity. '''
         self.set[patch_name] = patch_object
         self.patch_num += 1
         self.meta_map.add_node(patch_name)
+        self.patch_id_2_row_dir[patch_name] = len(self.patch_id_ls)
         self.patch_id_ls.append(patch_name)
+        self.patch_object_ls.append(patch_object)
         self.patch_id_2_index_dir[patch_name] = patch_object.index
         self.disp_current_matrix = np.matrix(np.zeros((self.patch_num, self.patch_num)))
+        patch_object.owner = self
+        for key, value in patch_object.counters.items():
+            self.update_counters(key, value)
+        self.clear_disp_kernal_cache()
+
+    def update_counters(self, key, delta):
+        self.counters[key] += delta
         
     def get_all_patches_location(self):
         output = {}
@@ -1133,17 +1846,20 @@ class metacommunity():
         return output
     
     def get_meta_individual_num(self):
-        num = 0
-        for patch_id, patch_object in self.set.items():
-            num += patch_object.get_patch_individual_num()
-        return num
+        return self.counters['individuals']
+
+    def get_meta_size(self):
+        ''' return the number of microsites in the metacommunity '''
+        return self.counters['individuals'] + self.counters['empty_sites']
     
     def show_meta_individual_num(self):
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(indi_num, empty_sites_num)
-        #print(log_info)
-        return log_info
+        return lazy_log_message('there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity', self.get_meta_individual_num(), self.show_meta_empty_sites_num())
+
+    def log_info(self, process_info, counter, counters=None):
+        ''' the message of a process (see lazy_log_message) from its counter and the cached counters of the metacommunity (or counters if it is given) '''
+        counters = self.counters if counters is None else counters
+        return lazy_log_message('there are %d individuals %s; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity',
+                                counter, process_info, counters['individuals'], counters['empty_sites'])
     
     def show_meta_map(self, graph_object, title, pos=None):
         if pos == None:
@@ -1158,38 +1874,79 @@ class metacommunity():
     def show_meta_species_distribution(self, cmap, file_name):
         pass
     
-    def get_meta_microsites_individuals_sp_id_values(self):
-        ''' '''
-        meta_sp_dis = np.array([], dtype=int)
+    def meta_patches_out_ls(self, out):
+        ''' split the [meta_size] array out into the [hab_num x hab_size] views of the patches in the order of self.set '''
+        out_ls = []
+        start = 0
         for patch_id, patch_object in self.set.items():
-            patch_sp_dis = patch_object.get_patch_microsites_individals_sp_id_values()
-            meta_sp_dis = np.append(meta_sp_dis, patch_sp_dis.reshape(-1))
-        return meta_sp_dis
-    
-    def get_meta_microsites_individuals_phenotype_values(self, trait_name):
-        ''''''
-        meta_phenotype_dis = np.array([])
+            patch_size = patch_object.get_patch_size()
+            out_ls.append(out[start:start+patch_size].reshape(patch_object.hab_num, -1))
+            start += patch_size
+        return out_ls
+
+    def get_meta_monitoring_sites(self, sites_num_per_habitat):
+        ''' return the sorted indexes (in the [meta_size] arrays of the get_meta_microsites_* methods) of sites_num_per_habitat microsites
+        sampled at random in every habitat, e.g., for recording_policy(sites=...) '''
+        sites_ls = []
+        start = 0
         for patch_id, patch_object in self.set.items():
-            patch_phenotype_dis = patch_object.get_patch_microsites_individals_phenotype_values(trait_name)
-            meta_phenotype_dis = np.append(meta_phenotype_dis, patch_phenotype_dis.reshape(-1))
-        meta_phenotype_dis = np.around(meta_phenotype_dis, 3) # saving the storage
-        return meta_phenotype_dis
-    
-    def get_meta_microsite_environment_values(self, environment_name):
+            for h_id, h_object in patch_object.set.items():
+                sites_ls += [start + site for site in rng_sample(self.rng, range(h_object.size), min(sites_num_per_habitat, h_object.size))]
+                start += h_object.size
+        return np.sort(np.array(sites_ls, dtype=int))
+
+    def get_meta_microsites_species_codes(self, out=None):
+        ''' return the species codes of all the microsites as a [meta_size] int array, -1 for the empty sites '''
+        if out is None:
+            out = np.empty(self.get_meta_size(), dtype=int)
+        for patch_object, patch_out in zip(self.set.values(), self.meta_patches_out_ls(out)):
+            patch_object.get_patch_microsites_species_codes(out=patch_out)
+        return out
+
+    def get_meta_microsites_habitat_index(self):
+        ''' return the index of the habitat (0, 1, ... over all the patches) and the index of the patch of every microsite as two [meta_size] int arrays '''
+        habitat_index_ls, patch_index_ls = [], []
+        habitat_index = 0
+        for patch_index, patch_object in enumerate(self.set.values()):
+            for h_id, h_object in patch_object.set.items():
+                habitat_index_ls.append(np.full(h_object.size, habitat_index))
+                patch_index_ls.append(np.full(h_object.size, patch_index))
+                habitat_index += 1
+        return np.concatenate(habitat_index_ls), np.concatenate(patch_index_ls)
+
+    def get_meta_microsites_individuals_sp_id_values(self, out=None):
+        ''' return the species_id values of all the microsites as a [meta_size] array, np.nan for the empty sites.
+        out is an optional float array of [meta_size] to be filled in place, e.g., a buffer reused at every time step. '''
+        if out is None:
+            out = np.empty(self.get_meta_size())
+        for patch_object, patch_out in zip(self.set.values(), self.meta_patches_out_ls(out)):
+            patch_object.get_patch_microsites_individals_sp_id_values(out=patch_out)
+        return out
+
+    def get_meta_microsites_individuals_phenotype_values(self, trait_name, out=None):
         ''''''
-        meta_environment_dis = np.array([])
-        for patch_id, patch_object in self.set.items():
-            patch_environment_dis = patch_object.get_patch_microsites_environment_values(environment_name)
-            meta_environment_dis = np.append(meta_environment_dis, patch_environment_dis.reshape(-1))
-        return meta_environment_dis
-        
-    def get_meta_microsites_optimum_sp_id_val(self, species_2_phenotype_ls):
+        if out is None:
+            out = np.empty(self.get_meta_size())
+        for patch_object, patch_out in zip(self.set.values(), self.meta_patches_out_ls(out)):
+            patch_object.get_patch_microsites_individals_phenotype_values(trait_name, out=patch_out)
+        np.around(out, 3, out=out) # saving the storage
+        return out
+
+    def get_meta_microsite_environment_values(self, environment_name, out=None):
+        ''''''
+        if out is None:
+            out = np.empty(self.get_meta_size())
+        for patch_object, patch_out in zip(self.set.values(), self.meta_patches_out_ls(out)):
+            patch_object.get_patch_microsites_environment_values(environment_name, out=patch_out)
+        return out
+
+    def get_meta_microsites_optimum_sp_id_val(self, species_2_phenotype_ls, out=None):
         ''' '''
-        meta_optimum_sp_id_val_dis = np.array([])
-        for patch_id, patch_object in self.set.items():
-            patch_optimum_sp_id_val_dis = patch_object.get_patch_microsites_optimum_sp_id_value_array(species_2_phenotype_ls)
-            meta_optimum_sp_id_val_dis = np.append(meta_optimum_sp_id_val_dis, patch_optimum_sp_id_val_dis.reshape(-1))
-        return meta_optimum_sp_id_val_dis
+        if out is None:
+            out = np.empty(self.get_meta_size())
+        for patch_object, patch_out in zip(self.set.values(), self.meta_patches_out_ls(out)):
+            patch_object.get_patch_microsites_optimum_sp_id_value_array(species_2_phenotype_ls, out=patch_out)
+        return out
     
     def columns_patch_habitat_microsites_id(self):
         ''' return 3 lists of patch_id, h_id, microsite_id as the header of meta_sp_dis table '''
@@ -1268,7 +2025,7 @@ class metacommunity():
         mini_con_map = self.mini_span_tree()
         med_con_map = mini_con_map
         all_add_links = set(full_con_map.edges())-set(mini_con_map.edges())
-        add_links = random.sample(all_add_links, int(len(all_add_links)*add_links_propotion))
+        add_links = rng_sample(self.rng, sorted(all_add_links), int(len(all_add_links)*add_links_propotion))
         pos = self.get_all_patches_location()
         for edge in add_links:
             patch_id1, patch_id2 = edge[0], edge[1]
@@ -1480,7 +2237,7 @@ class metacommunity():
         
         for new_node_id in sorted_nodes_id_ls:
             if new_node_id not in repeated_nodes:
-                targets_nodes_id_ls = random.sample(repeated_nodes, m)
+                targets_nodes_id_ls = rng_sample(self.rng, repeated_nodes, m)
                 for new_node_id, targets_nodes_id in zip([new_node_id] * m, targets_nodes_id_ls):
                     location1 = pos[new_node_id]
                     location2 = pos[targets_nodes_id]
@@ -1831,7 +2588,7 @@ class metacommunity():
     def small_world_random_graph(self):
         regular_graph = self.k_factor_regular_random_network()
         pos = self.get_all_patches_location()     
-        small_world = nx.lattice_reference(G=regular_graph, niter=5, D=None, connectivity=True, seed=None)
+        small_world = nx.lattice_reference(G=regular_graph, niter=5, D=None, connectivity=True, seed=self.rng)
         nx.set_node_attributes(small_world, pos, name='position')
         return small_world
     
@@ -1840,8 +2597,8 @@ class metacommunity():
         ''' colonizing the metacommunity from propagules rains of mainland species pool '''
         propagules_rains_ls = species_pool_obj.generate_propagules_rain_ls(num=propagules_rain_num, reproduce_mode=reproduce_mode)
         meta_empty_sites_ls = self.get_meta_empty_sites_ls()
-        random.shuffle(propagules_rains_ls)
-        random.shuffle(meta_empty_sites_ls)
+        self.rng.shuffle(propagules_rains_ls)
+        self.rng.shuffle(meta_empty_sites_ls)
         counter = 0
         for indi_object, empty_site_pos in list(zip(propagules_rains_ls, meta_empty_sites_ls)):
             patch_id = empty_site_pos[0]
@@ -1851,34 +2608,29 @@ class metacommunity():
             self.set[patch_id].set[h_id].add_individual(indi_object = indi_object, len_id=len_id, wid_id=wid_id)
             counter += 1
             
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals colonizing the metacommunity from mainland; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        #print(log_info)
-        return log_info
+        return self.log_info('colonizing the metacommunity from mainland', counter)
     
     def pairwise_sexual_colonization_from_prpagules_rains(self, species_pool_obj, propagules_rain_num):
         ''' pairwise sexual parents colonizing the metacommunity from propagules rains of mainland species pool '''
         pairwise_num = int(propagules_rain_num/2)
         pairwise_propagules_rain_ls = species_pool_obj.generate_pairwise_sexual_propagules_rain_ls(pairwise_num) #[(female_obj, male_obj), ..., (female_obj, male_obj)]
-        meta_pairwise_empty_sites_ls = self.get_meta_pairwise_empty_sites_ls() # [(empty_site_1_pos, empty_site_2_pos) ... ] and the two sites are in the same habitat, and empty_site_1_pos = [(patch_id, h_id, len_id, wid_id)]
-        random.shuffle(pairwise_propagules_rain_ls)
-        random.shuffle(meta_pairwise_empty_sites_ls)
+        self.rng.shuffle(pairwise_propagules_rain_ls)
+        colonization_ls_ls = self.choose_pairwise_empty_sites(pairwise_propagules_rain_ls, [patch_object.get_patch_pairwise_empty_sites_num() for patch_object in self.patch_object_ls])
         counter = 0
-        for (female_obj, male_obj), (empty_site_1_pos, empty_site_2_pos) in list(zip(pairwise_propagules_rain_ls, meta_pairwise_empty_sites_ls)):
-            
-            site_1_patch_id, site_1_h_id, site_1_len_id, site_1_wid_id = empty_site_1_pos[0], empty_site_1_pos[1], empty_site_1_pos[2], empty_site_1_pos[3]
-            self.set[site_1_patch_id].set[site_1_h_id].add_individual(indi_object = female_obj, len_id=site_1_len_id, wid_id=site_1_wid_id)
-            
-            site_2_patch_id, site_2_h_id, site_2_len_id, site_2_wid_id = empty_site_2_pos[0], empty_site_2_pos[1], empty_site_2_pos[2], empty_site_2_pos[3]
-            self.set[site_2_patch_id].set[site_2_h_id].add_individual(indi_object = male_obj, len_id=site_2_len_id, wid_id=site_2_wid_id)
-            counter += 2
-        
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals colonizing the metacommunity from mainland; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        #print(log_info)
-        return log_info
+        for patch_object, colonization_ls in zip(self.patch_object_ls, colonization_ls_ls):
+            counter += patch_object.pairwise_empty_sites_colonize(colonization_ls)
+        return self.log_info('colonizing the metacommunity from mainland', counter)
+
+    def choose_pairwise_empty_sites(self, pairwise_propagules_rain_ls, pairs_num_ls):
+        ''' the pairwise propagules settle in pairs drawn at random among all the pairwise empty sites of the metacommunity, pairs_num_ls is the number of pairs of each patch.
+        return the colonization_ls of patch.pairwise_empty_sites_colonize() of every patch '''
+        bounds = np.cumsum(pairs_num_ls)
+        chosen = self.rng.choice(bounds[-1], min(len(pairwise_propagules_rain_ls), bounds[-1]), replace=False)
+        patch_index_arr = np.searchsorted(bounds, chosen, side='right')
+        colonization_ls_ls = [[] for patch_object in self.patch_object_ls]
+        for (female_obj, male_obj), i, k in zip(pairwise_propagules_rain_ls, patch_index_arr, chosen):
+            colonization_ls_ls[i].append((int(k - bounds[i] + pairs_num_ls[i]), female_obj, male_obj))
+        return colonization_ls_ls
 
 ###################################################################################
     def dist2disp_function(self, k, x):
@@ -1887,20 +2639,32 @@ class metacommunity():
         x is the distance between the two patches. '''
         return k * np.exp(-k*x)
     
-    def mat_around(self, matrix):       
-        for i in range(matrix.shape[0]):
-            for j in range(matrix.shape[1]):
-                if np.isnan(matrix[i, j]) == False:
-                    integer = int(matrix[i,j])
-                    demacial = matrix[i,j] - integer
-                    if np.random.uniform(0,1,1)[0] <= demacial:
-                        integer += 1
-                    else:
-                        pass
-                else:
-                    integer = 0
-                matrix[i, j] = integer
-        return matrix
+    def stochastic_round(self, matrix, conserve_axis=None):
+        '''
+        round every element of the matrix down or up at random such that its expectation is kept, np.nan is rounded to 0.
+        conserve_axis=None rounds the elements independently.
+        conserve_axis=1 (or 0) rounds the elements of each row (or column) together by systematic sampling with one random number per row (or column):
+        every element is still rounded up with the probability of its decimal part, and the sum of the rounded row (or column) 
+        is the stochastic rounding of the sum of the row (or column), thus integer sums, e.g. the number of emigrants or empty sites, are conserved exactly.
+        '''
+        values = np.nan_to_num(np.asarray(matrix, dtype=float), nan=0.0)
+        integer = np.floor(values)
+        demacial = values - integer
+        if conserve_axis is None:
+            rounded = integer + (self.rng.random(values.shape) < demacial)
+        elif conserve_axis == 1:
+            cum_demacial = np.around(np.cumsum(demacial, axis=1), 12) + self.rng.random((values.shape[0], 1))
+            rounded = integer + np.diff(np.floor(cum_demacial), axis=1, prepend=0)
+        elif conserve_axis == 0:
+            rounded = self.stochastic_round(values.T, conserve_axis=1).T
+        else:
+            raise ValueError('conserve_axis inputed is no found.')
+        if isinstance(matrix, np.matrix):
+            return np.asmatrix(rounded)
+        return rounded
+    
+    def mat_around(self, matrix):
+        return self.stochastic_round(matrix)
     
     def normalize_dispersal_among_patches_matrix(self, total_disp_among_rate, disp_kernal_matrix, axis):
         ''' normalize the elements (only for i≠j) in the disp_kernal_matrix 
@@ -1918,97 +2682,110 @@ class metacommunity():
         if axis == 1:
             return disp_rate_matrix.T
         
+    def graph_shape_key(self, graph_object):
+        ''' the numbers of the nodes and the edges of the graph, a cheap guard of the cached dispersal rate matrices against nodes or edges added or removed in place.
+        it is not a hash (see the function graph_fingerprint()), e.g., a changed edge weight is not seen, thus clear_disp_kernal_cache() is the only real invalidation. '''
+        return (graph_object.number_of_nodes(), graph_object.number_of_edges())
+
+    def clear_disp_kernal_cache(self):
+        ''' drop the cached dispersal rate matrices, it must be called when a graph object is modified in place (e.g., its edge weights), see graph_shape_key() '''
+        self.disp_kernal_cache = {}
+
+    def __setstate__(self, state):
+        ''' the cache is keyed by id(graph_object), which is changed by pickle and copy, thus the keys are rebuilt from the graph objects kept in the cache '''
+        self.__dict__.update(state)
+        self.disp_kernal_cache = {(id(cache[0]),) + key[1:]:cache for key, cache in self.disp_kernal_cache.items()}
+
     def emigrant_disp_rate_matrix(self, total_disp_among_rate, disp_kernal, graph_object):
         ''' return emigrant_dispersal_rate_matrix.
-        the elements D_ij (row_i, col_j) in the matric means the probability that 
+        the elements D_ij (row_i, col_j) in the matric means the probability that
         the emigrants to patch j of the all emigrants (offspings) from patch i.
-        the row vector of the matrix is idendity vector. '''
+        the row vector of the matrix is idendity vector.
+        the matrix is computed once for each graph_object, disp_kernal and total_disp_among_rate and cached as a read-only matrix. '''
+        key = (id(graph_object), disp_kernal, total_disp_among_rate)
+        cache = self.disp_kernal_cache.get(key)
+        if cache is not None and cache[0] is graph_object and cache[1] == self.graph_shape_key(graph_object):
+            return cache[2]
         #dis_matrix = nx.adjacency_matrix(graph_object).todense()
         short_path_dis_matrix = nx.floyd_warshall_numpy(graph_object)[:self.patch_num, :self.patch_num]
         disp_kernal_matrix = self.dist2disp_function(disp_kernal, short_path_dis_matrix)
         disp_rate_matrix = self.normalize_dispersal_among_patches_matrix(total_disp_among_rate, disp_kernal_matrix, axis=1)
         #disp_rate_matrix = disp_kernal_matrix/disp_kernal_matrix.sum(axis=1)
+        disp_rate_matrix.setflags(write=False)
+        self.disp_kernal_cache[key] = (graph_object, self.graph_shape_key(graph_object), disp_rate_matrix)
         return disp_rate_matrix
     
     def emigrant_matrix_from_offsprings_pool(self, total_disp_among_rate, disp_kernal, graph_object):
         ''' 
-        patch_offs_num_matrix is a diagonal matrix, the nonzero elements in which represent the num of offspring in each patch
+        patch_offs_num_arr is the num of offspring in each patch
         emigrant_disp_rate_matrix is emigrant_dispersal_rate_matrix.
-        emigrant_matrix = patch_offs_num_matrix * emigrant_disp_rate_matrix
+        emigrant_matrix = diag(patch_offs_num_arr) * emigrant_disp_rate_matrix, i.e., the row i of emigrant_disp_rate_matrix is scaled by patch_offs_num_arr[i]
         the element(i,j) in the result matrix means, of all the emigrants patch i can provided, the nums of emigrants offsprings from patch i to patch j
         sum of row vector (i) is the num of all the offsprings in patch i
         '''
-        patch_offs_num_matrix = np.mat(np.zeros((self.patch_num, self.patch_num)))
-        index = 0
-        for patch_id in self.meta_map.nodes():
-            patch_object = self.set[patch_id]
+        patch_offs_num_arr = np.zeros(self.patch_num)
+        for index, patch_object in enumerate(self.patch_object_ls):
             patch_off_num = patch_object.patch_offsprings_num()
-            patch_offs_num_matrix[index, index] = patch_off_num
-            index+=1
-        return self.mat_around(patch_offs_num_matrix * self.emigrant_disp_rate_matrix(total_disp_among_rate, disp_kernal, graph_object))
+            patch_offs_num_arr[index] = patch_off_num
+        return self.stochastic_round(patch_offs_num_arr[:, np.newaxis] * self.emigrant_disp_rate_matrix(total_disp_among_rate, disp_kernal, graph_object), conserve_axis=1)
     
     def emigrant_matrix_expectation_asexual(self, total_disp_among_rate, disp_kernal, graph_object):
         ''''''
-        patch_offs_num_matrix = np.mat(np.zeros((self.patch_num, self.patch_num)))
-        index = 0
-        for patch_id in self.meta_map.nodes():
-            patch_object = self.set[patch_id]
+        patch_offs_num_arr = np.zeros(self.patch_num)
+        for index, patch_object in enumerate(self.patch_object_ls):
             patch_off_num = patch_object.get_patch_individual_num() * patch_object.asexual_birth_rate
-            patch_offs_num_matrix[index, index] = patch_off_num
-            index+=1
-        return self.mat_around(patch_offs_num_matrix * self.emigrant_disp_rate_matrix(total_disp_among_rate, disp_kernal, graph_object))
+            patch_offs_num_arr[index] = patch_off_num
+        return self.stochastic_round(patch_offs_num_arr[:, np.newaxis] * self.emigrant_disp_rate_matrix(total_disp_among_rate, disp_kernal, graph_object), conserve_axis=1)
     
     def emigrant_matrix_expectation_sexual(self, total_disp_among_rate, disp_kernal, graph_object):
         ''''''
-        patch_offs_num_matrix = np.mat(np.zeros((self.patch_num, self.patch_num)))
-        index = 0
-        for patch_id in self.meta_map.nodes():
-            patch_object = self.set[patch_id]
+        patch_offs_num_arr = np.zeros(self.patch_num)
+        for index, patch_object in enumerate(self.patch_object_ls):
             patch_off_num = patch_object.get_patch_sexual_pairwise_parents_num() * patch_object.sexual_birth_rate
-            patch_offs_num_matrix[index, index] = patch_off_num
-            index+=1
-        return self.mat_around(patch_offs_num_matrix * self.emigrant_disp_rate_matrix(total_disp_among_rate, disp_kernal, graph_object))
+            patch_offs_num_arr[index] = patch_off_num
+        return self.stochastic_round(patch_offs_num_arr[:, np.newaxis] * self.emigrant_disp_rate_matrix(total_disp_among_rate, disp_kernal, graph_object), conserve_axis=1)
     
     def emigrant_matrix_expectation_mixed(self, total_disp_among_rate, disp_kernal, graph_object):
         ''''''
-        patch_offs_num_matrix = np.mat(np.zeros((self.patch_num, self.patch_num)))
-        index = 0
-        for patch_id in self.meta_map.nodes():
-            patch_object = self.set[patch_id]
-            patch_off_num = patch_object.get_patch_mixed_asexual_parent_num() * patch_object.asexual_birth_rate + patch_object.get_patch_mixed_sexual_pairwise_parents_num() * patch_object.sexual_birth_rate
-            logging.info(patch_id + 'asexual_parent_num='+ str(patch_object.get_patch_mixed_asexual_parent_num()) + '; sexual_parents_num=' + str(patch_object.get_patch_mixed_sexual_pairwise_parents_num()))
+        patch_offs_num_arr = np.zeros(self.patch_num)
+        for index, patch_object in enumerate(self.patch_object_ls):
+            asexual_parent_num, sexual_pairwise_parents_num = patch_object.get_patch_mixed_asexual_parent_num(), patch_object.get_patch_mixed_sexual_pairwise_parents_num()
+            patch_off_num = asexual_parent_num * patch_object.asexual_birth_rate + sexual_pairwise_parents_num * patch_object.sexual_birth_rate
+            logging.debug('%sasexual_parent_num=%d; sexual_parents_num=%d', patch_object.name, asexual_parent_num, sexual_pairwise_parents_num)
             
-            patch_offs_num_matrix[index, index] = patch_off_num
-            index += 1
-        #logging.info('patch_offs_num_matrix=')
-        #logging.info(patch_offs_num_matrix)
-        return self.mat_around(patch_offs_num_matrix * self.emigrant_disp_rate_matrix(total_disp_among_rate, disp_kernal, graph_object))
+            patch_offs_num_arr[index] = patch_off_num
+        #logging.info('patch_offs_num_arr=')
+        #logging.info(patch_offs_num_arr)
+        return self.stochastic_round(patch_offs_num_arr[:, np.newaxis] * self.emigrant_disp_rate_matrix(total_disp_among_rate, disp_kernal, graph_object), conserve_axis=1)
     
     def immigrant_matrix_to_patch_empty_sites(self, emigrants_matrix):
         '''
-        patch_empty_sites_num_matrix is a diagonal matrix, the nonzero elements in which represent the num of empty sites in each patch
+        patch_empty_sites_num_arr is the num of empty sites in each patch
         imigrant_dispersal_rate_matrix is imigrant_dispersal_rate_matrix
-        immigrant_matrix = imigrant_dispersal_rate_matrix * patch_empty_sites_num_matrix
+        immigrant_matrix = imigrant_dispersal_rate_matrix * diag(patch_empty_sites_num_arr), i.e., the column j is scaled by patch_empty_sites_num_arr[j]
         the element(i,j) in the result matrix means, of all the empty sites in patch j, the num of immigarnts from patch i
         sum of column vector (j) is the num of all the empty site in patch j 
         '''
-        patch_empty_sites_num_matrix = np.mat(np.zeros((self.patch_num, self.patch_num)))
-        index = 0
-        for patch_id in self.meta_map.nodes():
-            patch_object = self.set[patch_id]
+        patch_empty_sites_num_arr = np.zeros(self.patch_num)
+        for index, patch_object in enumerate(self.patch_object_ls):
             patch_empty_sites_num = patch_object.patch_empty_sites_num()
-            patch_empty_sites_num_matrix[index, index] = patch_empty_sites_num
-            index += 1
+            patch_empty_sites_num_arr[index] = patch_empty_sites_num
         #logging.info('EM/In,t = \n')
         #logging.info(emigrants_matrix/emigrants_matrix.sum(axis=0))
-        #logging.info('patch_empty_sites_num_matrix=')
-        #logging.info(patch_empty_sites_num_matrix)
-        immigrant_matrix = self.mat_around(emigrants_matrix/emigrants_matrix.sum(axis=0) * patch_empty_sites_num_matrix)
+        #logging.info('patch_empty_sites_num_arr=')
+        #logging.info(patch_empty_sites_num_arr)
+        immigrant_matrix = self.stochastic_round(emigrants_matrix/emigrants_matrix.sum(axis=0) * patch_empty_sites_num_arr, conserve_axis=0)
         # may warning that 'RuntimeWarning: invalid value encountered in true_divide' if 0/0=np.nan occurs in the early time_step
+        # the np.nan of a column without emigrants is kept in its column by the scaling, and stochastic_round() rounds it to 0
         immigrant_matrix[np.isnan(immigrant_matrix)] = 0
-        # we replaced np.nan into 0 to fixed the problem aboved.
         return immigrant_matrix
     
+    def meta_init_storage(self, pheno_names_ls, geno_len_ls):
+        ''' allocate the arrays of the array habitats, thus the offsprings (dicts of arrays) can be placed in the habitats which have not been colonized '''
+        for patch_id, patch_object in self.set.items():
+            patch_object.init_storage(pheno_names_ls, geno_len_ls)
+        return 0
+
     def meta_initialize(self, traits_num, pheno_names_ls, pheno_var_ls, geno_len_ls, reproduce_mode, species_2_phenotype_ls):
         for patch_id, patch_object in self.set.items():
             patch_object.patch_initialize(traits_num, pheno_names_ls, pheno_var_ls, geno_len_ls, reproduce_mode, species_2_phenotype_ls)
@@ -2036,28 +2813,19 @@ class metacommunity():
         return meta_pairwise_empty_sites_ls
         
     def show_meta_empty_sites_num(self):
-        return len(self.get_meta_empty_sites_ls())
+        return self.counters['empty_sites']
     
     def meta_mixed_asex_and_sex_parents_num(self):
         ''''''
-        asex_num = 0
-        sex_num = 0
-        for patch_id, patch_object in self.set.items():
-            asex_num += patch_object.get_patch_mixed_asexual_parent_num()
-            sex_num += patch_object.get_patch_mixed_sexual_pairwise_parents_num()*2
-        log_info = 'there are %d asexual parents in the metacommunity; there are %d sexual parents in the metacommunity'%(asex_num, sex_num)
-        #print(log_info)
-        return log_info
+        asex_num = self.counters['asexual_parents']
+        sex_num = self.counters['mixed_mating_pairs']*2
+        return lazy_log_message('there are %d asexual parents in the metacommunity; there are %d sexual parents in the metacommunity', asex_num, sex_num)
     
     def meta_dead_selection(self, base_dead_rate, fitness_wid):
         counter = 0
         for patch_id, patch_object in self.set.items():
             counter += patch_object.patch_dead_selection(base_dead_rate, fitness_wid)
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals dead in selection; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        #print(log_info)
-        return log_info
+        return self.log_info('dead in selection', counter)
     
     def meta_asex_reproduce_mutate(self, mutation_rate, pheno_var_ls):
         for patch_id, patch_object in self.set.items():
@@ -2075,36 +2843,30 @@ class metacommunity():
         immigrants_matrix = self.immigrant_matrix_to_patch_empty_sites(emigrants_matrix)
         migrants_matrix = np.minimum(emigrants_matrix, immigrants_matrix)
         counter = 0
+        patch_offspring_pool_ls = [patch_object.get_patch_offsprings_pool() for patch_object in self.patch_object_ls]
         # dispersal from patch i to patch j
-        for j in range(len(self.meta_map.nodes())):
-            patch_j_id = list(self.meta_map.nodes())[j]
-            patch_j_object = self.set[patch_j_id]
+        for j, patch_j_object in enumerate(self.patch_object_ls):
             patch_j_empty_site_ls = patch_j_object.get_patch_empty_sites_ls()
             migrants_indi_object_ls = []
             
-            for i in range(len(self.meta_map.nodes())):
-                patch_i_id = list(self.meta_map.nodes())[i]
-                patch_i_object = self.set[patch_i_id]
-                patch_i_offspring_pool = patch_i_object.get_patch_offsprings_pool()
+            for i in range(self.patch_num):
+                patch_i_offspring_pool = patch_offspring_pool_ls[i]
             
                 if i==j: 
                     continue
                 else:
                     migrants_num = int(migrants_matrix[i, j])
-                    migrants_indi_object_ls += random.sample(patch_i_offspring_pool, migrants_num)
+                    migrants_indi_object_ls += rng_sample(self.rng, patch_i_offspring_pool, migrants_num)
                     
-            random.shuffle(patch_j_empty_site_ls)
-            random.shuffle(migrants_indi_object_ls)
+            self.rng.shuffle(patch_j_empty_site_ls)
+            self.rng.shuffle(migrants_indi_object_ls)
             
             for (h_id, len_id, wid_id), migrants_object in list(zip(patch_j_empty_site_ls, migrants_indi_object_ls)):
-                self.set[patch_j_id].set[h_id].add_individual(indi_object = migrants_object, len_id=len_id, wid_id=wid_id)
+                patch_j_object.set[h_id].add_individual(indi_object = migrants_object, len_id=len_id, wid_id=wid_id)
                 #print(counter, patch_j_id, h_id, len_id, wid_id)  
                 counter += 1
                 
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        print('there are %d individuals disperse among patches; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num))
-        return 0
+        return self.log_info('disperse among patches', counter)
     
     def meta_disp_among_patches_from_dormancy_pool(self, disp_kernal, graph_object):
         pass
@@ -2117,10 +2879,7 @@ class metacommunity():
         for patch_id, patch_object in self.set.items():
             counter = patch_object.patch_disp_within_from_offsprings_pool(disp_within_rate, counter)
             
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        print('there are %d individuals disperse within patch; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num))
-        return 0
+        return self.log_info('disperse within patch', counter)
     
     def meta_disp_within_patches_from_dormancy_pool(self, disp_kernal, graph_object):
         pass
@@ -2135,15 +2894,11 @@ class metacommunity():
         migrants_matrix = np.minimum(emigrants_matrix, immigrants_matrix)
         self.disp_current_matrix += migrants_matrix
         counter = 0
-        for j in range(len(self.meta_map.nodes())):
-            patch_j_id = list(self.meta_map.nodes())[j]
-            patch_j_object = self.set[patch_j_id]
+        for j, patch_j_object in enumerate(self.patch_object_ls):
             patch_j_empty_site_ls = patch_j_object.get_patch_empty_sites_ls()
             migrants_indi_object_ls = []
             
-            for i in range(len(self.meta_map.nodes())):
-                patch_i_id = list(self.meta_map.nodes())[i]
-                patch_i_object = self.set[patch_i_id]
+            for i, patch_i_object in enumerate(self.patch_object_ls):
                 if i==j: 
                     continue
                 else:
@@ -2151,18 +2906,15 @@ class metacommunity():
                     patch_i_offspring_pool = patch_i_object.asex_reproduce_mutate_for_dispersal_among_patches(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, patch_offs_num=migrants_num)
                     migrants_indi_object_ls += patch_i_offspring_pool
                     #print('%d-%d=%d'%(migrants_num, len(patch_i_offspring_pool), migrants_num-len(patch_i_offspring_pool)))
-            random.shuffle(patch_j_empty_site_ls)
-            random.shuffle(migrants_indi_object_ls)
+            self.rng.shuffle(patch_j_empty_site_ls)
+            self.rng.shuffle(migrants_indi_object_ls)
             
             for (h_id, len_id, wid_id), migrants_object in list(zip(patch_j_empty_site_ls, migrants_indi_object_ls)):
-                self.set[patch_j_id].set[h_id].add_individual(indi_object = migrants_object, len_id=len_id, wid_id=wid_id)
+                patch_j_object.set[h_id].add_individual(indi_object = migrants_object, len_id=len_id, wid_id=wid_id)
                 #print(counter, patch_j_id, h_id, len_id, wid_id)  
                 counter += 1
                 
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals disperse among patches; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        return log_info
+        return self.log_info('disperse among patches', counter)
     
     def meta_sexual_reproduce_mutate_and_dispersal_among_patches(self, mutation_rate, pheno_var_ls, total_disp_among_rate, disp_kernal, graph_object):
         emigrants_matrix =  self.emigrant_matrix_expectation_sexual(total_disp_among_rate, disp_kernal, graph_object)
@@ -2170,15 +2922,11 @@ class metacommunity():
         migrants_matrix = np.minimum(emigrants_matrix, immigrants_matrix)
         
         counter = 0
-        for j in range(len(self.meta_map.nodes())):
-            patch_j_id = list(self.meta_map.nodes())[j]
-            patch_j_object = self.set[patch_j_id]
+        for j, patch_j_object in enumerate(self.patch_object_ls):
             patch_j_empty_site_ls = patch_j_object.get_patch_empty_sites_ls()
             migrants_indi_object_ls = []
             
-            for i in range(len(self.meta_map.nodes())):
-                patch_i_id = list(self.meta_map.nodes())[i]
-                patch_i_object = self.set[patch_i_id]
+            for i, patch_i_object in enumerate(self.patch_object_ls):
                 if i==j: 
                     continue
                 else:
@@ -2186,33 +2934,26 @@ class metacommunity():
                     patch_i_offspring_pool = patch_i_object.sex_reproduce_mutate_for_dispersal_among_patches(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, patch_offs_num=migrants_num)
                     migrants_indi_object_ls += patch_i_offspring_pool
                     #print('%d-%d=%d'%(migrants_num, len(patch_i_offspring_pool), migrants_num-len(patch_i_offspring_pool)))
-            random.shuffle(patch_j_empty_site_ls)
-            random.shuffle(migrants_indi_object_ls)
+            self.rng.shuffle(patch_j_empty_site_ls)
+            self.rng.shuffle(migrants_indi_object_ls)
             
             for (h_id, len_id, wid_id), migrants_object in list(zip(patch_j_empty_site_ls, migrants_indi_object_ls)):
-                self.set[patch_j_id].set[h_id].add_individual(indi_object = migrants_object, len_id=len_id, wid_id=wid_id) 
+                patch_j_object.set[h_id].add_individual(indi_object = migrants_object, len_id=len_id, wid_id=wid_id) 
                 counter += 1
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals disperse among patches; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        return log_info
+        return self.log_info('disperse among patches', counter)
     
     def meta_mixed_reproduce_mutate_and_dispersal_among_patches(self, mutation_rate, pheno_var_ls, total_disp_among_rate, disp_kernal, graph_object):
         emigrants_matrix = self.emigrant_matrix_expectation_mixed(total_disp_among_rate, disp_kernal, graph_object)
         immigrants_matrix = self.immigrant_matrix_to_patch_empty_sites(emigrants_matrix)
         migrants_matrix = np.minimum(emigrants_matrix, immigrants_matrix)
-        logging.info('emigrants_matrix=\n'+ str(emigrants_matrix) + 'immigrants_matrix=\n' +str(immigrants_matrix) + 'migrants_matrix=\n' + str(migrants_matrix))
+        logging.debug('emigrants_matrix=\n%simmigrants_matrix=\n%smigrants_matrix=\n%s', emigrants_matrix, immigrants_matrix, migrants_matrix)
         
         counter = 0
-        for j in range(len(self.meta_map.nodes())):
-            patch_j_id = list(self.meta_map.nodes())[j]
-            patch_j_object = self.set[patch_j_id]
+        for j, patch_j_object in enumerate(self.patch_object_ls):
             patch_j_empty_site_ls = patch_j_object.get_patch_empty_sites_ls()
             migrants_indi_object_ls = []
             
-            for i in range(len(self.meta_map.nodes())):
-                patch_i_id = list(self.meta_map.nodes())[i]
-                patch_i_object = self.set[patch_i_id]
+            for i, patch_i_object in enumerate(self.patch_object_ls):
                 if i==j: 
                     continue
                 else:
@@ -2220,119 +2961,164 @@ class metacommunity():
                     patch_i_offspring_pool = patch_i_object.mixed_reproduce_mutate_for_dispersal_among_patches(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, patch_offs_num=migrants_num)
                     migrants_indi_object_ls += patch_i_offspring_pool
                     #print('%d-%d=%d'%(migrants_num, len(patch_i_offspring_pool), migrants_num-len(patch_i_offspring_pool)))
-            random.shuffle(patch_j_empty_site_ls)
-            random.shuffle(migrants_indi_object_ls)
+            self.rng.shuffle(patch_j_empty_site_ls)
+            self.rng.shuffle(migrants_indi_object_ls)
 
             for (h_id, len_id, wid_id), migrants_object in list(zip(patch_j_empty_site_ls, migrants_indi_object_ls)):
-                self.set[patch_j_id].set[h_id].add_individual(indi_object = migrants_object, len_id=len_id, wid_id=wid_id) 
+                patch_j_object.set[h_id].add_individual(indi_object = migrants_object, len_id=len_id, wid_id=wid_id) 
                 counter += 1
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals disperse among patches; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        #print(log_info)
-        return log_info
+        return self.log_info('disperse among patches', counter)
+
+    def meta_reproduce_mutate_and_multinomial_dispersal_among_patches(self, reproduce_mode, mutation_rate, pheno_var_ls, total_disp_among_rate, disp_kernal, graph_object):
+        '''
+        dispersal among patches drawn per source patch, reproduce_mode is 'asexual', 'sexual' or 'mixed'.
+        the offspring number of every habitat (and reproduction kind) is the stochastic rounding of its expectation,
+        and the target patches of the offspring are a multinomial draw from the row of the source patch in the dispersal rate matrix;
+        the offspring staying in the source patch are dropped as the local births are processed by the other processes,
+        but they still compete with the immigrants for the empty sites as in immigrant_matrix_to_patch_empty_sites():
+        the empty sites of a patch are drawn at random among its arrivals and its home offspring, and only the arrivals drawn are kept.
+        then every habitat produces all its emigrants in one batch (a dict of arrays for array_habitat), and the migrants of every target patch settle in its empty sites by one permutation.
+        the offspring numbers are drawn from the generator of the metacommunity, the emigrants and the settlement from those of the source and target patches.
+        '''
+        patch_sources_ls_ls = [patch_object.get_emigrant_sources_ls(reproduce_mode) for patch_object in self.patch_object_ls] # [(h_object, reproduce_kind, offs_expectation_num)] of every patch
+        source_index_ls, counts_matrix = self.multinomial_migrants_counts_matrix(total_disp_among_rate, disp_kernal, graph_object,
+                                                                                 [[offs_expectation_num for h_object, reproduce_kind, offs_expectation_num in patch_sources_ls] for patch_sources_ls in patch_sources_ls_ls],
+                                                                                 [patch_object.patch_empty_sites_num() for patch_object in self.patch_object_ls])
+        migrants_matrix = np.zeros((self.patch_num, self.patch_num))
+        migrants_ls_ls = [[] for j in range(self.patch_num)]
+        for (i, n), counts in zip(source_index_ls, counts_matrix):
+            h_object, reproduce_kind, offs_expectation_num = patch_sources_ls_ls[i][n]
+            if counts.sum() == 0:
+                continue
+            hab_disp_pool = h_object.hab_reproduce_mutate_for_emigrants(reproduce_kind, mutation_rate, pheno_var_ls, int(counts.sum()))
+            for j, migrants in zip(np.flatnonzero(counts), h_object.split_offspring(hab_disp_pool, counts[counts > 0])):
+                migrants_ls_ls[j].append(migrants)
+                migrants_matrix[i, j] += h_object.offspring_num(migrants)
+        self.disp_current_matrix += migrants_matrix
+
+        counter = 0
+        for j, patch_j_object in enumerate(self.patch_object_ls):
+            counter += patch_j_object.settle_migrants(migrants_ls_ls[j])
+        return self.log_info('disperse among patches', counter)
+
+    def multinomial_migrants_counts_matrix(self, total_disp_among_rate, disp_kernal, graph_object, offs_expectation_ls_ls, empty_sites_num_ls):
+        '''
+        the offspring numbers of the dispersal among patches, see meta_reproduce_mutate_and_multinomial_dispersal_among_patches().
+        offs_expectation_ls_ls[i] is the expected offspring numbers of the sources (habitats and reproduction kinds) of the patch i,
+        empty_sites_num_ls[j] is the number of the empty sites of the patch j. all the numbers are drawn from the generator of the metacommunity.
+        return (source_index_ls, counts_matrix), the row k of counts_matrix [sources x target patches] is the migrants of the n-th source of the patch i to every patch,
+        where (i, n) = source_index_ls[k], the offspring staying in their source patch are not in counts_matrix.
+        '''
+        disp_rate_matrix = np.nan_to_num(np.asarray(self.emigrant_disp_rate_matrix(total_disp_among_rate, disp_kernal, graph_object)), nan=0.0) # np.nan occurs for the isolated patches
+        source_index_ls = []
+        counts_ls = []                                    # offspring numbers of each source to each target patch
+        home_num_arr = np.zeros(self.patch_num, dtype=int) # offspring numbers staying in their source patch
+        for i, offs_expectation_ls in enumerate(offs_expectation_ls_ls):
+            if len(offs_expectation_ls) == 0 or disp_rate_matrix[i].sum() == 0:
+                continue
+            offs_num_arr = self.stochastic_round(np.array(offs_expectation_ls)).astype(int)
+            counts_arr = self.rng.multinomial(offs_num_arr, disp_rate_matrix[i]/disp_rate_matrix[i].sum())
+            home_num_arr[i] = counts_arr[:, i].sum()
+            counts_arr[:, i] = 0
+            source_index_ls += [(i, n) for n in range(len(offs_expectation_ls))]
+            counts_ls += list(counts_arr)
+        counts_matrix = np.array(counts_ls, dtype=int).reshape(-1, self.patch_num)   # [sources x target patches]
+
+        for j, empty_sites_num in enumerate(empty_sites_num_ls):
+            arrivals = counts_matrix[:, j]
+            if arrivals.sum() + home_num_arr[j] > empty_sites_num:
+                kept = self.rng.choice(arrivals.sum() + home_num_arr[j], empty_sites_num, replace=False)
+                kept = kept[kept < arrivals.sum()]
+                counts_matrix[:, j] = np.bincount(np.repeat(np.arange(len(arrivals)), arrivals)[kept], minlength=len(arrivals))
+        return source_index_ls, counts_matrix
 
     def meta_asexual_birth_disp_within_patches(self, mutation_rate, pheno_var_ls, disp_within_rate):
         counter = 0
         for patch_id, patch_object in self.set.items():
             counter = patch_object.asex_reproduce_mutate_for_dispersal_within_patch(mutation_rate, pheno_var_ls, disp_within_rate, counter)
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals disperse within patches; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        #print(log_info)
-        return log_info
+        return self.log_info('disperse within patches', counter)
     
     def meta_sexual_birth_disp_within_patches(self, mutation_rate, pheno_var_ls, disp_within_rate):
         counter = 0
         for patch_id, patch_object in self.set.items():
             counter += patch_object.sex_reproduce_mutate_for_dispersal_within_patch(mutation_rate, pheno_var_ls, disp_within_rate)
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals disperse within patches; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        #print(log_info)
-        return log_info
+        return self.log_info('disperse within patches', counter)
     
     def meta_mixed_birth_disp_within_patches(self, mutation_rate, pheno_var_ls, disp_within_rate):
         counter = 0
         for patch_id, patch_object in self.set.items():
             counter += patch_object.mixed_reproduce_mutate_for_dispersal_within_patch(mutation_rate, pheno_var_ls, disp_within_rate)
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals disperse within patches; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        #print(log_info)
-        return log_info
+        return self.log_info('disperse within patches', counter)
             
     def meta_germinate_from_offsprings_pool(self):
         counter = 0
         for patch_id, patch_object in self.set.items():
             counter += patch_object.patch_germinate_from_offsprings_pool()
             
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        print('there are %d individuals germinating from local offsprings pool; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num))
-        return 0
+        return self.log_info('germinating from local offsprings pool', counter)
     
     def meta_asexual_birth_mutate_germinate(self, mutation_rate, pheno_var_ls):
         counter = 0
         for patch_id, patch_object in self.set.items():
             counter += patch_object.patch_asexual_birth_germinate(mutation_rate, pheno_var_ls)
         
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals germinating from local habitat; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        return log_info
+        return self.log_info('germinating from local habitat', counter)
     
     def meta_sexual_birth_mutate_germinate(self, mutation_rate, pheno_var_ls):
         counter = 0
         for patch_id, patch_object in self.set.items():
             counter += patch_object.patch_sexual_birth_germinate(mutation_rate, pheno_var_ls)
             
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals germinating from local habitat; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        #print(log_info)
-        return log_info
+        return self.log_info('germinating from local habitat', counter)
     
     def meta_mixed_birth_mutate_germinate(self, mutation_rate, pheno_var_ls):
         counter = 0
         for patch_id, patch_object in self.set.items():
             counter += patch_object.patch_mixed_birth_germinate(mutation_rate, pheno_var_ls)
         
-        indi_num = self.get_meta_individual_num()
-        empty_sites_num = self.show_meta_empty_sites_num()
-        log_info = 'there are %d individuals germinating from local habitat; there are %d individuals in the metacommunity; there are %d empty sites in the metacommunity'%(counter, indi_num, empty_sites_num)
-        #print(log_info)
-        return log_info
+        return self.log_info('germinating from local habitat', counter)
+
+    def meta_mixed_birth_disp_within_and_germinate(self, mutation_rate, pheno_var_ls, disp_within_rate):
+        ''' meta_mixed_birth_disp_within_patches() followed by meta_mixed_birth_mutate_germinate(), return the log messages of both '''
+        return self.meta_mixed_birth_disp_within_patches(mutation_rate, pheno_var_ls, disp_within_rate), self.meta_mixed_birth_mutate_germinate(mutation_rate, pheno_var_ls)
     
 ####################################################################################################################################################
 class species_pool():
-    def __init__(self, species_num, standar_species_ls):
+    def __init__(self, species_num, standar_species_ls, rng=None):
         self.species_num = species_num
         self.standar_species_ls = standar_species_ls
+        self.rng = np.random.default_rng() if rng is None else rng     # the np.random.Generator of the propagules
+    
+    def set_rng(self, rng):
+        self.rng = rng
+        return 0
     
     def generate_propagules_rain_ls(self, num, reproduce_mode):
         propagules_rain_ls = []
+        species_index_arr = self.rng.integers(0, len(self.standar_species_ls), size=num)
+        gender_arr = self.rng.integers(0, 2, size=num)
         for i in range(num):
             if reproduce_mode == 'asexual': gender = 'female'
-            if reproduce_mode == 'sexual': gender = random.sample(('male', 'female'), 1)[0]
+            if reproduce_mode == 'sexual': gender = ('male', 'female')[gender_arr[i]]
         
-            standar_species_object = random.sample(self.standar_species_ls, 1)[0]
+            standar_species_object = self.standar_species_ls[species_index_arr[i]]
             individual_object = individual(species_id=standar_species_object.species_id, traits_num=standar_species_object.traits_num, pheno_names_ls=standar_species_object.pheno_names_ls, gender=gender)
-            individual_object.random_init_indi(mean_pheno_val_ls=standar_species_object.mean_pheno_val_ls, pheno_var_ls=standar_species_object.pheno_var_ls, geno_len_ls=standar_species_object.geno_len_ls)
+            individual_object.random_init_indi(mean_pheno_val_ls=standar_species_object.mean_pheno_val_ls, pheno_var_ls=standar_species_object.pheno_var_ls, geno_len_ls=standar_species_object.geno_len_ls, rng=self.rng)
 
             propagules_rain_ls.append(individual_object)
         return propagules_rain_ls
     
     def generate_pairwise_sexual_propagules_rain_ls(self, pairwise_num):
         pairwise_propagules_rain_ls = []
+        species_index_arr = self.rng.integers(0, len(self.standar_species_ls), size=pairwise_num)
         for i in range(pairwise_num):
-            standar_species_object = random.sample(self.standar_species_ls, 1)[0]
+            standar_species_object = self.standar_species_ls[species_index_arr[i]]
             
             female_individual_obj = individual(species_id=standar_species_object.species_id, traits_num=standar_species_object.traits_num, pheno_names_ls=standar_species_object.pheno_names_ls, gender='female')
-            female_individual_obj.random_init_indi(mean_pheno_val_ls=standar_species_object.mean_pheno_val_ls, pheno_var_ls=standar_species_object.pheno_var_ls, geno_len_ls=standar_species_object.geno_len_ls)
+            female_individual_obj.random_init_indi(mean_pheno_val_ls=standar_species_object.mean_pheno_val_ls, pheno_var_ls=standar_species_object.pheno_var_ls, geno_len_ls=standar_species_object.geno_len_ls, rng=self.rng)
             
             male_individual_obj = individual(species_id=standar_species_object.species_id, traits_num=standar_species_object.traits_num, pheno_names_ls=standar_species_object.pheno_names_ls, gender='male')
-            male_individual_obj.random_init_indi(mean_pheno_val_ls=standar_species_object.mean_pheno_val_ls, pheno_var_ls=standar_species_object.pheno_var_ls, geno_len_ls=standar_species_object.geno_len_ls)
+            male_individual_obj.random_init_indi(mean_pheno_val_ls=standar_species_object.mean_pheno_val_ls, pheno_var_ls=standar_species_object.pheno_var_ls, geno_len_ls=standar_species_object.geno_len_ls, rng=self.rng)
             
             pairwise_individuals_object = (female_individual_obj, male_individual_obj)
             pairwise_propagules_rain_ls.append(pairwise_individuals_object)
@@ -2350,20 +3136,27 @@ class species():
         self.geno_len_ls = geno_len_ls
         
 class individual():
-    def __init__(self, species_id, traits_num, pheno_names_ls, gender='female', genotype_set=None, phenotype_set=None):
+    def __init__(self, species_id, traits_num, pheno_names_ls, gender='female', genotype_set=None, phenotype_set=None, geno_len_ls=None):
+        '''
+        genotype_set is {pheno_name: bi_genotype} and each bi_genotype is a bit-packed uint64 array of shape (2, words), see pack_bi_genotype().
+        geno_len_ls (tuple) is the number of loci of each genotype, which is needed to unpack the genotypes.
+        '''
         self.species_id = species_id
+        self.species_code = species_registry_object.get_code(species_id)
         self.gender = gender
         self.traits_num = traits_num
         self.pheno_names_ls = pheno_names_ls
         self.genotype_set = genotype_set
         self.phenotype_set = phenotype_set
+        self.geno_len_ls = geno_len_ls
         
-    def random_init_indi(self, mean_pheno_val_ls, pheno_var_ls, geno_len_ls):
+    def random_init_indi(self, mean_pheno_val_ls, pheno_var_ls, geno_len_ls, rng):
         '''
         pheno_names is a tuple of the pheno_names (string) i.e., ('phenotye_1', 'phenotype_2',...,'phenotye_x') and the len(pheno_names) is equal to traits_num.
         mean_pheno_val (tuple) is the mean values (float) of the phenotypes of a species population which fit a gaussian distribution, i.e., (val1, val2,...,valx).
         pheno_var (tuple) is the variation (float) of the phenotypes of a species population which fit a gaussian distribution.
         geno_len (tuple) is the len of each genotype in the genotype_set, the genotype in which controls each phenotype of each trait.
+        rng is the np.random.Generator of the random loci and phenotypes.
         '''
         genotype_set = {}
         phenotype_set = {}
@@ -2378,30 +3171,44 @@ class individual():
             #genotype = np.array([1 if i in random_index else 0 for i in range(geno_len*2)])
             #bi_genotype = [genotype[0:geno_len], genotype[geno_len:geno_len*2]]
             
-            random_index_1 = random.sample(range(0,geno_len),int(mean*geno_len))
-            random_index_2 = random.sample(range(0,geno_len),int(mean*geno_len))
-            genotype_1 = np.array([1 if i in random_index_1 else 0 for i in range(geno_len)])
-            genotype_2 = np.array([1 if i in random_index_2 else 0 for i in range(geno_len)])
+            random_index_1 = rng.choice(geno_len, int(mean*geno_len), replace=False)
+            random_index_2 = rng.choice(geno_len, int(mean*geno_len), replace=False)
+            genotype_1 = np.zeros(geno_len, dtype=np.uint8)
+            genotype_2 = np.zeros(geno_len, dtype=np.uint8)
+            genotype_1[random_index_1] = 1
+            genotype_2[random_index_2] = 1
             
-            bi_genotype = [genotype_1, genotype_2]
-            phenotype = mean + random.gauss(0, var)
+            bi_genotype = pack_bi_genotype([genotype_1, genotype_2])
+            phenotype = mean + rng.normal(0, var)
             
             genotype_set[name] = bi_genotype
             phenotype_set[name] = phenotype
         self.genotype_set = genotype_set
         self.phenotype_set = phenotype_set
+        self.geno_len_ls = tuple(geno_len_ls)
         return 0
     
     def __str__(self):
         species_id_str = 'speceis_id=%s'%self.species_id
         gender_str = 'gender=%s'%self.gender
         traits_num_str = 'traits_num=%d'%self.traits_num
-        genotype_set_str = 'genetype_set=%s'%str(self.genotype_set)
+        genotype_set_str = 'genetype_set=%s'%str({pheno_name:self.get_bi_genotype_ls(pheno_name) for pheno_name in self.pheno_names_ls})
         phenotype_set_str = 'phenotype_set=%s'%str(self.phenotype_set)
         
         strings = species_id_str+'\n'+ gender_str+'\n'+traits_num_str+'\n'+genotype_set_str+'\n'+phenotype_set_str
         return strings
     
+    def clone_for_offspring(self, pheno_var_ls, rng):
+        ''' return an asexual offspring. the offspring shares the species_id, pheno_names_ls and the packed genotype buffers with the parent
+        (batch_mutation() copies a buffer before flipping it) and its phenotypes are drawn from the genotypes, see asexual_offspring_ls(). '''
+        return asexual_offspring_ls([self], pheno_var_ls, rng)[0]
+    
+    @classmethod
+    def from_parents(cls, female_indi_obj, male_indi_obj, pheno_var_ls, rng):
+        ''' return a sexual offspring of the pairwise parents. the offspring takes one genotype of each parent for every trait, 
+        its gender is random and its phenotypes are drawn from the new bi_genotypes, see sexual_offspring_ls(). '''
+        return sexual_offspring_ls([(female_indi_obj, male_indi_obj)], pheno_var_ls, rng)[0]
+    
     def get_indi_phenotype_ls(self):
         indi_phenotype_ls = []
         for pheno_name in self.pheno_names_ls:
@@ -2409,45 +3216,546 @@ class individual():
             indi_phenotype_ls.append(phenotype)
         return indi_phenotype_ls
     
-    def mutation(self, rate, pheno_var_ls):
-        for i in range(self.traits_num):
-            mutation_counter = 0
-            pheno_name = self.pheno_names_ls[i]
-            var = pheno_var_ls[i]
-            genotype1 = self.genotype_set[pheno_name][0]
-            genotype2 = self.genotype_set[pheno_name][1]
-            for index in range(len(genotype1)):
-                if rate > np.random.uniform(0,1,1)[0]:
-                    mutation_counter += 1
-                    if genotype1[index] == 0: self.genotype_set[pheno_name][0][index]=1
-                    elif genotype1[index] == 1: self.genotype_set[pheno_name][0][index]=0
-                    
-            for index in range(len(genotype2)):
-                if rate > np.random.uniform(0,1,1)[0]:
-                    mutation_counter += 1
-                    if genotype2[index] == 0: self.genotype_set[pheno_name][1][index]=1
-                    elif genotype2[index] == 1: self.genotype_set[pheno_name][1][index]=0
-            if mutation_counter >=1: 
-                phenotype = np.mean(self.genotype_set[pheno_name]) + random.gauss(0, var)
-                self.phenotype_set[pheno_name] = phenotype
+    def get_geno_len(self, pheno_name):
+        return self.geno_len_ls[self.pheno_names_ls.index(pheno_name)]
+    
+    def get_genotype_mean(self, pheno_name):
+        ''' np.mean() of the bi_genotype of the trait, i.e., the proportion of 1 alleles counted by popcount '''
+        return popcount(self.genotype_set[pheno_name]).sum()/(2*self.get_geno_len(pheno_name))
+    
+    def get_gamete(self, pheno_name, rng):
+        ''' return one of the two packed genotypes of the trait at random for sexual reproduction '''
+        return self.genotype_set[pheno_name][rng.integers(2)]
+    
+    def get_bi_genotype_ls(self, pheno_name):
+        ''' return the bi_genotype of the trait as [np.array, np.array] of 0/1 loci '''
+        return unpack_bi_genotype(self.genotype_set[pheno_name], self.get_geno_len(pheno_name))
+    
+    def set_bi_genotype_ls(self, pheno_name, bi_genotype):
+        ''' set the bi_genotype of the trait from [np.array, np.array] of 0/1 loci '''
+        self.genotype_set[pheno_name] = pack_bi_genotype(bi_genotype)
+        return 0
+    
+    def mutation(self, rate, pheno_var_ls, rng):
+        ''' every locus of the two genotypes mutates with the probability of rate, see batch_mutation() '''
+        batch_mutation([self], rate, pheno_var_ls, rng)
         return 0
             
+##################################################################################################
+##################### bit-packed genotype #####################
+# the loci of a genotype are packed into uint64 words, the locus i is the bit (i % 64) of the word (i // 64).
+# the leading dims of the arrays are kept, e.g., a [sites x traits x 2 x loci] bit matrix is packed into [sites x traits x 2 x words].
+genotype_bit_shifts = np.arange(64, dtype=np.uint64)
+popcount_table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def genotype_words_num(geno_len):
+    return (geno_len + 63)//64
+
+def pack_genotype(genotype):
+    ''' 0/1 loci array (..., loci) -> uint64 words array (..., words) '''
+    genotype = np.asarray(genotype, dtype=np.uint64)
+    geno_len = genotype.shape[-1]
+    words_num = genotype_words_num(geno_len)
+    padding = [(0, 0)] * (genotype.ndim-1) + [(0, words_num*64 - geno_len)]
+    bits = np.pad(genotype, padding).reshape(genotype.shape[:-1] + (words_num, 64))
+    return np.bitwise_or.reduce(bits << genotype_bit_shifts, axis=-1)
+
+def unpack_genotype(words, geno_len):
+    ''' uint64 words array (..., words) -> 0/1 loci array (..., geno_len) '''
+    words = np.asarray(words, dtype=np.uint64)
+    bits = (words[..., None] >> genotype_bit_shifts) & np.uint64(1)
+    return bits.reshape(words.shape[:-1] + (words.shape[-1]*64, ))[..., :geno_len].astype(np.uint8)
+
+def pack_bi_genotype(bi_genotype):
+    ''' [np.array, np.array] of 0/1 loci -> uint64 array of shape (2, words) '''
+    return pack_genotype(np.stack(bi_genotype))
+
+def unpack_bi_genotype(packed_bi_genotype, geno_len):
+    ''' uint64 array of shape (2, words) -> [np.array, np.array] of 0/1 loci '''
+    genotype_1, genotype_2 = unpack_genotype(packed_bi_genotype, geno_len)
+    return [genotype_1, genotype_2]
+
+def popcount(words):
+    ''' number of 1 bits in each uint64 word '''
+    words = np.asarray(words, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):                       # numpy >= 2.0
+        return np.bitwise_count(words)
+    words = np.ascontiguousarray(words)
+    return popcount_table[words.view(np.uint8)].reshape(words.shape + (8, )).sum(axis=-1)
+
+##################### batch offspring #####################
+# the offsprings produced in a phase are made at once, the random genders, gametes and phenotype noises of all of them are drawn by one call of the generator each.
+def asexual_offspring_ls(parent_ls, pheno_var_ls, rng):
+    ''' return one asexual offspring of every individual object in parent_ls, the phenotypes are the genotype means plus the gaussian noises '''
+    if len(parent_ls) == 0:
+        return []
+    traits_num = parent_ls[0].traits_num
+    noise_arr = rng.normal(0, pheno_var_ls[:traits_num], size=(len(parent_ls), traits_num))
+    offspring_ls = []
+    for parent, noise in zip(parent_ls, noise_arr):
+        phenotype_set = {pheno_name:parent.get_genotype_mean(pheno_name) + noise[i] for i, pheno_name in enumerate(parent.pheno_names_ls)}
+        offspring_ls.append(individual(species_id=parent.species_id, traits_num=parent.traits_num, pheno_names_ls=parent.pheno_names_ls, gender=parent.gender, 
+                                       genotype_set=dict(parent.genotype_set), phenotype_set=phenotype_set, geno_len_ls=parent.geno_len_ls))
+    return offspring_ls
+
+def sexual_offspring_ls(pairwise_parents_ls, pheno_var_ls, rng):
+    ''' return one sexual offspring of every (female_indi_obj, male_indi_obj) in pairwise_parents_ls, 
+    the offspring takes one of the two packed genotypes of each parent (see individual.get_gamete()) for every trait '''
+    if len(pairwise_parents_ls) == 0:
+        return []
+    num = len(pairwise_parents_ls)
+    traits_num = pairwise_parents_ls[0][0].traits_num
+    gender_arr = rng.integers(0, 2, size=num)
+    gamete_arr = rng.integers(0, 2, size=(num, 2, traits_num))
+    noise_arr = rng.normal(0, pheno_var_ls[:traits_num], size=(num, traits_num))
+    offspring_ls = []
+    for k, (female_indi_obj, male_indi_obj) in enumerate(pairwise_parents_ls):
+        genotype_set = {}
+        phenotype_set = {}
+        offspring = individual(species_id=female_indi_obj.species_id, traits_num=female_indi_obj.traits_num, pheno_names_ls=female_indi_obj.pheno_names_ls, gender=('male', 'female')[gender_arr[k]], 
+                               genotype_set=genotype_set, phenotype_set=phenotype_set, geno_len_ls=female_indi_obj.geno_len_ls)
+        for i, pheno_name in enumerate(offspring.pheno_names_ls):
+            genotype_set[pheno_name] = np.stack((female_indi_obj.genotype_set[pheno_name][gamete_arr[k, 0, i]], male_indi_obj.genotype_set[pheno_name][gamete_arr[k, 1, i]]))
+            phenotype_set[pheno_name] = offspring.get_genotype_mean(pheno_name) + noise_arr[k, i]
+        offspring_ls.append(offspring)
+    return offspring_ls
+
+##################### batch mutation #####################
+# every locus of the two genotypes of every trait mutates independently with the probability of mutation_rate.
+# it is drawn in two steps: the number of flipped loci of each offspring ~ binomial(loci_num, mutation_rate), 
+# and then the flipped loci are sampled uniformly without replacement, which is statistically equivalent.
+# only the mutated offsprings are touched and only their mutated traits get a new phenotype.
+def decode_mutation_positions(positions, geno_len_arr):
+    ''' the loci of an offspring are indexed trait by trait and allele by allele, 
+    position -> (trait index, allele index, word index, bit of the word) '''
+    trait_offsets = np.concatenate(([0], np.cumsum(2*geno_len_arr)))
+    trait = np.searchsorted(trait_offsets, positions, side='right') - 1
+    allele, locus = np.divmod(positions - trait_offsets[trait], geno_len_arr[trait])
+    return trait, allele, locus//64, np.left_shift(np.uint64(1), (locus%64).astype(np.uint64))
+
+def sample_mutation_positions(flips_num_arr, loci_num, rng):
+    ''' return (offspring index, position) of the flipped loci, the positions of an offspring are distinct.
+    the positions of every mutated offspring are the first loci of a random permutation of its loci, drawn for all of them at once. '''
+    mutated_index = np.flatnonzero(flips_num_arr)
+    offs_index = np.repeat(mutated_index, flips_num_arr[mutated_index])
+    permutation = rng.random((len(mutated_index), loci_num)).argsort(axis=1)
+    positions = permutation[np.arange(loci_num) < flips_num_arr[mutated_index][:, None]]
+    return offs_index, positions.astype(int)
+
+def batch_mutation_arrays(genotype, phenotype, geno_len_arr, mutation_rate, pheno_var_ls, rng):
+    ''' mutate the offsprings in place. 
+    genotype is the [offsprings x traits x 2 x words] packed bi-genotypes and phenotype is [offsprings x traits].
+    return the index of the mutated offsprings. '''
+    geno_len_arr = np.asarray(geno_len_arr, dtype=int)
+    if len(genotype) == 0 or mutation_rate <= 0:
+        return np.array([], dtype=int)
+    flips_num_arr = rng.binomial(2*geno_len_arr.sum(), mutation_rate, size=len(genotype))
+    offs_index, positions = sample_mutation_positions(flips_num_arr, 2*geno_len_arr.sum(), rng)
+    trait, allele, word, bit = decode_mutation_positions(positions, geno_len_arr)
+    np.bitwise_xor.at(genotype, (offs_index, trait, allele, word), bit)       # several flips may hit the same word
+    
+    mutated_offs_index, mutated_trait = np.unique(np.stack((offs_index, trait)), axis=1)
+    mutated_genotype = genotype[mutated_offs_index, mutated_trait]
+    phenotype[mutated_offs_index, mutated_trait] = popcount(mutated_genotype).sum(axis=(1, 2))/(2*geno_len_arr[mutated_trait]) + rng.normal(0, np.asarray(pheno_var_ls)[mutated_trait])
+    return np.unique(offs_index)
+
+def batch_mutation(indi_object_ls, mutation_rate, pheno_var_ls, rng):
+    ''' mutate all the offsprings (individual objects) produced in a phase at once. return the number of mutated offsprings. '''
+    if len(indi_object_ls) == 0 or mutation_rate <= 0:
+        return 0
+    geno_len_arr = np.array(indi_object_ls[0].geno_len_ls, dtype=int)
+    flips_num_arr = rng.binomial(2*geno_len_arr.sum(), mutation_rate, size=len(indi_object_ls))
+    offs_index, positions = sample_mutation_positions(flips_num_arr, 2*geno_len_arr.sum(), rng)
+    trait, allele, word, bit = decode_mutation_positions(positions, geno_len_arr)
+    
+    mutated_offs_index, mutated_trait = np.unique(np.stack((offs_index, trait)), axis=1)
+    noise_arr = rng.normal(0, np.asarray(pheno_var_ls)[mutated_trait])
+    for n, t, noise in zip(mutated_offs_index, mutated_trait, noise_arr):
+        indi_object = indi_object_ls[n]
+        pheno_name = indi_object.pheno_names_ls[t]
+        bi_genotype = indi_object.genotype_set[pheno_name].copy()
+        trait_flips = (offs_index == n) & (trait == t)
+        np.bitwise_xor.at(bi_genotype, (allele[trait_flips], word[trait_flips]), bit[trait_flips])
+        indi_object.genotype_set[pheno_name] = bi_genotype
+        indi_object.phenotype_set[pheno_name] = indi_object.get_genotype_mean(pheno_name) + noise
+    return len(np.unique(offs_index))
+
 ##################################################################################################    
     
     
     
     
 ###################################################################################################
+def shared_memory_array(arr):
+    ''' return a copy of arr in a multiprocessing.RawArray block, which is shared with the processes forked afterwards '''
+    raw_array = multiprocessing.RawArray('b', max(arr.nbytes, 1))
+    shared_arr = np.frombuffer(raw_array, dtype=arr.dtype, count=arr.size).reshape(arr.shape)
+    shared_arr[:] = arr
+    return shared_arr
+
+class recording_policy():
+    '''
+    the time steps and the microsites of a stream of the time series to be recorded.
+    every=k records the time steps 0, k, 2k, ...; log_num=n records n log-spaced time steps (dense at the beginning, see log_spaced_time_steps()),
+    every and log_num can not be given together (every=1 if none of them is given); last_num=N records only the final N time steps of them.
+    sites is the array of site indexes in the metacommunity to be recorded (None for all the microsites), see metacommunity.get_meta_monitoring_sites().
+    '''
+    def __init__(self, all_time_step, every=None, log_num=None, last_num=None, sites=None):
+        self.all_time_step = all_time_step
+        if every is not None and log_num is not None:
+            raise ValueError('every and log_num of a recording policy can not be given together.')
+        if log_num is not None:
+            schedule = np.zeros(all_time_step, dtype=bool)
+            schedule[self.log_spaced_time_steps(all_time_step, log_num)] = True
+        else:
+            schedule = np.arange(all_time_step) % (1 if every is None else every) == 0
+        if last_num is not None:
+            schedule &= np.arange(all_time_step) >= all_time_step - last_num
+        self.schedule = schedule
+        self.sites = None if sites is None else np.sort(np.asarray(sites, dtype=int))
+
+    @staticmethod
+    def log_spaced_time_steps(all_time_step, log_num):
+        ''' return min(log_num, all_time_step) distinct time steps spaced as np.geomspace(1, all_time_step, log_num) - 1,
+        the steps rounded to the same integer (at the beginning) are bumped to the next free integers '''
+        if log_num >= all_time_step:
+            return np.arange(all_time_step)
+        steps = np.geomspace(1, all_time_step, log_num).astype(int) - 1
+        for k in range(1, log_num):                   # bump the collisions forward
+            steps[k] = max(steps[k], steps[k-1] + 1)
+        steps[-1] = min(steps[-1], all_time_step - 1)
+        for k in range(log_num-2, -1, -1):            # and back below the last time step if the bumps run over it
+            steps[k] = min(steps[k], steps[k+1] - 1)
+        return steps
+
+    def is_recorded(self, time_step):
+        return bool(self.schedule[time_step])
+
+    def get_time_steps(self):
+        return np.flatnonzero(self.schedule)
+
+    def get_recorded_num(self):
+        return int(self.schedule.sum())
+
+    def get_sites_num(self, sites_num):
+        return sites_num if self.sites is None else len(self.sites)
+
+    def select_sites(self, values):
+        ''' return the values of the recorded microsites out of the values of all the microsites '''
+        return values if self.sites is None else np.asarray(values)[self.sites]
+
+class time_series_recorder():
+    '''
+    the distribution data of the metacommunity over time, one stream (e.g., species ids or a phenotype) per data set.
+    every stream is preallocated as a [recorded time steps+1, recorded sites] array and each record is written in place,
+    the row 0 keeps the reference values (the optimum species or the environment values).
+    the recording_policy of a stream chooses the time steps and microsites to be recorded, all of them by default.
+    the empty microsites (np.nan) of the integer streams are stored as the sentinel value, e.g., -1 for the species ids.
+    '''
+    def __init__(self, all_time_step, sites_num):
+        self.all_time_step = all_time_step
+        self.sites_num = sites_num
+        self.set = {}                   # {stream_name: [rows_num, recorded sites] array}
+        self.sentinel_dir = {}          # {stream_name: sentinel value of np.nan or None}
+        self.row_dir = {}               # {stream_name: the next row to be written}
+        self.rows_num_dir = {}          # {stream_name: the number of rows of the stream, i.e., the recorded time steps+1}
+        self.first_row_index_name_dir = {}    # {stream_name: the index name of the row 0 in the csv table}
+        self.policy_dir = {}            # {stream_name: recording_policy}
+        self.time_steps_dir = {}        # {stream_name: [the time step of the row 1, row 2, ...]}
+
+    def add_stream(self, stream_name, first_row, dtype=np.float32, sentinel=None, first_row_index_name=None, policy=None):
+        self.init_stream(stream_name, sentinel, first_row_index_name, policy)
+        self.set[stream_name] = np.empty((self.rows_num_dir[stream_name], self.policy_dir[stream_name].get_sites_num(self.sites_num)), dtype=dtype)
+        self.record(stream_name, first_row)
+
+    def init_stream(self, stream_name, sentinel, first_row_index_name, policy):
+        self.policy_dir[stream_name] = recording_policy(self.all_time_step) if policy is None else policy
+        self.rows_num_dir[stream_name] = self.policy_dir[stream_name].get_recorded_num() + 1
+        self.sentinel_dir[stream_name] = sentinel
+        self.row_dir[stream_name] = 0
+        self.time_steps_dir[stream_name] = []
+        self.first_row_index_name_dir[stream_name] = stream_name if first_row_index_name is None else first_row_index_name
+
+    def is_recorded(self, stream_name, time_step):
+        ''' whether the time step is recorded by the policy of the stream, check it before the values are collected '''
+        return self.policy_dir[stream_name].is_recorded(time_step)
+
+    def encode(self, stream_name, values):
+        ''' select the recorded microsites and np.nan -> sentinel for the integer streams '''
+        values = self.policy_dir[stream_name].select_sites(values)
+        sentinel = self.sentinel_dir[stream_name]
+        if sentinel is None:
+            return values
+        values = np.asarray(values, dtype=float)
+        return np.where(np.isnan(values), sentinel, values)
+
+    def decode(self, stream_name, data):
+        ''' sentinel -> np.nan for the integer streams, the float streams are returned as they are '''
+        sentinel = self.sentinel_dir[stream_name]
+        if sentinel is None:
+            return data
+        return np.where(data == sentinel, np.nan, data)
+
+    def next_row(self, stream_name, time_step):
+        ''' return the next row of the stream, or None if the time step is not recorded '''
+        if time_step is not None and not self.is_recorded(stream_name, time_step):
+            return None
+        row = self.row_dir[stream_name]
+        if row >= self.rows_num_dir[stream_name]:
+            raise ValueError('the stream %s is full.'%stream_name)
+        if row > 0:
+            self.time_steps_dir[stream_name].append(row - 1 if time_step is None else time_step)
+        self.row_dir[stream_name] = row + 1
+        return row
+
+    def record(self, stream_name, values, time_step=None):
+        ''' write the values of all the microsites into the next row of the stream if the policy of the stream records the time step,
+        the values are always written if time_step is None. return True if the values are recorded. '''
+        row = self.next_row(stream_name, time_step)
+        if row is None:
+            return False
+        self.set[stream_name][row] = self.encode(stream_name, values)
+        return True
+
+    def get_recorded_num(self, stream_name):
+        return self.row_dir[stream_name]
+
+    def get_time_steps(self, stream_name):
+        ''' the time steps of the recorded rows after the row 0 '''
+        return list(self.time_steps_dir[stream_name])
+
+    def get_data(self, stream_name):
+        ''' return the recorded rows of the stream as float values with np.nan for the empty microsites,
+        as the input dis_data_all_time of metacommunity.meta_distribution_data_all_time_to_csv_gz() if all the time steps and microsites are recorded '''
+        return self.decode(stream_name, self.set[stream_name][:self.row_dir[stream_name]])
+
+class chunked_time_series_writer(time_series_recorder):
+    '''
+    streams the distribution data of the metacommunity to binary files in the directory dir_name instead of keeping it in memory.
+    every stream is buffered as a [chunk_steps, recorded sites] array, and every full chunk is appended to the raw file <stream_name>.bin (C order, no header).
+    the columns (patch_id, h_id, microsite_id) of all the sites are stored once in columns.json, and the dtype, sentinel, number of rows,
+    recorded time steps and sites of the streams in metadata.json, which is rewritten at every flush.
+    see time_series_to_csv_gz() for the conversion into the csv tables,
+    and time_series_reader in metacommunity_IBM_reader.py for reading the files as memory-mapped arrays.
+    '''
+    def __init__(self, dir_name, all_time_step, sites_num, columns_ls, chunk_steps=100):
+        time_series_recorder.__init__(self, all_time_step, sites_num)
+        self.dir_name = dir_name
+        self.chunk_steps = chunk_steps
+        self.flushed_row_dir = {}             # {stream_name: the number of rows in the file}
+        os.makedirs(dir_name, exist_ok=True)
+        columns_patch_id, columns_habitat_id, columns_mocrosite_id = columns_ls
+        with open(os.path.join(dir_name, 'columns.json'), 'w') as f:
+            json.dump({'patch_id':list(columns_patch_id), 'habitat_id':list(columns_habitat_id), 'microsite_id':list(columns_mocrosite_id)}, f)
+
+    def stream_path(self, stream_name):
+        return os.path.join(self.dir_name, '%s.bin'%stream_name)
+
+    def add_stream(self, stream_name, first_row, dtype=np.float32, sentinel=None, first_row_index_name=None, policy=None):
+        self.init_stream(stream_name, sentinel, first_row_index_name, policy)
+        self.set[stream_name] = np.empty((min(self.chunk_steps, self.rows_num_dir[stream_name]), self.policy_dir[stream_name].get_sites_num(self.sites_num)), dtype=dtype)
+        self.flushed_row_dir[stream_name] = 0
+        open(self.stream_path(stream_name), 'wb').close()
+        self.record(stream_name, first_row)
+
+    def record(self, stream_name, values, time_step=None):
+        ''' write the values into the chunk buffer, the full chunk is appended to the file, see time_series_recorder.record() '''
+        row = self.next_row(stream_name, time_step)
+        if row is None:
+            return False
+        self.set[stream_name][row - self.flushed_row_dir[stream_name]] = self.encode(stream_name, values)
+        if self.row_dir[stream_name] - self.flushed_row_dir[stream_name] == len(self.set[stream_name]):
+            self.flush(stream_name)
+        return True
+
+    def flush(self, stream_name=None):
+        ''' append the buffered rows of the stream (all the streams if stream_name is None) to the files and update metadata.json '''
+        stream_name_ls = list(self.set.keys()) if stream_name is None else [stream_name]
+        for name in stream_name_ls:
+            rows_num = self.row_dir[name] - self.flushed_row_dir[name]
+            if rows_num > 0:
+                with open(self.stream_path(name), 'ab') as f:
+                    self.set[name][:rows_num].tofile(f)
+                self.flushed_row_dir[name] = self.row_dir[name]
+        self.write_metadata()
+        return 0
+
+    def write_metadata(self):
+        streams = {}
+        for name, buffer in self.set.items():
+            sites = self.policy_dir[name].sites
+            streams[name] = {'file':'%s.bin'%name, 'dtype':buffer.dtype.str, 'sentinel':self.sentinel_dir[name],
+                             'rows':self.flushed_row_dir[name], 'first_row_index_name':self.first_row_index_name_dir[name],
+                             'time_steps':[int(t) for t in self.time_steps_dir[name][:max(self.flushed_row_dir[name]-1, 0)]],
+                             'sites':None if sites is None else sites.tolist()}
+        metadata = {'all_time_step':self.all_time_step, 'sites_num':self.sites_num, 'streams':streams}
+        path = os.path.join(self.dir_name, 'metadata.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(metadata, f, indent=1)
+        os.replace(path + '.tmp', path)         # metadata.json is always complete, even if the run is killed
+        return 0
+
+    def close(self):
+        return self.flush()
+
+    def truncate(self):
+        ''' cut the files back to the rows flushed before the writer was saved, e.g., the rows written after a checkpoint '''
+        for name, buffer in self.set.items():
+            with open(self.stream_path(name), 'r+b') as f:
+                f.truncate(self.flushed_row_dir[name] * buffer.shape[1] * buffer.dtype.itemsize)
+        self.write_metadata()
+        return 0
+
+    def get_data(self, stream_name):
+        ''' read the stream back from the file, see time_series_recorder.get_data() '''
+        self.flush(stream_name)
+        data = np.fromfile(self.stream_path(stream_name), dtype=self.set[stream_name].dtype).reshape(-1, self.set[stream_name].shape[1])
+        return self.decode(stream_name, data)
+
+def time_series_to_csv_gz(dir_name, stream_name, file_name, chunk_steps=1000):
+    ''' convert a stream written by chunked_time_series_writer into the csv table of metacommunity.meta_distribution_data_all_time_to_csv_gz(),
+    only the recorded time steps and microsites are in the table. chunk_steps rows are converted at a time. '''
+    with open(os.path.join(dir_name, 'metadata.json')) as f:
+        metadata = json.load(f)
+    with open(os.path.join(dir_name, 'columns.json')) as f:
+        columns_dir = json.load(f)
+    if stream_name not in metadata['streams']:
+        raise ValueError('stream_name inputed is no found.')
+    stream = metadata['streams'][stream_name]
+    sites = stream.get('sites')
+    columns = [np.array(columns_dir[key]) for key in ('patch_id', 'habitat_id', 'microsite_id')]
+    if sites is not None:
+        columns = [column[sites] for column in columns]
+    time_steps = stream.get('time_steps', range(stream['rows']-1))
+    index = [stream['first_row_index_name']]+['time_step%d'%i for i in time_steps]
+    data = np.memmap(os.path.join(dir_name, stream['file']), dtype=stream['dtype'], mode='r', shape=(stream['rows'], len(columns[0])))
+    with gzip.open(file_name, 'wt', newline='') as f:
+        for start in range(0, stream['rows'], chunk_steps):
+            chunk = np.array(data[start:start+chunk_steps])
+            if stream['sentinel'] is not None:
+                chunk = np.where(chunk == stream['sentinel'], np.nan, chunk)
+            pd.DataFrame(chunk, index=index[start:start+chunk_steps], columns=columns).to_csv(f, header=(start == 0))
+    return file_name
+
+class community_statistics():
+    '''
+    summary statistics of the metacommunity computed at every time step instead of the distribution data.
+    the species abundances of the habitats, patches and the metacommunity are counted by np.bincount over the species codes of the microsites,
+    and the alpha (mean richness of the habitats or patches), beta (Whittaker, gamma/alpha) and gamma (richness of the metacommunity) diversity,
+    the occupancy, the mean and variance of the phenotypes and the mismatch to the optimum species of the microsites are derived from them.
+    the statistics of the metacommunity are kept as a [all_time_step x columns] table, and those of every species as rows of (time_step, species) in a second table.
+    '''
+    def __init__(self, meta_object, all_time_step, optimum_sp_id_values, trait_names=('micro_phenotype', 'macro_phenotype')):
+        self.all_time_step = all_time_step
+        self.trait_names = tuple(trait_names)
+        self.sites_num = meta_object.get_meta_size()
+        self.habitat_index_arr, self.patch_index_arr = meta_object.get_meta_microsites_habitat_index()
+        self.habitat_num = int(self.habitat_index_arr.max()) + 1
+        self.patch_num = int(self.patch_index_arr.max()) + 1
+        self.optimum_sp_id_values = np.asarray(optimum_sp_id_values, dtype=float)
+        self.species_codes_buffer = np.empty(self.sites_num, dtype=int)
+        self.phenotype_buffer = np.empty(self.sites_num)
+
+        self.columns = ['time_step', 'individuals', 'occupancy', 'gamma_richness', 'alpha_richness_habitat', 'beta_habitat', 'alpha_richness_patch', 'beta_patch',
+                        'mean_species_habitat_occupancy', 'optimum_mismatch'] + ['%s_%s'%(trait_name, stat) for trait_name in self.trait_names for stat in ('mean', 'var')]
+        self.table = np.full((all_time_step, len(self.columns)), np.nan)
+        self.row = 0
+        self.species_columns = ['time_step', 'species_id', 'abundance', 'habitat_occupancy'] + ['%s_%s'%(trait_name, stat) for trait_name in self.trait_names for stat in ('mean', 'var')]
+        self.species_table_ls = []          # [(time_step, species codes, [species x statistics] array)]
+
+        self.hab_abundance = None           # [habitat_num x species] abundances of the last update
+        self.patch_abundance = None         # [patch_num x species]
+        self.meta_abundance = None          # [species]
+
+    def abundance_matrix(self, group_index_arr, group_num, species_codes, species_num):
+        ''' [groups x species] abundances of the occupied microsites counted by one np.bincount '''
+        return np.bincount(group_index_arr*species_num + species_codes, minlength=group_num*species_num).reshape(group_num, species_num)
+
+    def update(self, meta_object, time_step):
+        ''' count the abundances of the metacommunity and add the statistics of the time step to the tables '''
+        if self.row >= self.all_time_step:
+            raise ValueError('the table of community_statistics is full.')
+        species_codes = meta_object.get_meta_microsites_species_codes(out=self.species_codes_buffer)
+        occupied = species_codes != -1
+        codes = species_codes[occupied]
+        species_num = max(len(species_registry_object.species_id_ls), 1)
+
+        self.hab_abundance = self.abundance_matrix(self.habitat_index_arr[occupied], self.habitat_num, codes, species_num)
+        self.patch_abundance = self.abundance_matrix(self.patch_index_arr[occupied], self.patch_num, codes, species_num)
+        self.meta_abundance = np.bincount(codes, minlength=species_num)
+        present = self.meta_abundance > 0
+
+        individuals = len(codes)
+        gamma = int(present.sum())
+        alpha_habitat = (self.hab_abundance > 0).sum(axis=1).mean()
+        alpha_patch = (self.patch_abundance > 0).sum(axis=1).mean()
+        habitat_occupancy = (self.hab_abundance > 0).sum(axis=0)/self.habitat_num
+        optimum_mismatch = (species_registry_object.get_value_arr()[codes] != self.optimum_sp_id_values[occupied]).mean() if individuals > 0 else np.nan
+        row_values = [time_step, individuals, individuals/self.sites_num, gamma, alpha_habitat, gamma/alpha_habitat if alpha_habitat > 0 else np.nan,
+                      alpha_patch, gamma/alpha_patch if alpha_patch > 0 else np.nan, habitat_occupancy[present].mean() if gamma > 0 else np.nan, optimum_mismatch]
+
+        species_stats_ls = [self.meta_abundance[present], habitat_occupancy[present]]
+        for trait_name in self.trait_names:
+            phenotype = meta_object.get_meta_microsites_individuals_phenotype_values(trait_name, out=self.phenotype_buffer)[occupied]
+            row_values += [phenotype.mean(), phenotype.var()] if individuals > 0 else [np.nan, np.nan]
+            pheno_sum = np.bincount(codes, weights=phenotype, minlength=species_num)[present]
+            pheno_sq_sum = np.bincount(codes, weights=phenotype**2, minlength=species_num)[present]
+            pheno_mean = pheno_sum/self.meta_abundance[present]
+            species_stats_ls += [pheno_mean, np.maximum(pheno_sq_sum/self.meta_abundance[present] - pheno_mean**2, 0)]
+
+        self.table[self.row] = row_values
+        self.row += 1
+        self.species_table_ls.append((time_step, np.flatnonzero(present), np.column_stack(species_stats_ls)))
+        return 0
+
+    def get_dataframe(self):
+        return pd.DataFrame(self.table[:self.row], columns=self.columns).astype({'time_step':int, 'individuals':int, 'gamma_richness':int})
+
+    def get_species_dataframe(self):
+        rows_ls = []
+        for time_step, species_codes, species_stats in self.species_table_ls:
+            for species_code, stats in zip(species_codes, species_stats):
+                rows_ls.append([time_step, species_registry_object.get_species_id(species_code)] + list(stats))
+        return pd.DataFrame(rows_ls, columns=self.species_columns).astype({'abundance':int})
+
+    def to_csv(self, file_name, species_file_name=None):
+        ''' write the table of the metacommunity (and the table of the species if species_file_name is given) '''
+        self.get_dataframe().to_csv(file_name, index=False)
+        if species_file_name is not None:
+            self.get_species_dataframe().to_csv(species_file_name, index=False)
+        return 0
+
+recording_args_ls = ['every', 'log_num', 'last_num', 'monitoring_sites_num']       # the arguments of a stream in recording_args_dir
+def generating_recording_policy_dir(meta_object, all_time_step, recording_args_dir):
+    ''' return {stream_name: recording_policy} of the {stream_name: {every, log_num, last_num, monitoring_sites_num}} in recording_args_dir.
+    monitoring_sites_num is the number of microsites sampled at random in every habitat (None for all the microsites),
+    and the streams with the same monitoring_sites_num share the same monitoring microsites. '''
+    monitoring_sites_dir = {None:None}
+    policy_dir = {}
+    for stream_name, recording_args in recording_args_dir.items():
+        for key in recording_args.keys():
+            if key not in recording_args_ls:
+                raise ValueError('the recording argument %s of the stream %s inputed is no found.'%(key, stream_name))
+        recording_args = dict(recording_args)
+        monitoring_sites_num = recording_args.pop('monitoring_sites_num', None)
+        if monitoring_sites_num not in monitoring_sites_dir:
+            monitoring_sites_dir[monitoring_sites_num] = meta_object.get_meta_monitoring_sites(monitoring_sites_num)
+        policy_dir[stream_name] = recording_policy(all_time_step=all_time_step, sites=monitoring_sites_dir[monitoring_sites_num], **recording_args)
+    return policy_dir
+
 def generating_empty_metacommunity(meta_name, patch_num, patch_location_ls, asexual_birth_rate, sexual_birth_rate, hab_num, hab_length, hab_width, 
-                                   micro_environment_values_ls, macro_environment_values_ls, environment_types_num, environment_types_name, environment_variation_ls):
-    ''' '''
-    meta_object = metacommunity(metacommunity_name=meta_name)
+                                   micro_environment_values_ls, macro_environment_values_ls, environment_types_num, environment_types_name, environment_variation_ls, habitat_storage='object',
+                                   seed_sequence=None):
+    ''' the generators of the metacommunity and of every patch are seeded by seed_sequence (np.random.SeedSequence, None for a random one) as metacommunity.seed_rng() '''
+    seed_sequence = np.random.SeedSequence() if seed_sequence is None else seed_sequence
+    meta_object = metacommunity(metacommunity_name=meta_name, rng=np.random.default_rng(seed_sequence))
+    patch_seed_sequence_ls = seed_sequence.spawn(patch_num)
     log_info = ''
     for i in range(0, patch_num):
         patch_name = 'patch%d'%(i+1)
         patch_index = i
         location = patch_location_ls[i]
-        p = patch(patch_name, patch_index, location, asexual_birth_rate, sexual_birth_rate)
+        p = patch(patch_name, patch_index, location, asexual_birth_rate, sexual_birth_rate, rng=np.random.default_rng(patch_seed_sequence_ls[i]))
         
         micro_environment_means_values_ls = micro_environment_values_ls
         macro_environment_means_value = macro_environment_values_ls[int(location[1])]
@@ -2456,16 +3764,18 @@ def generating_empty_metacommunity(meta_name, patch_num, patch_location_ls, asex
             habitat_name = 'h%s'%str(j+1)
             micro_environment_mean_value = micro_environment_means_values_ls[j]
             p.add_habitat(hab_name=habitat_name, num_env_types=environment_types_num, env_types_name=environment_types_name, 
-                          mean_env_ls=(micro_environment_mean_value, macro_environment_means_value), var_env_ls=environment_variation_ls, length=hab_length, width=hab_width)
+                          mean_env_ls=(micro_environment_mean_value, macro_environment_means_value), var_env_ls=environment_variation_ls, length=hab_length, width=hab_width, habitat_storage=habitat_storage)
             log_info += '%s, %s, %s: micro_environment_mean_value=%s, macro_environment_means_value=%s \n'%(patch_name, str(location), habitat_name, str(micro_environment_mean_value), str(macro_environment_means_value))
             
         meta_object.add_patch(patch_name=patch_name, patch_object=p)
     return meta_object, log_info
 
-def generating_mainland_species_pool(species_num, traits_num, pheno_names_ls, pheno_var_ls, geno_len_ls, species_2_phenotype_ls):
+def generating_mainland_species_pool(species_num, traits_num, pheno_names_ls, pheno_var_ls, geno_len_ls, species_2_phenotype_ls, rng=None):
     standar_species_object_ls = [species(species_id='sp%d'%(i+1), traits_num=traits_num, pheno_names_ls=pheno_names_ls, mean_pheno_val_ls=(species_2_phenotype_ls[i]), pheno_var_ls=pheno_var_ls, geno_len_ls=geno_len_ls) for i in range(species_num)]
-    mainland_object = species_pool(species_num=species_num, standar_species_ls=standar_species_object_ls)
-    
+    mainland_object = species_pool(species_num=species_num, standar_species_ls=standar_species_object_ls, rng=rng)
+    for sp_object in standar_species_object_ls:
+        species_registry_object.register(sp_object.species_id, sp_object.mean_pheno_val_ls)
+
     log_info = 'species_num=%d \n'%species_num
     for sp_object in standar_species_object_ls:
         log_info += '%s,  traits_num=%d,  %s=%s,  phenotypes_var=%s,  genotypes_len=%s \n'%(sp_object.species_id, sp_object.traits_num, str(sp_object.pheno_names_ls), str(sp_object.mean_pheno_val_ls), str(sp_object.pheno_var_ls), str(sp_object.geno_len_ls))
@@ -2543,14 +3853,724 @@ def read_graph_object_gpickle(meta_object, path):
     meta_object.show_meta_map(graph_object, title = str(path), pos = nx.get_node_attributes(graph_object, 'position'))
     return graph_object
 
+class patch_worker():
+    '''
+    the process of patch_parallel_executor which owns the patches of patch_index_ls, the methods are called by the commands sent through the pipe
+    and the results are sent back with the counters of the patches.
+    '''
+    def __init__(self, meta_object, patch_index_ls):
+        self.meta_object = meta_object
+        self.patch_index_ls = patch_index_ls
+
+    def get_counters(self):
+        counters = dict.fromkeys(self.meta_object.counters.keys(), 0)
+        for i in self.patch_index_ls:
+            for key, value in self.meta_object.patch_object_ls[i].counters.items():
+                counters[key] += value
+        return counters
+
+    def run_patch_method(self, method_name, kwargs):
+        ''' call the method of all the patches of the worker, return the sum of the returned values '''
+        counter = 0
+        for i in self.patch_index_ls:
+            counter += getattr(self.meta_object.patch_object_ls[i], method_name)(**kwargs)
+        return counter
+
+    def birth_disp_within_and_germinate(self, mutation_rate, pheno_var_ls, disp_within_rate):
+        ''' the dispersal within the patches followed by the birth and germination, return their counters and the counters of the patches between them '''
+        disp_within_counter = self.run_patch_method('mixed_reproduce_mutate_for_dispersal_within_patch', {'mutation_rate':mutation_rate, 'pheno_var_ls':pheno_var_ls, 'disp_within_rate':disp_within_rate})
+        counters = self.get_counters()
+        germinate_counter = self.run_patch_method('patch_mixed_birth_germinate', {'mutation_rate':mutation_rate, 'pheno_var_ls':pheno_var_ls})
+        return disp_within_counter, counters, germinate_counter
+
+    def get_pairwise_empty_sites_num(self):
+        return {i:self.meta_object.patch_object_ls[i].get_patch_pairwise_empty_sites_num() for i in self.patch_index_ls}
+
+    def colonize(self, colonization_ls_dir):
+        ''' colonization_ls_dir is {patch_index: colonization_ls of patch.pairwise_empty_sites_colonize()} '''
+        counter = 0
+        for i, colonization_ls in colonization_ls_dir.items():
+            counter += self.meta_object.patch_object_ls[i].pairwise_empty_sites_colonize(colonization_ls)
+        return counter
+
+    def get_emigrant_sources(self, reproduce_mode):
+        ''' return {patch_index: ([(h_id, reproduce_kind, offs_expectation_num)], empty sites num)} '''
+        sources_dir = {}
+        for i in self.patch_index_ls:
+            patch_object = self.meta_object.patch_object_ls[i]
+            sources_dir[i] = ([(h_object.name, reproduce_kind, offs_expectation_num) for h_object, reproduce_kind, offs_expectation_num in patch_object.get_emigrant_sources_ls(reproduce_mode)],
+                              patch_object.patch_empty_sites_num())
+        return sources_dir
+
+    def reproduce_emigrants(self, emigrants_ls, mutation_rate, pheno_var_ls):
+        ''' emigrants_ls is [(patch_index, h_id, reproduce_kind, num)], return the offsprings (dicts of arrays) in the same order '''
+        return [self.meta_object.patch_object_ls[i].set[h_id].hab_reproduce_mutate_for_emigrants(reproduce_kind, mutation_rate, pheno_var_ls, num)
+                for i, h_id, reproduce_kind, num in emigrants_ls]
+
+    def settle_immigrants(self, immigrants_dir):
+        ''' the migrants {patch_index: [offsprings]} settle in random empty sites of the patches, see patch.settle_migrants() '''
+        counter = 0
+        for j, migrants_ls in immigrants_dir.items():
+            counter += self.meta_object.patch_object_ls[j].settle_migrants(migrants_ls)
+        return counter
+
+def patch_worker_loop(connection, meta_object, patch_index_ls):
+    ''' serve the commands of patch_parallel_executor until 'stop', an exception of a command is sent back with its traceback instead of the result '''
+    worker = patch_worker(meta_object, patch_index_ls)
+    while True:
+        command, kwargs = connection.recv()
+        if command == 'stop':
+            break
+        try:
+            result = getattr(worker, command)(**kwargs)
+        except Exception:
+            connection.send((None, None, traceback.format_exc()))
+        else:
+            connection.send((result, worker.get_counters(), None))
+    connection.close()
+
+class closed_patches():
+    ''' replaces the patches of the metacommunity of a closed patch_parallel_executor, whose bookkeeping of the sites was kept by the workers,
+    thus any use of the patches raises an error instead of reading stale sites '''
+    def __init__(self, patch_num):
+        self.patch_num = patch_num
+
+    def error(self):
+        return RuntimeError('the %d patches of the metacommunity were run by a closed patch_parallel_executor and their sites are stale.'%self.patch_num)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        raise self.error()
+
+    def __getitem__(self, key):
+        raise self.error()
+
+    def __iter__(self):
+        raise self.error()
+
+    def __len__(self):
+        raise self.error()
+
+def check_patch_processes(patch_processes):
+    ''' the workers of patch_parallel_executor are forked, the fork start method of multiprocessing is not available on Windows '''
+    if patch_processes > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        raise ValueError('patch_processes must be 1 on this platform (%s), the patch-parallel mode needs the fork start method of multiprocessing which is not available, e.g., on Windows.'%(sys.platform))
+    return 0
+
+class patch_parallel_executor():
+    '''
+    runs the processes of a time step with the patches partitioned among processes forked workers (patch_worker).
+    the arrays of the habitats (array_habitat only) are moved into shared memory before forking, thus this process reads the current
+    individuals of the metacommunity (e.g., for the statistics and the recorder) without any transfer, while the bookkeeping
+    of the sites and the counters are kept by the workers and the counters of the metacommunity are updated from their replies.
+    every command is a round trip which waits for all the workers, a time step of the mixed mode takes 7 of them: the dead selection,
+    the colonization (the numbers of the pairwise empty sites, then the propagules), the dispersal among patches (the sources, the emigrants, then the immigrants)
+    and the dispersal within patches fused with the birth and germination (see meta_mixed_birth_disp_within_and_germinate()).
+    the germination is not fused with the dead selection of the next time step since the statistics and the recorder read the individuals between them.
+    the colonization and the dispersal among patches are drawn in this process from the counts sent by the workers,
+    and only the propagules and migrants are exchanged. the methods return the log messages of the methods of metacommunity with the same names.
+    every patch draws from its own generator (see metacommunity.seed_rng()) in its worker and the draws among patches are made by the generator
+    of the metacommunity in this process, thus the results are the same as those of the serial run of the same metacommunity.
+    the workers are forked, thus it is not available on Windows (see check_patch_processes()).
+    '''
+    def __init__(self, meta_object, processes, pheno_names_ls, geno_len_ls):
+        check_patch_processes(processes)
+        for patch_object in meta_object.patch_object_ls:
+            for h_id, h_object in patch_object.set.items():
+                if not isinstance(h_object, array_habitat):
+                    raise ValueError('habitat_storage of the patch-parallel mode must be array.')
+                h_object.share_storage(pheno_names_ls, geno_len_ls)
+        self.meta_object = meta_object
+        self.patch_index_ls_ls = [list(patch_index_arr) for patch_index_arr in np.array_split(np.arange(meta_object.patch_num), min(processes, meta_object.patch_num))]
+        self.worker_of_patch = {i:w for w, patch_index_ls in enumerate(self.patch_index_ls_ls) for i in patch_index_ls}
+        context = multiprocessing.get_context('fork')             # the workers inherit the metacommunity and the shared arrays
+        self.connection_ls, self.process_ls = [], []
+        for patch_index_ls in self.patch_index_ls_ls:
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=patch_worker_loop, args=(child_connection, meta_object, patch_index_ls), daemon=True)
+            process.start()
+            child_connection.close()
+            self.connection_ls.append(connection)
+            self.process_ls.append(process)
+
+    def call_workers(self, command, kwargs_ls):
+        ''' send the command to all the workers (kwargs_ls is one dict per worker) and return their results, the counters of the metacommunity are updated.
+        if the command fails in a worker, the workers are stopped and RuntimeError is raised with the traceback of the worker '''
+        for connection, kwargs in zip(self.connection_ls, kwargs_ls):
+            connection.send((command, kwargs))
+        result_ls, error_ls = [], []
+        counters = dict.fromkeys(self.meta_object.counters.keys(), 0)
+        for connection in self.connection_ls:
+            result, worker_counters, error = connection.recv()
+            if error is not None:
+                error_ls.append(error)
+                continue
+            result_ls.append(result)
+            for key, value in worker_counters.items():
+                counters[key] += value
+        if len(error_ls) > 0:
+            self.close()
+            raise RuntimeError('the command %s failed in a patch worker:\n%s'%(command, error_ls[0]))
+        for key, value in counters.items():
+            self.meta_object.update_counters(key, value - self.meta_object.counters[key])
+        return result_ls
+
+    def run_patch_method(self, method_name, **kwargs):
+        return sum(self.call_workers('run_patch_method', [{'method_name':method_name, 'kwargs':kwargs}]*len(self.connection_ls)))
+
+    def log_info(self, process_info, counter, counters=None):
+        return self.meta_object.log_info(process_info, counter, counters)
+
+    def show_meta_individual_num(self):
+        return self.meta_object.show_meta_individual_num()
+
+    def meta_mixed_asex_and_sex_parents_num(self):
+        return self.meta_object.meta_mixed_asex_and_sex_parents_num()
+
+    def meta_dead_selection(self, base_dead_rate, fitness_wid):
+        counter = self.run_patch_method('patch_dead_selection', base_dead_rate=base_dead_rate, fitness_wid=fitness_wid)
+        return self.log_info('dead in selection', counter)
+
+    def pairwise_sexual_colonization_from_prpagules_rains(self, species_pool_obj, propagules_rain_num):
+        ''' as metacommunity.pairwise_sexual_colonization_from_prpagules_rains(), the pairwise empty sites are drawn from their numbers in the patches '''
+        pairwise_num = int(propagules_rain_num/2)
+        pairwise_propagules_rain_ls = species_pool_obj.generate_pairwise_sexual_propagules_rain_ls(pairwise_num)
+        self.meta_object.rng.shuffle(pairwise_propagules_rain_ls)
+        pairs_num_dir = {}
+        for worker_pairs_num_dir in self.call_workers('get_pairwise_empty_sites_num', [{}]*len(self.connection_ls)):
+            pairs_num_dir.update(worker_pairs_num_dir)
+        colonization_ls_ls = self.meta_object.choose_pairwise_empty_sites(pairwise_propagules_rain_ls, [pairs_num_dir[i] for i in range(self.meta_object.patch_num)])
+        colonization_ls_dir_ls = [{i:colonization_ls_ls[i] for i in patch_index_ls} for patch_index_ls in self.patch_index_ls_ls]
+        counter = sum(self.call_workers('colonize', [{'colonization_ls_dir':colonization_ls_dir} for colonization_ls_dir in colonization_ls_dir_ls]))
+        return self.log_info('colonizing the metacommunity from mainland', counter)
+
+    def meta_reproduce_mutate_and_multinomial_dispersal_among_patches(self, reproduce_mode, mutation_rate, pheno_var_ls, total_disp_among_rate, disp_kernal, graph_object):
+        ''' as metacommunity.meta_reproduce_mutate_and_multinomial_dispersal_among_patches(), the offspring numbers are drawn in this process
+        from the sources collected from the workers, then the workers produce the emigrants and the migrants are sent to the workers of the target patches '''
+        meta_object = self.meta_object
+        sources_dir = {}
+        for worker_sources_dir in self.call_workers('get_emigrant_sources', [{'reproduce_mode':reproduce_mode}]*len(self.connection_ls)):
+            sources_dir.update(worker_sources_dir)
+        source_index_ls, counts_matrix = meta_object.multinomial_migrants_counts_matrix(total_disp_among_rate, disp_kernal, graph_object,
+                                                                                        [[offs_expectation_num for h_id, reproduce_kind, offs_expectation_num in sources_dir[i][0]] for i in range(meta_object.patch_num)],
+                                                                                        [sources_dir[j][1] for j in range(meta_object.patch_num)])
+        sources_ls = [(i,) + tuple(sources_dir[i][0][n][:2]) for i, n in source_index_ls]   # [(row of the source patch, h_id, reproduce_kind)]
+
+        emigrants_ls_ls = [[] for connection in self.connection_ls]
+        source_index_ls_ls = [[] for connection in self.connection_ls]
+        for source_index, ((i, h_id, reproduce_kind), counts) in enumerate(zip(sources_ls, counts_matrix)):
+            if counts.sum() > 0:
+                emigrants_ls_ls[self.worker_of_patch[i]].append((i, h_id, reproduce_kind, int(counts.sum())))
+                source_index_ls_ls[self.worker_of_patch[i]].append(source_index)
+        hab_disp_pool_dir = {}
+        for source_index_ls, hab_disp_pool_ls in zip(source_index_ls_ls, self.call_workers('reproduce_emigrants', [{'emigrants_ls':emigrants_ls, 'mutation_rate':mutation_rate, 'pheno_var_ls':pheno_var_ls} for emigrants_ls in emigrants_ls_ls])):
+            hab_disp_pool_dir.update(zip(source_index_ls, hab_disp_pool_ls))
+
+        migrants_matrix = np.zeros((meta_object.patch_num, meta_object.patch_num))
+        immigrants_dir_ls = [{} for connection in self.connection_ls]
+        for source_index in sorted(hab_disp_pool_dir.keys()):
+            (i, h_id, reproduce_kind), counts, hab_disp_pool = sources_ls[source_index], counts_matrix[source_index], hab_disp_pool_dir[source_index]
+            h_object = meta_object.patch_object_ls[i].set[h_id]
+            for j, migrants in zip(np.flatnonzero(counts), h_object.split_offspring(hab_disp_pool, counts[counts > 0])):
+                immigrants_dir_ls[self.worker_of_patch[j]].setdefault(int(j), []).append(migrants)
+                migrants_matrix[i, j] += h_object.offspring_num(migrants)
+        meta_object.disp_current_matrix += migrants_matrix
+        counter = sum(self.call_workers('settle_immigrants', [{'immigrants_dir':immigrants_dir} for immigrants_dir in immigrants_dir_ls]))
+        return self.log_info('disperse among patches', counter)
+
+    def meta_mixed_birth_disp_within_patches(self, mutation_rate, pheno_var_ls, disp_within_rate):
+        counter = self.run_patch_method('mixed_reproduce_mutate_for_dispersal_within_patch', mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, disp_within_rate=disp_within_rate)
+        return self.log_info('disperse within patches', counter)
+
+    def meta_mixed_birth_mutate_germinate(self, mutation_rate, pheno_var_ls):
+        counter = self.run_patch_method('patch_mixed_birth_germinate', mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls)
+        return self.log_info('germinating from local habitat', counter)
+
+    def meta_mixed_birth_disp_within_and_germinate(self, mutation_rate, pheno_var_ls, disp_within_rate):
+        ''' as metacommunity.meta_mixed_birth_disp_within_and_germinate(), both processes are run by one command, thus the workers are synchronized once '''
+        result_ls = self.call_workers('birth_disp_within_and_germinate', [{'mutation_rate':mutation_rate, 'pheno_var_ls':pheno_var_ls, 'disp_within_rate':disp_within_rate}]*len(self.connection_ls))
+        counters = {key:sum(worker_counters[key] for disp_within_counter, worker_counters, germinate_counter in result_ls) for key in self.meta_object.counters.keys()}
+        return (self.log_info('disperse within patches', sum(result[0] for result in result_ls), counters=counters),
+                self.log_info('germinating from local habitat', sum(result[2] for result in result_ls)))
+
+    def close(self):
+        ''' stop the workers, the metacommunity in this process has not the bookkeeping of the sites made by the workers,
+        thus its patches are replaced by closed_patches and only its counters and disp_current_matrix are still valid '''
+        for connection in self.connection_ls:
+            connection.send(('stop', {}))
+            connection.close()
+        for process in self.process_ls:
+            process.join()
+        self.meta_object.set = self.meta_object.patch_object_ls = closed_patches(self.meta_object.patch_num)
+        return 0
+
+model_version = '3.3.4'          # the version of the model (in the name of this file), saved with the checkpoints
+
+class checkpoint_writer():
+    '''
+    saves the state of a replicate (see run_replicate()) as a pickle file, file_name is replaced only when the new checkpoint is complete.
+    the state is preceded by the header {'model_version', 'module_name'}, see read_checkpoint().
+    the state is pickled in the simulation thread and the bytes are written to the disk by a background thread,
+    thus the simulation only waits for the pickling (and for the previous checkpoint if it is not written yet).
+    '''
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.thread = None
+
+    def save(self, state):
+        data = pickle.dumps({'model_version':model_version, 'module_name':__name__}, protocol=pickle.HIGHEST_PROTOCOL) + pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        self.wait()
+        self.thread = threading.Thread(target=self.write, args=(data,))
+        self.thread.start()
+        return len(data)
+
+    def write(self, data):
+        with open(self.file_name + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(self.file_name + '.tmp', self.file_name)
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        return 0
+
+    def remove(self):
+        self.wait()
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
+        return 0
+
+class checkpoint_unpickler(pickle.Unpickler):
+    ''' the classes of the model are pickled by the name of the module which saved the checkpoint, e.g., '__main__' when the model is run as a script
+    and 'metacommunity_IBM' when it is imported, the classes of that module are taken from this module whatever its name is '''
+    def __init__(self, file, module_name):
+        pickle.Unpickler.__init__(self, file)
+        self.module_name = module_name
+
+    def find_class(self, module, name):
+        if module != self.module_name:
+            return pickle.Unpickler.find_class(self, module, name)
+        names = name.split('.')
+        obj = globals()[names[0]]
+        for attr in names[1:]:
+            obj = getattr(obj, attr)
+        return obj
+
+def read_checkpoint(file_name):
+    ''' return the state saved by checkpoint_writer without restoring anything.
+    raise ValueError if it was saved by another version of the model, whose classes may not be those of this version. '''
+    with open(file_name, 'rb') as f:
+        header = pickle.load(f)
+        if not isinstance(header, dict) or header.get('model_version') != model_version:
+            raise ValueError('the checkpoint %s was not saved by the version %s of the model, it can not be resumed.'%(file_name, model_version))
+        return checkpoint_unpickler(f, header['module_name']).load()
+
+def load_checkpoint(file_name):
+    ''' return the state saved by checkpoint_writer, the species registry of the model is restored from it '''
+    state = read_checkpoint(file_name)
+    species_registry_object.__dict__.update(state['species_registry'].__dict__)
+    return state
+
+def run_replicate(rep, empty_metacommunity, mainland, graph_object, all_time_step, species_2_phenotype_ls, pheno_names_ls, pheno_var_ls, base_dead_rate, fitness_wid,
+                  mutation_rate, propagules_rain_num, total_disp_among_rate, disp_kernal, disp_within_rate, recording_args_dir, chunk_steps=100, export_csv_gz=False,
+                  checkpoint_every=None, patch_processes=1, seed_sequence=None, checkpoint_state=None):
+    '''
+    run the replicate rep of the model on a copy of empty_metacommunity, the outputs are written to the files 'rep=%d_*'.
+    the generators of the copy (see metacommunity.seed_rng()) and of the mainland are seeded by the children of seed_sequence (np.random.SeedSequence, None for a random one),
+    thus a replicate is reproduced by its seed_sequence.
+    every checkpoint_every time steps (None for never) the state of the replicate, i.e., the metacommunity with its pools, disp_current_matrix and generators,
+    the recorder, the statistics and the arguments (with the mainland and its generator), is saved to 'rep=%d_checkpoint.pkl'.
+    checkpoint_state is the state loaded from a checkpoint to continue from, see resume_replicate().
+    the patches are run by patch_processes processes if it is larger than 1 (see patch_parallel_executor), which needs the array habitats, no checkpoint and the fork start method (not on Windows).
+    '''
+    check_patch_processes(patch_processes)
+    run_args = {key:value for key, value in locals().items() if key not in ('empty_metacommunity', 'checkpoint_state')}
+    checkpoint = checkpoint_writer('rep=%d_checkpoint.pkl'%(rep))
+    if checkpoint_state is None:
+        meta = copy.deepcopy(empty_metacommunity, {id(graph_object):graph_object})     # the graph is shared, thus the dispersal rate matrices cached for it are kept
+        meta_seed_sequence, mainland_seed_sequence = (np.random.SeedSequence() if seed_sequence is None else seed_sequence).spawn(2)
+        meta.seed_rng(meta_seed_sequence)
+        mainland.set_rng(np.random.default_rng(mainland_seed_sequence))
+        meta.meta_init_storage(pheno_names_ls, mainland.standar_species_ls[0].geno_len_ls)
+
+        #meta.meta_initialize(traits_num=2, pheno_names_ls=('micro_phenotype', 'macro_phenotype'), pheno_var_ls=(0.025, 0.025), geno_len_ls=(20, 20), reproduce_mode='asexual', species_2_phenotype_ls=species_2_phenotype_ls)
+        #meta.meta_initialize(traits_num=2, pheno_names_ls=('micro_phenotype', 'macro_phenotype'), pheno_var_ls=(0.025, 0.025), geno_len_ls=(20, 20), reproduce_mode='sexual', species_2_phenotype_ls=species_2_phenotype_ls)
+
+        recording_policy_dir = generating_recording_policy_dir(meta_object=meta, all_time_step=all_time_step, recording_args_dir=recording_args_dir)
+        recorder = chunked_time_series_writer(dir_name='rep=%d_time_series'%(rep), all_time_step=all_time_step, sites_num=meta.get_meta_size(), columns_ls=meta.columns_patch_habitat_microsites_id(), chunk_steps=chunk_steps)
+        recorder.add_stream('species', first_row=meta.get_meta_microsites_optimum_sp_id_val(species_2_phenotype_ls), dtype=np.int32, sentinel=-1, first_row_index_name='optimun_sp_id_values', policy=recording_policy_dir['species'])
+        recorder.add_stream('micro_phenotype', first_row=meta.get_meta_microsite_environment_values(environment_name='micro_environment'), dtype=np.float32, first_row_index_name='micro_environment_values', policy=recording_policy_dir['micro_phenotype'])
+        recorder.add_stream('macro_phenotype', first_row=meta.get_meta_microsite_environment_values(environment_name='macro_environment'), dtype=np.float32, first_row_index_name='macro_environment_values', policy=recording_policy_dir['macro_phenotype'])
+        statistics = community_statistics(meta_object=meta, all_time_step=all_time_step, optimum_sp_id_values=meta.get_meta_microsites_optimum_sp_id_val(species_2_phenotype_ls), trait_names=pheno_names_ls)
+        start_time_step = 0
+    else:
+        meta, recorder, statistics = checkpoint_state['meta'], checkpoint_state['recorder'], checkpoint_state['statistics']
+        recorder.truncate()
+        start_time_step = checkpoint_state['time_step']
+        logging.info('rep=%d is resumed at time_step=%d', rep, start_time_step)
+    snapshot_buffer = np.empty(meta.get_meta_size())
+    if patch_processes > 1:
+        if checkpoint_every is not None:
+            raise ValueError('checkpoint_every must be None in the patch-parallel mode.')
+        executor = patch_parallel_executor(meta_object=meta, processes=patch_processes, pheno_names_ls=pheno_names_ls, geno_len_ls=mainland.standar_species_ls[0].geno_len_ls)
+    else:
+        executor = meta
+
+    starttime = time.time()
+    for time_step in range(start_time_step, all_time_step):
+        d1 = time.time()
+        if time_step%100==0: print('rep=%d, time_step%d'%(rep, time_step))
+        logging.info('rep=%d, time_step=%d', rep, time_step)
+    
+        '''
+        # only asexual reproduction
+        log_info = meta.show_meta_individual_num()
+        logging.info(log_info)
+        log_info = meta.meta_dead_selection(base_dead_rate=base_dead_rate, fitness_wid=fitness_wid)
+        logging.info('Dead selection process done! \n%s', log_info)
+        log_info = meta.colonize_from_propagules_rains(species_pool_obj=mainland, reproduce_mode='asexual', propagules_rain_num=propagules_rain_num)
+        logging.info('Colonizing process under propagules rains done! \n%s', log_info)
+        log_info = meta.meta_asexual_reproduce_mutate_and_dispersal_among_patches(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, total_disp_among_rate=total_disp_among_rate, disp_kernal=disp_kernal, graph_object=graph_object)
+        logging.info('Dispersal among patches process done! \n%s', log_info)
+        log_info = meta.meta_asexual_birth_disp_within_patches(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, disp_within_rate=disp_within_rate)
+        logging.info('Dispersal within patch process done! \n%s', log_info)
+        log_info = meta.meta_asexual_birth_mutate_germinate(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls)
+        logging.info('Local birth and germination process done! \n%s', log_info)
+        '''
+    
+        '''
+        # only sexual reproduction
+        log_info =  meta.show_meta_individual_num()
+        logging.info(log_info)
+        log_info = meta.meta_dead_selection(base_dead_rate=0.1, fitness_wid=0.5)
+        logging.info('Dead selection process done! \n%s', log_info)
+        log_info = meta.colonize_from_propagules_rains(species_pool_obj=mainland, reproduce_mode='sexual', propagules_rain_num=100)
+        logging.info('Colonizing process under propagules rains done! \n%s', log_info)
+        log_info = meta.meta_sexual_reproduce_mutate_and_dispersal_among_patches(mutation_rate=0.00001, pheno_var_ls=(0.025, 0.025), total_disp_among_rate=0.1, disp_kernal=1, graph_object=graph_object)
+        logging.info('Dispersal among patches process done! \n%s', log_info)
+        log_info = meta.meta_sexual_birth_disp_within_patches(mutation_rate=0.00001, pheno_var_ls=(0.025, 0.025), disp_within_rate=0.11)
+        logging.info('Dispersal within patch process done! \n%s', log_info)
+        log_info = meta.meta_sexual_birth_mutate_germinate(mutation_rate=0.00001, pheno_var_ls=(0.025, 0.025))
+        logging.info('Local birth and germination process done! \n%s', log_info)
+        '''
+        
+        
+        # asexual and sexual reproduction are both allowed.
+        log_info = executor.show_meta_individual_num()
+        logging.info(log_info)
+        log_info = executor.meta_dead_selection(base_dead_rate=base_dead_rate, fitness_wid=fitness_wid)
+        logging.info('Dead selection process done! \n%s', log_info)
+        log_info = executor.pairwise_sexual_colonization_from_prpagules_rains(species_pool_obj=mainland, propagules_rain_num=propagules_rain_num)
+        logging.info('Colonizing process under propagules rains done! \n%s', log_info)
+        logging.info(executor.meta_mixed_asex_and_sex_parents_num())
+        log_info = executor.meta_reproduce_mutate_and_multinomial_dispersal_among_patches(reproduce_mode='mixed', mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, total_disp_among_rate=total_disp_among_rate, disp_kernal=disp_kernal, graph_object=graph_object)
+        logging.info('Dispersal among patches process done! \n%s', log_info)
+        disp_within_log_info, germinate_log_info = executor.meta_mixed_birth_disp_within_and_germinate(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, disp_within_rate=disp_within_rate)
+        logging.info('Dispersal within patch process done! \n%s', disp_within_log_info)
+        logging.info('Local birth and germination process done! \n%s', germinate_log_info)
+        
+        
+        '''
+        # from offsprings pool
+        meta.show_meta_individual_num()
+        meta.meta_dead_selection(base_dead_rate=0.1, fitness_wid=0.5)
+        meta.meta_asex_reproduce_mutate(mutation_rate=0.00001, pheno_var_ls=(0.025, 0.025))
+        #meta.meta_sex_reproduce_mutate(mutation_rate=0.00001, pheno_var_ls=(0.025, 0.025))
+        log_info = meta.meta_disp_among_patches_from_offsprings_pool(total_disp_among_rate=0.1, disp_kernal=2, graph_object=mini)
+        logging.info('Dispersal among patches process done! \n%s', log_info)
+        log_info = meta.meta_disp_within_patch_from_offsprings_pool(disp_within_rate=0.11)
+        logging.info('Dispersal within patch process done! \n%s', log_info)
+        log_info = meta.meta_germinate_from_offsprings_pool()
+        logging.info('Local birth and germination process done! \n%s', log_info)
+        '''
+        
+        statistics.update(meta_object=meta, time_step=time_step)
+        if recorder.is_recorded('species', time_step):
+            recorder.record('species', meta.get_meta_microsites_individuals_sp_id_values(out=snapshot_buffer), time_step=time_step)
+        if recorder.is_recorded('micro_phenotype', time_step):
+            recorder.record('micro_phenotype', meta.get_meta_microsites_individuals_phenotype_values(trait_name='micro_phenotype', out=snapshot_buffer), time_step=time_step)
+        if recorder.is_recorded('macro_phenotype', time_step):
+            recorder.record('macro_phenotype', meta.get_meta_microsites_individuals_phenotype_values(trait_name='macro_phenotype', out=snapshot_buffer), time_step=time_step)
+        d2 = time.time()
+        logging.info("程序运行时间：%.8s s\n", d2-d1)
+
+        if checkpoint_every is not None and (time_step+1)%checkpoint_every == 0 and time_step+1 < all_time_step:
+            recorder.flush()
+            checkpoint_size = checkpoint.save({'time_step':time_step+1, 'meta':meta, 'recorder':recorder, 'statistics':statistics, 'species_registry':species_registry_object,
+                                               'run_args':run_args})
+            logging.info('checkpoint of %d bytes is saved at time_step=%d', checkpoint_size, time_step)
+
+    endtime = time.time()
+    dtime = endtime - starttime
+    logging.info("一次模拟运行时间：%.8s s", dtime)
+
+    if executor is not meta:
+        executor.close()            # the patches of meta can not be used after it
+    recorder.close()
+    statistics.to_csv(file_name='rep=%d_community_statistics.csv'%(rep), species_file_name='rep=%d_species_statistics.csv'%(rep))
+    if export_csv_gz:
+        time_series_to_csv_gz(dir_name=recorder.dir_name, stream_name='species', file_name='rep=%d_meta_species_distribution_all_time.gz'%(rep))
+        time_series_to_csv_gz(dir_name=recorder.dir_name, stream_name='micro_phenotype', file_name='rep=%dmeta_micro_phenotype_all_time.gz'%(rep))
+        time_series_to_csv_gz(dir_name=recorder.dir_name, stream_name='macro_phenotype', file_name='rep=%dmeta_macro_phenotype_all_time.gz'%(rep))
+    meta.meta_disp_current_mat_to_csv_gz(file_name='rep=%ddispersal_current_matrix.gz'%(rep))
+    checkpoint.remove()
+    return 0
+
+def resume_replicate(checkpoint_file_name):
+    ''' continue the replicate from its checkpoint file, the results are the same as those of the replicate run without interruption.
+    the checkpoint is resumed by the same version of the model, whether it is run as a script or imported (see checkpoint_unpickler). '''
+    checkpoint_state = load_checkpoint(checkpoint_file_name)
+    return run_replicate(empty_metacommunity=None, checkpoint_state=checkpoint_state, **checkpoint_state['run_args'])
+
+replicate_worker_dir = {}        # the objects shared by all the replicates run in a process, see init_replicate_worker()
+
+def init_replicate_worker(empty_metacommunity, mainland, graph_object, species_registry, run_args):
+    ''' keep the empty metacommunity, the mainland, the graph and the arguments of run_replicate() in the process,
+    thus they are passed to every worker of the pool once instead of once per replicate '''
+    species_registry_object.__dict__.update(species_registry.__dict__)
+    replicate_worker_dir.update({'empty_metacommunity':empty_metacommunity, 'mainland':mainland, 'graph_object':graph_object, 'run_args':run_args})
+    return 0
+
+def as_seed_sequence(seed):
+    ''' seed is an int, None (a random seed) or a np.random.SeedSequence '''
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+def persistent_master_seed(dir_name, master_seed):
+    ''' return master_seed, or if it is None the random seed drawn by the first call and kept in dir_name/master_seed.json,
+    thus a run started again in dir_name gets the seed of the first run '''
+    if master_seed is not None:
+        return master_seed
+    file_name = os.path.join(dir_name, 'master_seed.json')
+    if os.path.exists(file_name):
+        with open(file_name) as f:
+            return json.load(f)['master_seed']
+    master_seed = np.random.SeedSequence().entropy
+    os.makedirs(dir_name, exist_ok=True)
+    with open(file_name, 'w') as f:
+        json.dump({'master_seed':master_seed}, f)
+    return master_seed
+
+result_neutral_args_ls = ['chunk_steps', 'checkpoint_every', 'patch_processes']       # the arguments of run_replicate() which do not change the results
+
+def graph_fingerprint(graph_object):
+    ''' a hash of the nodes and the edges (with their attributes) of the graph, the same graph gives the same fingerprint in every run '''
+    nodes_ls = sorted((str(node), json.dumps(data, sort_keys=True, default=str)) for node, data in graph_object.nodes(data=True))
+    edges_ls = sorted(tuple(sorted((str(u), str(v)))) + (json.dumps(data, sort_keys=True, default=str),) for u, v, data in graph_object.edges(data=True))
+    return hashlib.md5(json.dumps([nodes_ls, edges_ls]).encode()).hexdigest()[:12]
+
+def json_configuration(configuration_dir):
+    ''' the configuration as it is written to and read from a json file, e.g., the tuples become lists '''
+    return json.loads(json.dumps(configuration_dir, sort_keys=True, default=str))
+
+def seed_key(seed_sequence):
+    return None if seed_sequence is None else [seed_sequence.entropy, list(seed_sequence.spawn_key)]
+
+def checkpoint_differences(checkpoint_state, seed_sequence, graph_object, run_args):
+    ''' return the names of the arguments of run_replicate() (but result_neutral_args_ls) whose values in checkpoint_state are not those given,
+    the seeds are compared by their entropy and spawn_key and the graphs by graph_fingerprint() '''
+    saved_args = checkpoint_state['run_args']
+    differences_ls = [key for key, value in run_args.items() if key not in result_neutral_args_ls and json_configuration({key:value}) != json_configuration({key:saved_args.get(key)})]
+    if seed_key(saved_args['seed_sequence']) != seed_key(seed_sequence):
+        differences_ls.append('seed_sequence')
+    if graph_fingerprint(saved_args['graph_object']) != graph_fingerprint(graph_object):
+        differences_ls.append('graph_object')
+    return differences_ls
+
+def run_or_resume_replicate(rep, empty_metacommunity, mainland, graph_object, seed_sequence, run_args):
+    '''
+    run the replicate rep, or resume it from rep=%d_checkpoint.pkl in the current directory if the checkpoint was saved with the same arguments and seed.
+    a checkpoint saved with other arguments (e.g., left by a crashed run of another configuration) is not resumed, a warning is logged and the replicate starts afresh.
+    '''
+    checkpoint_file_name = 'rep=%d_checkpoint.pkl'%(rep)
+    if os.path.exists(checkpoint_file_name):
+        checkpoint_state = read_checkpoint(checkpoint_file_name)
+        differences_ls = checkpoint_differences(checkpoint_state, seed_sequence, graph_object, run_args)
+        if len(differences_ls) == 0:
+            species_registry_object.__dict__.update(checkpoint_state['species_registry'].__dict__)
+            return run_replicate(empty_metacommunity=None, checkpoint_state=checkpoint_state, **checkpoint_state['run_args'])
+        logging.warning('%s was saved with other %s, rep=%d starts afresh', checkpoint_file_name, ', '.join(differences_ls), rep)
+    return run_replicate(rep=rep, empty_metacommunity=empty_metacommunity, mainland=mainland, graph_object=graph_object, seed_sequence=seed_sequence, **run_args)
+
+def run_replicate_in_worker(rep_and_seed):
+    ''' run (or resume from its checkpoint) the replicate rep seeded by its child SeedSequence, return (rep, running time) '''
+    rep, seed_sequence = rep_and_seed
+    starttime = time.time()
+    run_or_resume_replicate(rep=rep, empty_metacommunity=replicate_worker_dir['empty_metacommunity'], mainland=replicate_worker_dir['mainland'],
+                            graph_object=replicate_worker_dir['graph_object'], seed_sequence=seed_sequence, run_args=replicate_worker_dir['run_args'])
+    return rep, time.time() - starttime
+
+def check_pool_processes(processes, patch_processes_ls):
+    ''' the workers of a pool are daemonic processes which can not start the workers of patch_parallel_executor, see also check_patch_processes() '''
+    if processes > 1 and max(patch_processes_ls) > 1:
+        raise ValueError('processes and patch_processes can not be both larger than 1, the replicates run in a pool of processes can not run their patches in processes.')
+    for patch_processes in patch_processes_ls:
+        check_patch_processes(patch_processes)
+    return 0
+
+def run_replicates(repeat_times, empty_metacommunity, mainland, graph_object, master_seed=None, processes=1, **run_args):
+    '''
+    run the replicates 0, 1, ..., repeat_times-1 of run_replicate() in a pool of processes (in this process if processes is 1),
+    every replicate is seeded by a child of master_seed (see as_seed_sequence()), thus the replicates are independent and
+    the results of a master_seed do not depend on the number of processes. the outputs of the replicates are written to the files 'rep=%d_*'.
+    a replicate is resumed from its checkpoint only with the same seed (see run_or_resume_replicate()), thus master_seed None is drawn once
+    and kept in master_seed.json of the current directory (see persistent_master_seed()).
+    processes and the patch_processes of run_replicate() can not be both larger than 1.
+    '''
+    check_pool_processes(processes, [run_args.get('patch_processes', 1)])
+    master_seed_sequence = as_seed_sequence(persistent_master_seed('.', master_seed))
+    logging.info('master_seed=%d', master_seed_sequence.entropy)
+    rep_and_seed_ls = list(zip(range(repeat_times), master_seed_sequence.spawn(repeat_times)))
+    initargs = (empty_metacommunity, mainland, graph_object, species_registry_object, run_args)
+    if processes == 1:
+        init_replicate_worker(*initargs)
+        result_ls = [run_replicate_in_worker(rep_and_seed) for rep_and_seed in rep_and_seed_ls]
+    else:
+        with multiprocessing.Pool(processes=min(processes, repeat_times), initializer=init_replicate_worker, initargs=initargs) as pool:
+            result_ls = list(pool.imap_unordered(run_replicate_in_worker, rep_and_seed_ls, chunksize=1))
+    for rep, dtime in sorted(result_ls):
+        logging.info('rep=%d is done in %.8s s', rep, dtime)
+    return sorted(result_ls)
+
+sweep_parameters_ls = ['base_dead_rate', 'fitness_wid', 'total_disp_among_rate', 'disp_kernal', 'disp_within_rate', 'mutation_rate', 'graph_algorithm']
+def sweep_job_configuration(parameters_dir, run_args, master_seed_sequence, graph_object_dir):
+    ''' the configuration which determines the results of a job of run_sweep(), i.e., the parameters of the job over run_args (but result_neutral_args_ls),
+    the master seed and the fingerprint of the graph of the job '''
+    configuration_dir = {key:value for key, value in run_args.items() if key not in result_neutral_args_ls}
+    configuration_dir.update(parameters_dir)
+    configuration_dir['master_seed'] = [master_seed_sequence.entropy, list(master_seed_sequence.spawn_key)]
+    configuration_dir['graph_fingerprint'] = graph_fingerprint(graph_object_dir[parameters_dir.get('graph_algorithm', 'full_connection')])
+    return json_configuration(configuration_dir)
+
+def check_sweep_job_dir(job_dir, configuration_dir):
+    ''' raise ValueError if parameters.json of the job directory was written by another configuration, thus its results and checkpoints are not reused '''
+    file_name = os.path.join(job_dir, 'parameters.json')
+    if os.path.exists(file_name):
+        with open(file_name) as f:
+            if json.load(f) != configuration_dir:
+                raise ValueError('the configuration of %s is not the one of its parameters.json.'%job_dir)
+    return 0
+
+def expand_sweep_grid(grid_dir, repeat_times=1, configuration_func=None):
+    '''
+    return the jobs of the full factorial grid as a list of (job_id, parameters_dir, rep), e.g.,
+    grid_dir = {'disp_kernal':[1, 2], 'graph_algorithm':['full_connection', 'minimum_spanning_tree']} gives 4 combinations x repeat_times replicates.
+    job_id is a hash of configuration_func(parameters_dir) (the parameters if it is None, see sweep_job_configuration()),
+    thus a job keeps its id (and its directory) when the grid is extended and gets a new one when its configuration is changed.
+    '''
+    for parameter in grid_dir.keys():
+        if parameter not in sweep_parameters_ls:
+            raise ValueError('parameter inputed is no found.')
+    job_ls = []
+    for values in itertools.product(*grid_dir.values()):
+        parameters_dir = dict(zip(grid_dir.keys(), values))
+        configuration_dir = parameters_dir if configuration_func is None else configuration_func(parameters_dir)
+        job_id = hashlib.md5(json.dumps(configuration_dir, sort_keys=True, default=str).encode()).hexdigest()[:12]
+        for rep in range(repeat_times):
+            job_ls.append((job_id, parameters_dir, rep))
+    return job_ls
+
+def init_sweep_worker(sweep_dir, empty_metacommunity, mainland, graph_object_dir, species_registry, run_args, job_configuration_dir):
+    ''' keep the objects shared by all the jobs of a sweep in the process, see init_replicate_worker() '''
+    species_registry_object.__dict__.update(species_registry.__dict__)
+    replicate_worker_dir.update({'sweep_dir':os.path.abspath(sweep_dir), 'empty_metacommunity':empty_metacommunity, 'mainland':mainland,
+                                 'graph_object_dir':graph_object_dir, 'run_args':run_args, 'job_configuration_dir':job_configuration_dir})
+    return 0
+
+def run_sweep_job(job_and_seed):
+    ''' run the replicate rep of a job in its directory sweep_dir/job=<job_id>, the configuration of the job is written to parameters.json
+    and the file rep=%d_done.json is written when it is finished '''
+    (job_id, parameters_dir, rep), seed_sequence = job_and_seed
+    starttime = time.time()
+    job_dir = os.path.join(replicate_worker_dir['sweep_dir'], 'job=%s'%job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    check_sweep_job_dir(job_dir, replicate_worker_dir['job_configuration_dir'][job_id])
+    cwd = os.getcwd()
+    os.chdir(job_dir)                   # the outputs of run_replicate() are written to the current directory
+    try:
+        with open('parameters.json', 'w') as f:
+            json.dump(replicate_worker_dir['job_configuration_dir'][job_id], f, indent=1, sort_keys=True)
+        run_args = dict(replicate_worker_dir['run_args'])
+        run_args.update({key:value for key, value in parameters_dir.items() if key != 'graph_algorithm'})
+        graph_object = replicate_worker_dir['graph_object_dir'][parameters_dir.get('graph_algorithm', 'full_connection')]
+        run_or_resume_replicate(rep=rep, empty_metacommunity=replicate_worker_dir['empty_metacommunity'], mainland=replicate_worker_dir['mainland'],
+                                graph_object=graph_object, seed_sequence=seed_sequence, run_args=run_args)
+        result = {'job_id':job_id, 'rep':rep, 'dir':job_dir, 'running_time':time.time() - starttime}
+        result.update(parameters_dir)
+        with open('rep=%d_done.json'%(rep), 'w') as f:
+            json.dump(result, f, indent=1)
+    finally:
+        os.chdir(cwd)
+    return result
+
+def run_sweep(sweep_dir, grid_dir, repeat_times, empty_metacommunity, mainland, graph_object_dir=None, master_seed=None, processes=1, **run_args):
+    '''
+    run the parameter sweep of grid_dir (see expand_sweep_grid()) over the parameters of run_replicate() and the graph_algorithm of calculate_graph_object().
+    the empty metacommunity and the mainland are shared by all the jobs, every graph (taken from graph_object_dir or calculated) and
+    every dispersal rate matrix of the jobs to run are computed once before the jobs are run in a pool of at most processes workers.
+    the directory of a job is named by the hash of its configuration (see sweep_job_configuration()), which is written to its parameters.json,
+    thus a job is run again in a new directory when anything changing its results (e.g., all_time_step, a fixed argument, master_seed or its graph) is changed.
+    the replicates which have rep=%d_done.json in their job directory are skipped, thus an interrupted sweep is continued by running it again.
+    the replicate rep of a job is seeded by the SeedSequence of master_seed (see as_seed_sequence()) with (job hash, rep) appended to its spawn_key,
+    master_seed None is drawn once and kept in sweep_dir/master_seed.json (see persistent_master_seed()), thus the jobs keep their ids in a rerun.
+    the results of all the jobs are collected into sweep_dir/sweep_index.csv and returned as a pd.DataFrame.
+    processes and the patch_processes of run_replicate() can not be both larger than 1 (patch_processes is a fixed argument, it is not a parameter of grid_dir).
+    '''
+    check_pool_processes(processes, [run_args.get('patch_processes', 1)])
+    os.makedirs(sweep_dir, exist_ok=True)
+    master_seed_sequence = as_seed_sequence(persistent_master_seed(sweep_dir, master_seed))
+    graph_object_dir = {} if graph_object_dir is None else dict(graph_object_dir)
+    for graph_algorithm in grid_dir.get('graph_algorithm', ['full_connection']):
+        if graph_algorithm not in graph_object_dir:
+            graph_object_dir[graph_algorithm] = calculate_graph_object(meta_object=empty_metacommunity, graph_algorithm=graph_algorithm)
+    configuration_func = lambda parameters_dir: sweep_job_configuration(parameters_dir, run_args, master_seed_sequence, graph_object_dir)
+    job_ls = expand_sweep_grid(grid_dir, repeat_times, configuration_func)
+    job_configuration_dir = {job_id:configuration_func(parameters_dir) for job_id, parameters_dir, rep in job_ls}
+    logging.info('sweep of %d jobs, master_seed=%d', len(job_ls), master_seed_sequence.entropy)
+
+    todo_ls = []
+    for job in job_ls:
+        job_dir = os.path.join(sweep_dir, 'job=%s'%job[0])
+        check_sweep_job_dir(job_dir, job_configuration_dir[job[0]])
+        if not os.path.exists(os.path.join(job_dir, 'rep=%d_done.json'%job[2])):
+            todo_ls.append((job, np.random.SeedSequence(master_seed_sequence.entropy, spawn_key=master_seed_sequence.spawn_key + (int(job[0], 16), job[2]))))
+    logging.info('%d jobs are done, %d jobs to run', len(job_ls) - len(todo_ls), len(todo_ls))
+    for (job_id, parameters_dir, rep), seed_sequence in todo_ls:
+        graph_object = graph_object_dir[parameters_dir.get('graph_algorithm', 'full_connection')]
+        empty_metacommunity.emigrant_disp_rate_matrix(total_disp_among_rate=parameters_dir.get('total_disp_among_rate', run_args['total_disp_among_rate']),
+                                                      disp_kernal=parameters_dir.get('disp_kernal', run_args['disp_kernal']), graph_object=graph_object)
+
+    initargs = (sweep_dir, empty_metacommunity, mainland, graph_object_dir, species_registry_object, run_args, job_configuration_dir)
+    if processes == 1 or len(todo_ls) <= 1:
+        init_sweep_worker(*initargs)
+        for job_and_seed in todo_ls:
+            run_sweep_job(job_and_seed)
+    else:
+        with multiprocessing.Pool(processes=min(processes, len(todo_ls)), initializer=init_sweep_worker, initargs=initargs) as pool:
+            for result in pool.imap_unordered(run_sweep_job, todo_ls, chunksize=1):
+                logging.info('job=%s, rep=%d is done in %.8s s', result['job_id'], result['rep'], result['running_time'])
+
+    result_ls = []
+    for job_id, parameters_dir, rep in job_ls:
+        with open(os.path.join(sweep_dir, 'job=%s'%job_id, 'rep=%d_done.json'%rep)) as f:
+            result_ls.append(json.load(f))
+    index = pd.DataFrame(result_ls)
+    index.to_csv(os.path.join(sweep_dir, 'sweep_index.csv'), index=False)
+    return index
+
 def main():
     repeat_times =1
     all_time_step = 5000
+    master_seed = 2022               # the seed of the landscape and all the replicates (it is written to the log), None for a random one drawn once and kept in master_seed.json
+                                     # a sweep is continued and a replicate is resumed from its checkpoint only with the same seed, thus the seed must be fixed (or kept) for the resumption
+    master_seed = persistent_master_seed('.', master_seed)
+    location_seed_sequence, landscape_seed_sequence, replicates_seed_sequence = np.random.SeedSequence(master_seed).spawn(3)
     
     patch_num = 16
     metacommunity_x_range = range(0,10)
     metacommunity_y_range = range(0,10)
-    patch_location_ls = random.sample([(i,j) for i in metacommunity_x_range for j in metacommunity_y_range], patch_num)
+    patch_location_ls = rng_sample(np.random.default_rng(location_seed_sequence), [(i,j) for i in metacommunity_x_range for j in metacommunity_y_range], patch_num)
     
     hab_num_in_patch = 10
     hab_length, hab_width = 10, 10
@@ -2567,6 +4587,20 @@ def main():
     sexual_birth_rate = 1
     mutation_rate=0.0001
     
+    chunk_steps = 100                # the time steps buffered in memory before they are written to the files
+    # recording policies of the output streams: every (k steps), log_num (log-spaced time steps), last_num (the final N time steps)
+    # and monitoring_sites_num (microsites sampled in every habitat), see recording_policy()
+    recording_args_dir = {'species':{'every':1}, 'micro_phenotype':{'every':1}, 'macro_phenotype':{'every':1}}
+    export_csv_gz = False            # convert the binary time series into the csv.gz tables at the end of every replicate
+    checkpoint_every = 100           # the time steps between two checkpoints of a replicate, None for no checkpoint
+    processes = 1                    # the replicates run in parallel in a pool of processes, e.g., os.cpu_count()
+    habitat_storage = 'object'       # 'object' or 'array', see patch.add_habitat(), the object habitats are faster on small habitats (e.g., 10x10), the array habitats on large ones and with patch_processes
+    patch_processes = 1              # the patches of one replicate run in parallel in processes, it needs habitat_storage = 'array' and checkpoint_every = None, and it is not available on Windows (no fork)
+    # parameter sweep, e.g., {'disp_kernal':[1, 2, 4], 'graph_algorithm':['full_connection', 'minimum_spanning_tree']}, see run_sweep()
+    sweep_grid_dir = None
+    sweep_dir = 'sweep'
+    logging_level = logging.INFO     # the per-step diagnostics are logged at INFO (DEBUG for the matrices of the dispersal), logging.WARNING skips them
+
     propagules_rain_num = 10
     total_disp_among_rate = 0.1
     disp_kernal =2
@@ -2579,14 +4613,15 @@ def main():
     geno_len_ls=(20, 20)
     species_2_phenotype_ls = [(j/10, i/10) for i in range(10) for j in range(10)] # (index+1) indicates species_id
     
-    logging.basicConfig(filename='model_logging.log', format='%(asctime)s %(message)s', level=logging.INFO)
+    logging.basicConfig(filename='model_logging.log', format='%(asctime)s %(message)s', level=logging_level)
     empty_metacommunity, log_info = generating_empty_metacommunity(meta_name='empty_metacommunity', patch_num=patch_num, patch_location_ls=patch_location_ls, asexual_birth_rate=asexual_birth_rate, sexual_birth_rate=sexual_birth_rate, 
                                                     hab_num=hab_num_in_patch, hab_length=hab_length, hab_width=hab_width, micro_environment_values_ls=micro_environment_values_ls, macro_environment_values_ls=macro_environment_values_ls, 
-                                                    environment_types_num=environment_types_num, environment_types_name=environment_types_name, environment_variation_ls=environment_variation_ls)
-    logging.info('The empty metacommunity has been generated! \n' + log_info)
+                                                    environment_types_num=environment_types_num, environment_types_name=environment_types_name, environment_variation_ls=environment_variation_ls, habitat_storage=habitat_storage,
+                                                    seed_sequence=landscape_seed_sequence)
+    logging.info('The empty metacommunity has been generated! \n%s', log_info)
     
     mainland, log_info = generating_mainland_species_pool(species_num=species_num, traits_num=traits_num, pheno_names_ls=pheno_names_ls, pheno_var_ls=pheno_var_ls, geno_len_ls=geno_len_ls, species_2_phenotype_ls=species_2_phenotype_ls)
-    logging.info('The mainland species pool has been generated! \n' + log_info)
+    logging.info('The mainland species pool has been generated! \n%s', log_info)
     
     empty = calculate_graph_object(meta_object=empty_metacommunity, graph_algorithm='isolation')
     full = calculate_graph_object(meta_object=empty_metacommunity, graph_algorithm='full_connection')
@@ -2611,99 +4646,21 @@ def main():
     #steiner_read = read_graph_object_gpickle(empty_metacommunity, 'steiner_tree.gpickle')
     
     all_time_start = time.time()
-    for rep in range(repeat_times):
-        meta = copy.deepcopy(empty_metacommunity)
-        
-        #meta.meta_initialize(traits_num=2, pheno_names_ls=('micro_phenotype', 'macro_phenotype'), pheno_var_ls=(0.025, 0.025), geno_len_ls=(20, 20), reproduce_mode='asexual', species_2_phenotype_ls=species_2_phenotype_ls)
-        #meta.meta_initialize(traits_num=2, pheno_names_ls=('micro_phenotype', 'macro_phenotype'), pheno_var_ls=(0.025, 0.025), geno_len_ls=(20, 20), reproduce_mode='sexual', species_2_phenotype_ls=species_2_phenotype_ls)
-        
-        meta_sp_dis_all_time = meta.get_meta_microsites_optimum_sp_id_val(species_2_phenotype_ls)
-        meta_micro_phenotype_all_time = meta.get_meta_microsite_environment_values(environment_name='micro_environment')
-        meta_macro_phenotype_all_time = meta.get_meta_microsite_environment_values(environment_name='macro_environment')
-    
-        starttime = time.time()
-        for time_step in range(all_time_step):
-            d1 = time.time()
-            if time_step%100==0: print('rep=%d, time_step%d'%(rep, time_step))
-            logging.info('rep=%d, time_step=%d'%(rep, time_step))
-        
-            '''
-            # only asexual reproduction
-            log_info = meta.show_meta_individual_num()
-            logging.info(log_info)
-            log_info = meta.meta_dead_selection(base_dead_rate=base_dead_rate, fitness_wid=fitness_wid)
-            logging.info('Dead selection process done! \n' + log_info)
-            log_info = meta.colonize_from_propagules_rains(species_pool_obj=mainland, reproduce_mode='asexual', propagules_rain_num=propagules_rain_num)
-            logging.info('Colonizing process under propagules rains done! \n' + log_info)
-            log_info = meta.meta_asexual_reproduce_mutate_and_dispersal_among_patches(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, total_disp_among_rate=total_disp_among_rate, disp_kernal=disp_kernal, graph_object=full)
-            logging.info('Dispersal among patches process done! \n' + log_info)
-            log_info = meta.meta_asexual_birth_disp_within_patches(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, disp_within_rate=disp_within_rate)
-            logging.info('Dispersal within patch process done! \n' + log_info)
-            log_info = meta.meta_asexual_birth_mutate_germinate(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-            logging.info('Local birth and germination process done! \n' + log_info)
-            '''
-        
-            '''
-            # only sexual reproduction
-            log_info =  meta.show_meta_individual_num()
-            logging.info(log_info)
-            log_info = meta.meta_dead_selection(base_dead_rate=0.1, fitness_wid=0.5)
-            logging.info('Dead selection process done! \n' + log_info)
-            log_info = meta.colonize_from_propagules_rains(species_pool_obj=mainland, reproduce_mode='sexual', propagules_rain_num=100)
-            logging.info('Colonizing process under propagules rains done! \n' + log_info)
-            log_info = meta.meta_sexual_reproduce_mutate_and_dispersal_among_patches(mutation_rate=0.00001, pheno_var_ls=(0.025, 0.025), total_disp_among_rate=0.1, disp_kernal=1, graph_object=full)
-            logging.info('Dispersal among patches process done! \n' + log_info)
-            log_info = meta.meta_sexual_birth_disp_within_patches(mutation_rate=0.00001, pheno_var_ls=(0.025, 0.025), disp_within_rate=0.11)
-            logging.info('Dispersal within patch process done! \n' + log_info)
-            log_info = meta.meta_sexual_birth_mutate_germinate(mutation_rate=0.00001, pheno_var_ls=(0.025, 0.025))
-            logging.info('Local birth and germination process done! \n' + log_info)
-            '''
-            
-            
-            # asexual and sexual reproduction are both allowed.
-            log_info = meta.show_meta_individual_num()
-            logging.info(log_info)
-            log_info = meta.meta_dead_selection(base_dead_rate=base_dead_rate, fitness_wid=fitness_wid)
-            logging.info('Dead selection process done! \n' + log_info)
-            log_info = meta.pairwise_sexual_colonization_from_prpagules_rains(species_pool_obj=mainland, propagules_rain_num=propagules_rain_num)
-            logging.info('Colonizing process under propagules rains done! \n' + log_info)
-            logging.info(meta.meta_mixed_asex_and_sex_parents_num())
-            log_info = meta.meta_mixed_reproduce_mutate_and_dispersal_among_patches(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, total_disp_among_rate=total_disp_among_rate, disp_kernal=disp_kernal, graph_object=full)
-            logging.info('Dispersal among patches process done! \n' + log_info)
-            log_info = meta.meta_mixed_birth_disp_within_patches(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls, disp_within_rate=disp_within_rate)
-            logging.info('Dispersal within patch process done! \n' + log_info)
-            log_info = meta.meta_mixed_birth_mutate_germinate(mutation_rate=mutation_rate, pheno_var_ls=pheno_var_ls)
-            logging.info('Local birth and germination process done! \n' + log_info)
-            
-            
-            '''
-            # from offsprings pool
-            meta.show_meta_individual_num()
-            meta.meta_dead_selection(base_dead_rate=0.1, fitness_wid=0.5)
-            meta.meta_asex_reproduce_mutate(mutation_rate=0.00001, pheno_var_ls=(0.025, 0.025))
-            #meta.meta_sex_reproduce_mutate(mutation_rate=0.00001, pheno_var_ls=(0.025, 0.025))
-            meta.meta_disp_among_patches_from_offsprings_pool(total_disp_among_rate=0.1, disp_kernal=2, graph_object=mini)
-            meta.meta_disp_within_patch_from_offsprings_pool(disp_within_rate=0.11)
-            meta.meta_germinate_from_offsprings_pool()
-            '''
-            
-            meta_sp_dis_all_time = np.vstack((meta_sp_dis_all_time, meta.get_meta_microsites_individuals_sp_id_values()))
-            meta_micro_phenotype_all_time = np.vstack((meta_micro_phenotype_all_time, meta.get_meta_microsites_individuals_phenotype_values(trait_name='micro_phenotype')))
-            meta_macro_phenotype_all_time = np.vstack((meta_macro_phenotype_all_time, meta.get_meta_microsites_individuals_phenotype_values(trait_name='macro_phenotype')))
-            d2 = time.time()
-            logging.info("程序运行时间：%.8s s" % (d2-d1) + '\n') 
-            
-        endtime = time.time()
-        dtime = endtime - starttime
-        logging.info("一次模拟运行时间：%.8s s" % dtime) 
-        
-        meta.meta_distribution_data_all_time_to_csv_gz(dis_data_all_time=meta_sp_dis_all_time, first_row_index_name='optimun_sp_id_values', all_time_step=all_time_step, file_name='rep=%d_meta_species_distribution_all_time.gz'%(rep))
-        meta.meta_distribution_data_all_time_to_csv_gz(dis_data_all_time=meta_micro_phenotype_all_time, first_row_index_name='micro_environment_values', all_time_step=all_time_step, file_name='rep=%dmeta_micro_phenotype_all_time.gz'%(rep))
-        meta.meta_distribution_data_all_time_to_csv_gz(dis_data_all_time=meta_macro_phenotype_all_time, first_row_index_name='macro_environment_values', all_time_step=all_time_step, file_name='rep=%dmeta_macro_phenotype_all_time.gz'%(rep))
-        meta.meta_disp_current_mat_to_csv_gz(file_name='rep=%ddispersal_current_matrix.gz'%(rep))
-    
+    run_args = dict(all_time_step=all_time_step, species_2_phenotype_ls=species_2_phenotype_ls, pheno_names_ls=pheno_names_ls, pheno_var_ls=pheno_var_ls,
+                    base_dead_rate=base_dead_rate, fitness_wid=fitness_wid, mutation_rate=mutation_rate, propagules_rain_num=propagules_rain_num,
+                    total_disp_among_rate=total_disp_among_rate, disp_kernal=disp_kernal, disp_within_rate=disp_within_rate,
+                    recording_args_dir=recording_args_dir, chunk_steps=chunk_steps, export_csv_gz=export_csv_gz, checkpoint_every=checkpoint_every,
+                    patch_processes=patch_processes)
+    if sweep_grid_dir is None:
+        run_replicates(repeat_times=repeat_times, empty_metacommunity=empty_metacommunity, mainland=mainland, graph_object=full, master_seed=replicates_seed_sequence, processes=processes, **run_args)
+    else:
+        graph_object_dir = {'isolation':empty, 'full_connection':full, 'minimum_spanning_tree':mini, 'travelling salesman problem':tsp, 'paul_revere':paul,
+                            'one_center_network':one_center, 'hierachical_network':hierachy, 'regular_network':regular, 'small_world_network':small_world}
+        run_sweep(sweep_dir=sweep_dir, grid_dir=sweep_grid_dir, repeat_times=repeat_times, empty_metacommunity=empty_metacommunity, mainland=mainland,
+                  graph_object_dir=graph_object_dir, master_seed=replicates_seed_sequence, processes=processes, **run_args)
+
     all_time_end = time.time()
-    logging.info("总模拟运行时间：%.8s s" % (all_time_end-all_time_start)) 
+    logging.info("总模拟运行时间：%.8s s", all_time_end-all_time_start) 
     
 if __name__ == '__main__':
     main()
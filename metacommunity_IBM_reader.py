@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+reading the time series written by chunked_time_series_writer of metacommunity_IBM as memory-mapped arrays.
+
+the directory of a replicate keeps one raw <stream_name>.bin file ([rows x recorded sites], C order) per stream,
+metadata.json (dtype, sentinel, rows, first_row_index_name, recorded time_steps and sites of every stream)
+and columns.json (patch_id, habitat_id, microsite_id of all the sites in the metacommunity).
+the row 0 of a stream is the reference values (e.g., the optimum species) and the following rows are the recorded time steps.
+"""
+import numpy as np
+import pandas as pd
+import json
+import os
+
+class time_series_reader():
+    '''
+    the streams are opened as read-only np.memmap, thus only the pages of the selected rows and columns are read from the disk.
+    the columns are selected by patch_id, h_id and microsite_id ('r%d, c%d'), as columns_patch_habitat_microsites_id() of the metacommunity,
+    and the rows by the time steps of the simulation.
+    '''
+    def __init__(self, dir_name):
+        self.dir_name = dir_name
+        with open(os.path.join(dir_name, 'metadata.json')) as f:
+            self.metadata = json.load(f)
+        with open(os.path.join(dir_name, 'columns.json')) as f:
+            columns_dir = json.load(f)
+        self.sites_num = self.metadata['sites_num']
+        self.columns_patch_id = np.array(columns_dir['patch_id'])
+        self.columns_habitat_id = np.array(columns_dir['habitat_id'])
+        self.columns_mocrosite_id = np.array(columns_dir['microsite_id'])
+        self.memmap_dir = {}
+
+    def get_stream_names(self):
+        return list(self.metadata['streams'].keys())
+
+    def get_stream_info(self, stream_name):
+        if stream_name not in self.metadata['streams']:
+            raise ValueError('stream_name inputed is no found.')
+        return self.metadata['streams'][stream_name]
+
+    def get_time_steps(self, stream_name):
+        ''' the time steps of the rows 1, 2, ... of the stream '''
+        stream = self.get_stream_info(stream_name)
+        return np.array(stream.get('time_steps', range(stream['rows']-1)), dtype=int)
+
+    def get_time_steps_num(self, stream_name):
+        ''' the number of time steps written to the stream, the row 0 is not counted '''
+        return self.get_stream_info(stream_name)['rows'] - 1
+
+    def get_sites(self, stream_name):
+        ''' the site indexes of the columns of the stream in the metacommunity '''
+        sites = self.get_stream_info(stream_name).get('sites')
+        return np.arange(self.sites_num) if sites is None else np.array(sites, dtype=int)
+
+    def get_memmap(self, stream_name):
+        ''' return the whole stream as a read-only [rows x recorded sites] np.memmap in the dtype on the disk (sentinel values are not replaced) '''
+        if stream_name not in self.memmap_dir:
+            stream = self.get_stream_info(stream_name)
+            shape = (stream['rows'], len(self.get_sites(stream_name)))
+            if stream['rows'] == 0:
+                return np.empty(shape, dtype=stream['dtype'])
+            self.memmap_dir[stream_name] = np.memmap(os.path.join(self.dir_name, stream['file']), dtype=stream['dtype'], mode='r', shape=shape)
+        return self.memmap_dir[stream_name]
+
+    def select_columns(self, stream_name, patch_id=None, h_id=None, microsite_id=None):
+        ''' return the column indexes of the stream of the selected sites, every argument is None (all), one id or a list of ids.
+        a contiguous selection, e.g., a patch or a habitat, is returned as a slice. '''
+        sites = self.get_sites(stream_name)
+        mask = np.ones(len(sites), dtype=bool)
+        for ids, columns in ((patch_id, self.columns_patch_id), (h_id, self.columns_habitat_id), (microsite_id, self.columns_mocrosite_id)):
+            if ids is not None:
+                mask &= np.isin(columns[sites], np.atleast_1d(ids))
+        columns_index = np.flatnonzero(mask)
+        if len(columns_index) > 0 and columns_index[-1] - columns_index[0] + 1 == len(columns_index):
+            return slice(int(columns_index[0]), int(columns_index[-1]) + 1)
+        return columns_index
+
+    def select_rows(self, stream_name, time_steps=None, first_row=False):
+        ''' return the row indexes of the recorded time steps among time_steps, time_steps is None (all), a range, a slice or a list of time steps.
+        the row 0 of the reference values is put in front if first_row is True. '''
+        recorded_time_steps = self.get_time_steps(stream_name)
+        if time_steps is None:
+            rows = np.arange(len(recorded_time_steps)) + 1
+        else:
+            if isinstance(time_steps, slice):
+                time_steps = range(self.metadata['all_time_step'])[time_steps]
+            rows = np.flatnonzero(np.isin(recorded_time_steps, np.asarray(time_steps, dtype=int).reshape(-1))) + 1
+        if first_row:
+            rows = np.append(0, rows)
+        if len(rows) > 1 and np.all(np.diff(rows) == 1):
+            return slice(int(rows[0]), int(rows[-1]) + 1)
+        return rows
+
+    def read(self, stream_name, time_steps=None, patch_id=None, h_id=None, microsite_id=None, first_row=False):
+        ''' return the selected [time_steps x sites] values of the stream as an array in memory, np.nan for the empty microsites '''
+        data = self.get_memmap(stream_name)
+        rows = self.select_rows(stream_name, time_steps, first_row)
+        columns = self.select_columns(stream_name, patch_id, h_id, microsite_id)
+        if isinstance(rows, slice):
+            values = np.array(data[rows, columns])
+        else:
+            values = np.array(data[rows][:, columns])
+        sentinel = self.get_stream_info(stream_name)['sentinel']
+        if sentinel is not None:
+            values = np.where(values == sentinel, np.nan, values)
+        return values
+
+    def read_first_row(self, stream_name, patch_id=None, h_id=None, microsite_id=None):
+        ''' return the reference values (the row 0) of the selected sites '''
+        return self.read(stream_name, time_steps=[], patch_id=patch_id, h_id=h_id, microsite_id=microsite_id, first_row=True)[0]
+
+    def read_dataframe(self, stream_name, time_steps=None, patch_id=None, h_id=None, microsite_id=None, first_row=False):
+        ''' return the selection as the pd.DataFrame of the csv tables, i.e., the index 'time_step%d' and the columns (patch_id, h_id, microsite_id) '''
+        values = self.read(stream_name, time_steps, patch_id, h_id, microsite_id, first_row)
+        rows = np.arange(self.get_stream_info(stream_name)['rows'])[self.select_rows(stream_name, time_steps, first_row)]
+        row_names = [self.get_stream_info(stream_name)['first_row_index_name']] + ['time_step%d'%i for i in self.get_time_steps(stream_name)]
+        sites = self.get_sites(stream_name)[self.select_columns(stream_name, patch_id, h_id, microsite_id)]
+        columns = [self.columns_patch_id[sites], self.columns_habitat_id[sites], self.columns_mocrosite_id[sites]]
+        return pd.DataFrame(values, index=[row_names[row] for row in rows], columns=columns)
+
+def open_time_series_ls(dir_name_ls):
+    ''' return the readers of the directories of many replicates, nothing but metadata.json and columns.json is read '''
+    return [time_series_reader(dir_name) for dir_name in dir_name_ls]
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+tests of the bit-packed genotypes (pack_genotype(), unpack_genotype(), popcount()) and of the batch mutation
+(batch_mutation_arrays(), batch_mutation()) of metacommunity_IBM 3.3.4.py.
+"""
+import numpy as np
+import pytest
+
+from test_model_regression import model
+
+@pytest.mark.parametrize('geno_len', [1, 20, 63, 64, 65, 100, 128, 130])
+def test_pack_unpack_round_trip(geno_len):
+    rng = np.random.default_rng(geno_len)
+    genotype = rng.integers(0, 2, size=(5, 2, 2, geno_len)).astype(np.uint8)
+    words = model.pack_genotype(genotype)
+    assert words.dtype == np.uint64 and words.shape == (5, 2, 2, model.genotype_words_num(geno_len))
+    np.testing.assert_array_equal(model.unpack_genotype(words, geno_len), genotype)
+    np.testing.assert_array_equal(model.unpack_genotype(words, words.shape[-1]*64)[..., geno_len:], 0)      # the padding bits stay 0
+    np.testing.assert_array_equal(model.popcount(words).sum(axis=-1), genotype.sum(axis=-1))
+
+def test_popcount_counts_the_bits_of_every_word():
+    words = np.random.default_rng(1).integers(0, 2**63, size=1000, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    words = np.append(words, np.array([0, 2**64-1], dtype=np.uint64))
+    np.testing.assert_array_equal(model.popcount(words), [bin(int(word)).count('1') for word in words])
+
+def test_pack_bi_genotype_round_trip():
+    genotype_1, genotype_2 = np.random.default_rng(2).integers(0, 2, size=(2, 70)).astype(np.uint8)
+    unpacked_1, unpacked_2 = model.unpack_bi_genotype(model.pack_bi_genotype([genotype_1, genotype_2]), 70)
+    np.testing.assert_array_equal(unpacked_1, genotype_1)
+    np.testing.assert_array_equal(unpacked_2, genotype_2)
+
+def mutated_offsprings(offs_num, geno_len_arr, mutation_rate, seed):
+    ''' (genotype before, genotype after, phenotype before, phenotype after, returned index) of batch_mutation_arrays() on random offsprings '''
+    rng = np.random.default_rng(seed)
+    words_num = model.genotype_words_num(max(geno_len_arr))
+    genotype = np.stack([np.pad(model.pack_genotype(rng.integers(0, 2, size=(offs_num, 2, geno_len))), [(0, 0), (0, 0), (0, words_num - model.genotype_words_num(geno_len))])
+                         for geno_len in geno_len_arr], axis=1)
+    phenotype = rng.random((offs_num, len(geno_len_arr)))
+    genotype_0, phenotype_0 = genotype.copy(), phenotype.copy()
+    mutated_index = model.batch_mutation_arrays(genotype, phenotype, geno_len_arr, mutation_rate, (0.025, 0.025), rng)
+    return genotype_0, genotype, phenotype_0, phenotype, mutated_index
+
+def test_batch_mutation_arrays_is_the_per_locus_bernoulli_process():
+    offs_num, geno_len_arr, mutation_rate = 20000, np.array([20, 70]), 0.01
+    loci_num = 2*geno_len_arr.sum()
+    genotype_0, genotype, phenotype_0, phenotype, mutated_index = mutated_offsprings(offs_num, geno_len_arr, mutation_rate, seed=3)
+    flips = np.concatenate([model.unpack_genotype(genotype[:, t] ^ genotype_0[:, t], geno_len).reshape(offs_num, -1) for t, geno_len in enumerate(geno_len_arr)], axis=1)
+    assert flips.shape == (offs_num, loci_num)
+    for t, geno_len in enumerate(geno_len_arr):          # no bit out of the loci is flipped
+        np.testing.assert_array_equal(model.unpack_genotype(genotype[:, t] ^ genotype_0[:, t], genotype.shape[-1]*64)[..., geno_len:], 0)
+
+    # the flips per offspring ~ binomial(loci_num, mutation_rate)
+    flips_num_arr = flips.sum(axis=1)
+    assert abs(flips_num_arr.mean() - loci_num*mutation_rate) < 4*np.sqrt(loci_num*mutation_rate*(1-mutation_rate)/offs_num)
+    assert abs(flips_num_arr.var() - loci_num*mutation_rate*(1-mutation_rate)) < 0.1
+    for k in range(4):
+        p = np.exp(np.log(np.arange(loci_num-k+1, loci_num+1)).sum() - np.log(np.arange(1, k+1)).sum() + k*np.log(mutation_rate) + (loci_num-k)*np.log1p(-mutation_rate))
+        assert abs((flips_num_arr == k).mean() - p) < 4*np.sqrt(p*(1-p)/offs_num)
+
+    # every locus flips with the probability mutation_rate, the chi-square of the loci is about its degrees of freedom
+    locus_flips_arr = flips.sum(axis=0)
+    expected = offs_num*mutation_rate
+    chi_square = ((locus_flips_arr - expected)**2/(expected*(1-mutation_rate))).sum()
+    assert abs(chi_square - loci_num) < 5*np.sqrt(2*loci_num)
+    assert np.all(np.abs(locus_flips_arr - expected) < 5*np.sqrt(expected*(1-mutation_rate)))
+
+    # only the mutated traits of the mutated offsprings get a new phenotype, the genotype mean plus the noise
+    np.testing.assert_array_equal(mutated_index, np.flatnonzero(flips_num_arr))
+    trait_mutated = np.stack([flips[:, :2*geno_len_arr[0]].any(axis=1), flips[:, 2*geno_len_arr[0]:].any(axis=1)], axis=1)
+    np.testing.assert_array_equal(phenotype[~trait_mutated], phenotype_0[~trait_mutated])
+    genotype_mean = model.popcount(genotype).sum(axis=(2, 3))/(2*geno_len_arr)
+    assert np.all(np.abs(phenotype[trait_mutated] - genotype_mean[trait_mutated]) < 6*0.025)
+
+def test_batch_mutation_arrays_without_mutation_rate_changes_nothing():
+    genotype_0, genotype, phenotype_0, phenotype, mutated_index = mutated_offsprings(100, np.array([20, 20]), 0, seed=4)
+    assert len(mutated_index) == 0
+    np.testing.assert_array_equal(genotype, genotype_0)
+    np.testing.assert_array_equal(phenotype, phenotype_0)
+
+def test_batch_mutation_of_individuals_is_batch_mutation_arrays():
+    offs_num, geno_len_arr, mutation_rate = 500, np.array([20, 70]), 0.02
+    rng = np.random.default_rng(5)
+    pheno_names_ls = ('micro_phenotype', 'macro_phenotype')
+    indi_object_ls = []
+    for n in range(offs_num):
+        genotype_set = {pheno_name:model.pack_genotype(rng.integers(0, 2, size=(2, geno_len))) for pheno_name, geno_len in zip(pheno_names_ls, geno_len_arr)}
+        phenotype_set = {pheno_name:rng.random() for pheno_name in pheno_names_ls}
+        indi_object_ls.append(model.individual('sp1', 2, pheno_names_ls, genotype_set=genotype_set, phenotype_set=phenotype_set, geno_len_ls=tuple(geno_len_arr)))
+    words_num = model.genotype_words_num(max(geno_len_arr))
+    genotype = np.array([[np.pad(indi_object.genotype_set[pheno_name], [(0, 0), (0, words_num - indi_object.genotype_set[pheno_name].shape[-1])]) for pheno_name in pheno_names_ls]
+                         for indi_object in indi_object_ls])
+    phenotype = np.array([[indi_object.phenotype_set[pheno_name] for pheno_name in pheno_names_ls] for indi_object in indi_object_ls])
+
+    mutated_index = model.batch_mutation_arrays(genotype, phenotype, geno_len_arr, mutation_rate, (0.025, 0.025), np.random.default_rng(6))
+    assert model.batch_mutation(indi_object_ls, mutation_rate, (0.025, 0.025), np.random.default_rng(6)) == len(mutated_index) > 0
+    for n, indi_object in enumerate(indi_object_ls):
+        for t, pheno_name in enumerate(pheno_names_ls):
+            words = indi_object.genotype_set[pheno_name]
+            np.testing.assert_array_equal(words, genotype[n, t, :, :words.shape[-1]])
+            assert indi_object.phenotype_set[pheno_name] == pytest.approx(phenotype[n, t])
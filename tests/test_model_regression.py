@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+regression tests of the exactness properties of metacommunity_IBM 3.3.4.py on a small seeded landscape (4 patches of 3 habitats of 5x5 microsites):
+a resumed replicate writes the same outputs as an uninterrupted one, the patch-parallel run writes the same outputs as the serial run,
+time_series_to_csv_gz() writes the table of meta_distribution_data_all_time_to_csv_gz(), and the incremental counters equal a recount of the sites.
+"""
+import importlib.util
+import gzip
+import os
+import sys
+
+import numpy as np
+import pytest
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'metacommunity_IBM 3.3.4.py')
+spec = importlib.util.spec_from_file_location('metacommunity_IBM', MODEL_PATH)
+model = importlib.util.module_from_spec(spec)
+sys.modules['metacommunity_IBM'] = model            # the checkpoints pickle the objects of the module by its name
+spec.loader.exec_module(model)
+
+all_time_step = 50
+pheno_names_ls = ('micro_phenotype', 'macro_phenotype')
+species_2_phenotype_ls = [(j/10, i/10) for i in range(10) for j in range(10)]
+run_args = dict(all_time_step=all_time_step, species_2_phenotype_ls=species_2_phenotype_ls, pheno_names_ls=pheno_names_ls, pheno_var_ls=(0.025, 0.025),
+                base_dead_rate=0.1, fitness_wid=0.5, mutation_rate=0.0001, propagules_rain_num=10, total_disp_among_rate=0.1, disp_kernal=2, disp_within_rate=0.11,
+                recording_args_dir={'species':{'every':1}, 'micro_phenotype':{'every':1}, 'macro_phenotype':{'every':1}}, chunk_steps=8)
+
+def make_landscape(habitat_storage, seed=2022):
+    ''' return (empty_metacommunity, mainland, graph_object) of the small landscape '''
+    landscape_seed_sequence, mainland_seed_sequence = np.random.SeedSequence(seed).spawn(2)
+    empty_metacommunity, log_info = model.generating_empty_metacommunity(meta_name='empty_metacommunity', patch_num=4, patch_location_ls=[(0, 0), (0, 3), (2, 1), (3, 4)],
+                                                                         asexual_birth_rate=0.5, sexual_birth_rate=1, hab_num=3, hab_length=5, hab_width=5,
+                                                                         micro_environment_values_ls=[0.0, 0.1, 0.2], macro_environment_values_ls=[0.0, 0.1, 0.2, 0.3, 0.4],
+                                                                         environment_types_num=2, environment_types_name=('micro_environment', 'macro_environment'),
+                                                                         environment_variation_ls=(0.025, 0.025), habitat_storage=habitat_storage, seed_sequence=landscape_seed_sequence)
+    mainland, log_info = model.generating_mainland_species_pool(species_num=100, traits_num=2, pheno_names_ls=pheno_names_ls, pheno_var_ls=(0.025, 0.025), geno_len_ls=(20, 20),
+                                                                species_2_phenotype_ls=species_2_phenotype_ls, rng=np.random.default_rng(mainland_seed_sequence))
+    return empty_metacommunity, mainland, empty_metacommunity.full_con_map()
+
+def run_in_dir(dir_name, habitat_storage, **kwargs):
+    ''' run the replicate 0 of the landscape in dir_name with the seed 7, return dir_name '''
+    empty_metacommunity, mainland, graph_object = make_landscape(habitat_storage)
+    args = dict(run_args, **kwargs)
+    os.makedirs(dir_name, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(dir_name)
+    try:
+        model.run_replicate(rep=0, empty_metacommunity=empty_metacommunity, mainland=mainland, graph_object=graph_object, seed_sequence=np.random.SeedSequence(7), **args)
+    finally:
+        os.chdir(cwd)
+    return dir_name
+
+def read_outputs(dir_name):
+    ''' {relative path: bytes} of all the files written by a replicate, the gzip files are decompressed since their headers keep the time of writing '''
+    outputs = {}
+    for root, dirs, files in os.walk(dir_name):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            opener = gzip.open if file_name.endswith('.gz') else open
+            with opener(path, 'rb') as f:
+                outputs[os.path.relpath(path, dir_name)] = f.read()
+    return outputs
+
+def assert_same_outputs(dir_name_1, dir_name_2):
+    outputs_1, outputs_2 = read_outputs(dir_name_1), read_outputs(dir_name_2)
+    assert sorted(outputs_1.keys()) == sorted(outputs_2.keys())
+    for name in outputs_1.keys():
+        assert outputs_1[name] == outputs_2[name], name
+
+@pytest.mark.parametrize('habitat_storage', ['object', 'array'])
+def test_resumed_replicate_writes_the_outputs_of_an_uninterrupted_one(tmp_path, monkeypatch, habitat_storage):
+    uninterrupted_dir = run_in_dir(str(tmp_path/'uninterrupted'), habitat_storage, checkpoint_every=20)
+
+    update = model.community_statistics.update
+    def interrupted_update(self, meta_object, time_step):
+        if time_step == 33:
+            raise KeyboardInterrupt
+        return update(self, meta_object, time_step)
+    monkeypatch.setattr(model.community_statistics, 'update', interrupted_update)
+    with pytest.raises(KeyboardInterrupt):
+        run_in_dir(str(tmp_path/'resumed'), habitat_storage, checkpoint_every=20)
+    monkeypatch.setattr(model.community_statistics, 'update', update)
+
+    checkpoint_file_name = str(tmp_path/'resumed'/'rep=0_checkpoint.pkl')
+    model.checkpoint_writer(checkpoint_file_name).wait()
+    assert model.read_checkpoint(checkpoint_file_name)['time_step'] == 20
+    monkeypatch.chdir(tmp_path/'resumed')
+    model.resume_replicate('rep=0_checkpoint.pkl')
+    assert not os.path.exists('rep=0_checkpoint.pkl')
+    assert_same_outputs(uninterrupted_dir, str(tmp_path/'resumed'))
+
+@pytest.mark.skipif('fork' not in model.multiprocessing.get_all_start_methods(), reason='the patch-parallel mode needs the fork start method')
+def test_patch_parallel_run_writes_the_outputs_of_the_serial_run(tmp_path):
+    serial_dir = run_in_dir(str(tmp_path/'serial'), 'array', patch_processes=1)
+    parallel_dir = run_in_dir(str(tmp_path/'parallel'), 'array', patch_processes=2)
+    assert_same_outputs(serial_dir, parallel_dir)
+
+def test_patch_parallel_mode_is_rejected_without_fork(tmp_path, monkeypatch):
+    monkeypatch.setattr(model.multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    with pytest.raises(ValueError, match='fork'):
+        model.check_pool_processes(1, [2])
+    with pytest.raises(ValueError, match='fork'):
+        run_in_dir(str(tmp_path/'run'), 'array', patch_processes=2, checkpoint_every=None)
+    assert model.check_patch_processes(1) == 0
+
+def test_time_series_to_csv_gz_writes_the_table_of_the_metacommunity(tmp_path):
+    dir_name = run_in_dir(str(tmp_path/'run'), 'array', export_csv_gz=True)
+    empty_metacommunity, mainland, graph_object = make_landscape('array')
+    recorder = model.time_series_recorder(all_time_step, empty_metacommunity.get_meta_size())
+    for stream_name, file_name in (('species', 'rep=0_meta_species_distribution_all_time.gz'), ('micro_phenotype', 'rep=0meta_micro_phenotype_all_time.gz')):
+        with open(os.path.join(dir_name, 'rep=0_time_series', 'metadata.json')) as f:
+            stream = model.json.load(f)['streams'][stream_name]
+        data = np.fromfile(os.path.join(dir_name, 'rep=0_time_series', stream['file']), dtype=stream['dtype']).reshape(stream['rows'], -1)
+        recorder.sentinel_dir[stream_name] = stream['sentinel']
+        empty_metacommunity.meta_distribution_data_all_time_to_csv_gz(recorder.decode(stream_name, data), stream['first_row_index_name'], all_time_step,
+                                                                       file_name=str(tmp_path/file_name))
+        with gzip.open(os.path.join(dir_name, file_name), 'rb') as f_1, gzip.open(str(tmp_path/file_name), 'rb') as f_2:
+            assert f_1.read() == f_2.read()
+
+def recounted_counters(h_object):
+    ''' the counters of the habitat recounted from its site lists '''
+    mating_pairs = sum(min(len(sp_id_val.get('female', ())), len(sp_id_val.get('male', ()))) for sp_id_val in h_object.species_category.values())
+    return {'individuals':len(h_object.occupied_site_pos_ls), 'empty_sites':len(h_object.empty_site_pos_ls), 'asexual_parents':len(h_object.asexual_parent_pos_ls),
+            'mating_pairs':mating_pairs, 'mixed_mating_pairs':h_object.pairwise_parents_num(h_object.species_category_for_sexual_parents_pos)}
+
+def assert_counters_are_recounts(meta):
+    meta_counters = dict.fromkeys(meta.counters.keys(), 0)
+    for patch_object in meta.patch_object_ls:
+        patch_counters = dict.fromkeys(patch_object.counters.keys(), 0)
+        for h_object in patch_object.set.values():
+            counters = recounted_counters(h_object)
+            assert h_object.counters == counters
+            assert h_object.indi_num == counters['individuals']
+            assert counters['individuals'] == int((h_object.get_hab_microsites_species_codes() != -1).sum())
+            assert counters['individuals'] + counters['empty_sites'] == h_object.size
+            for key, value in counters.items():
+                patch_counters[key] += value
+        assert patch_object.counters == patch_counters
+        for key, value in patch_counters.items():
+            meta_counters[key] += value
+    assert meta.counters == meta_counters
+
+@pytest.mark.parametrize('habitat_storage', ['object', 'array'])
+def test_incremental_counters_equal_a_recount(habitat_storage):
+    empty_metacommunity, mainland, graph_object = make_landscape(habitat_storage)
+    meta = model.copy.deepcopy(empty_metacommunity)
+    meta.seed_rng(np.random.SeedSequence(7))
+    meta.meta_init_storage(pheno_names_ls, (20, 20))
+    for time_step in range(all_time_step):                 # the time step of run_replicate()
+        meta.meta_dead_selection(base_dead_rate=0.1, fitness_wid=0.5)
+        assert_counters_are_recounts(meta)
+        meta.pairwise_sexual_colonization_from_prpagules_rains(species_pool_obj=mainland, propagules_rain_num=10)
+        assert_counters_are_recounts(meta)
+        meta.meta_reproduce_mutate_and_multinomial_dispersal_among_patches(reproduce_mode='mixed', mutation_rate=0.0001, pheno_var_ls=(0.025, 0.025), total_disp_among_rate=0.1,
+                                                                           disp_kernal=2, graph_object=graph_object)
+        assert_counters_are_recounts(meta)
+        meta.meta_mixed_birth_disp_within_and_germinate(mutation_rate=0.0001, pheno_var_ls=(0.025, 0.025), disp_within_rate=0.11)
+        assert_counters_are_recounts(meta)
+    assert meta.get_meta_individual_num() > 0
+
+def test_sweep_run_again_with_a_random_master_seed_does_no_work(tmp_path, monkeypatch):
+    empty_metacommunity, mainland, graph_object = make_landscape('array')
+    sweep_args = dict(run_args, all_time_step=5)
+    sweep_dir = str(tmp_path/'sweep')
+    index_1 = model.run_sweep(sweep_dir=sweep_dir, grid_dir={'disp_kernal':[1, 2]}, repeat_times=1, empty_metacommunity=empty_metacommunity, mainland=mainland,
+                              graph_object_dir={'full_connection':graph_object}, master_seed=None, **sweep_args)
+    entries_ls = sorted(os.listdir(sweep_dir))
+    assert entries_ls == sorted(['master_seed.json', 'sweep_index.csv'] + ['job=%s'%job_id for job_id in index_1['job_id']])
+
+    def run_sweep_job(job_and_seed):
+        raise AssertionError('the job %s is run again'%(job_and_seed[0],))
+    monkeypatch.setattr(model, 'run_sweep_job', run_sweep_job)
+    index_2 = model.run_sweep(sweep_dir=sweep_dir, grid_dir={'disp_kernal':[1, 2]}, repeat_times=1, empty_metacommunity=empty_metacommunity, mainland=mainland,
+                              graph_object_dir={'full_connection':graph_object}, master_seed=None, **sweep_args)
+    assert sorted(os.listdir(sweep_dir)) == entries_ls
+    assert list(index_2['job_id']) == list(index_1['job_id'])
+
+def test_replicates_run_again_with_a_random_master_seed_are_resumed(tmp_path, monkeypatch):
+    empty_metacommunity, mainland, graph_object = make_landscape('object')
+    update = model.community_statistics.update
+    def interrupted_update(self, meta_object, time_step):
+        if time_step == 33:
+            raise KeyboardInterrupt
+        return update(self, meta_object, time_step)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(model.community_statistics, 'update', interrupted_update)
+    with pytest.raises(KeyboardInterrupt):
+        model.run_replicates(repeat_times=1, empty_metacommunity=empty_metacommunity, mainland=mainland, graph_object=graph_object, master_seed=None,
+                             **dict(run_args, checkpoint_every=20))
+    monkeypatch.setattr(model.community_statistics, 'update', update)
+    model.checkpoint_writer('rep=0_checkpoint.pkl').wait()
+
+    run_replicate = model.run_replicate
+    start_time_step_ls = []
+    def recorded_run_replicate(checkpoint_state=None, **kwargs):
+        start_time_step_ls.append(None if checkpoint_state is None else checkpoint_state['time_step'])
+        return run_replicate(checkpoint_state=checkpoint_state, **kwargs)
+    monkeypatch.setattr(model, 'run_replicate', recorded_run_replicate)
+    model.run_replicates(repeat_times=1, empty_metacommunity=empty_metacommunity, mainland=mainland, graph_object=graph_object, master_seed=None,
+                         **dict(run_args, checkpoint_every=20))
+    assert start_time_step_ls == [20]
+    assert not os.path.exists('rep=0_checkpoint.pkl')
+
+@pytest.mark.parametrize('expectation', ['asexual', 'mixed'])
+def test_dispersal_matrices_conserve_the_emigrants_and_the_empty_sites(expectation):
+    empty_metacommunity, mainland, graph_object = make_landscape('object')
+    meta = model.copy.deepcopy(empty_metacommunity)
+    meta.seed_rng(np.random.SeedSequence(7))
+    meta.meta_init_storage(pheno_names_ls, (20, 20))
+    for time_step in range(10):
+        meta.meta_dead_selection(base_dead_rate=0.1, fitness_wid=0.5)
+        meta.pairwise_sexual_colonization_from_prpagules_rains(species_pool_obj=mainland, propagules_rain_num=10)
+        meta.meta_mixed_birth_disp_within_and_germinate(mutation_rate=0.0001, pheno_var_ls=(0.025, 0.025), disp_within_rate=0.11)
+    if expectation == 'asexual':
+        offs_num_arr = np.array([p.get_patch_individual_num() * p.asexual_birth_rate for p in meta.patch_object_ls])
+    else:
+        offs_num_arr = np.array([p.get_patch_mixed_asexual_parent_num() * p.asexual_birth_rate + p.get_patch_mixed_sexual_pairwise_parents_num() * p.sexual_birth_rate
+                                 for p in meta.patch_object_ls])
+    empty_sites_num_arr = np.array([p.patch_empty_sites_num() for p in meta.patch_object_ls])
+    assert offs_num_arr.sum() > 0
+    for seed in range(20):
+        meta.rng = np.random.default_rng(seed)
+        emigrants_matrix = getattr(meta, 'emigrant_matrix_expectation_%s'%expectation)(total_disp_among_rate=0.1, disp_kernal=2, graph_object=graph_object)
+        assert isinstance(emigrants_matrix, np.ndarray) and np.array_equal(emigrants_matrix, np.round(emigrants_matrix))
+        assert np.all((emigrants_matrix.sum(axis=1) == np.floor(offs_num_arr)) | (emigrants_matrix.sum(axis=1) == np.ceil(offs_num_arr)))
+        immigrants_matrix = meta.immigrant_matrix_to_patch_empty_sites(emigrants_matrix)
+        arrived = emigrants_matrix.sum(axis=0) > 0
+        assert np.array_equal(immigrants_matrix.sum(axis=0)[arrived], empty_sites_num_arr[arrived])
+        assert np.all(immigrants_matrix.sum(axis=0)[~arrived] == 0)
+
+def test_checkpoint_is_resumed_by_the_model_loaded_under_another_name(tmp_path, monkeypatch):
+    uninterrupted_dir = run_in_dir(str(tmp_path/'uninterrupted'), 'object', checkpoint_every=20)
+    update = model.community_statistics.update
+    def interrupted_update(self, meta_object, time_step):
+        if time_step == 33:
+            raise KeyboardInterrupt
+        return update(self, meta_object, time_step)
+    monkeypatch.setattr(model.community_statistics, 'update', interrupted_update)
+    with pytest.raises(KeyboardInterrupt):
+        run_in_dir(str(tmp_path/'resumed'), 'object', checkpoint_every=20)
+    monkeypatch.setattr(model.community_statistics, 'update', update)
+    model.checkpoint_writer(str(tmp_path/'resumed'/'rep=0_checkpoint.pkl')).wait()
+
+    # e.g., the checkpoint of the model imported is resumed by the model run as a script (__main__)
+    script_spec = importlib.util.spec_from_file_location('metacommunity_IBM_script', MODEL_PATH)
+    script_model = importlib.util.module_from_spec(script_spec)
+    monkeypatch.setitem(sys.modules, 'metacommunity_IBM_script', script_model)
+    script_spec.loader.exec_module(script_model)
+    monkeypatch.chdir(tmp_path/'resumed')
+    monkeypatch.setattr(script_model, 'model_version', '0.0.0')
+    with pytest.raises(ValueError, match='version'):
+        script_model.resume_replicate('rep=0_checkpoint.pkl')
+    monkeypatch.setattr(script_model, 'model_version', model.model_version)
+    assert type(script_model.read_checkpoint('rep=0_checkpoint.pkl')['meta']) is script_model.metacommunity
+    script_model.resume_replicate('rep=0_checkpoint.pkl')
+    assert_same_outputs(uninterrupted_dir, str(tmp_path/'resumed'))
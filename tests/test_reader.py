@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+tests of time_series_reader of metacommunity_IBM_reader.py on a short replicate of the small landscape of test_model_regression.py,
+the streams are recorded with the every, log_num, last_num and monitoring_sites_num policies and the selections of the reader are compared
+with the values passed to the recorder.
+"""
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+from test_model_regression import model, run_in_dir
+
+READER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'metacommunity_IBM_reader.py')
+spec = importlib.util.spec_from_file_location('metacommunity_IBM_reader', READER_PATH)
+reader_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(reader_module)
+
+recording_args_dir = {'species':{'every':3, 'monitoring_sites_num':4}, 'micro_phenotype':{'log_num':12}, 'macro_phenotype':{'every':2, 'last_num':9}}
+
+@pytest.fixture(scope='module')
+def recorded_run(tmp_path_factory):
+    ''' (reader, {stream_name: {time_step: values of all the microsites}}, {stream_name: first row}) of a replicate of 50 time steps '''
+    recorded_dir, first_row_dir = {}, {}
+    record = model.chunked_time_series_writer.record
+    def recorded_record(self, stream_name, values, time_step=None):
+        recorded = record(self, stream_name, values, time_step)
+        if time_step is None:
+            first_row_dir[stream_name] = np.array(values, dtype=float)
+        elif recorded:
+            recorded_dir.setdefault(stream_name, {})[time_step] = np.array(values, dtype=float)     # values is a buffer reused at every time step
+        return recorded
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setattr(model.chunked_time_series_writer, 'record', recorded_record)
+    try:
+        dir_name = run_in_dir(str(tmp_path_factory.mktemp('run')), 'array', recording_args_dir=recording_args_dir)
+    finally:
+        monkeypatch.undo()
+    return reader_module.time_series_reader(os.path.join(dir_name, 'rep=0_time_series')), recorded_dir, first_row_dir
+
+def expected_values(reader, recorded_dir, stream_name, time_steps=None, patch_id=None, h_id=None, microsite_id=None):
+    ''' the selection made from the values passed to the recorder, in the dtype of the stream (float with np.nan for the integer streams) '''
+    time_steps_ls = sorted(recorded_dir[stream_name].keys())
+    if time_steps is not None:
+        selected = set(range(reader.metadata['all_time_step'])[time_steps]) if isinstance(time_steps, slice) else set(time_steps)
+        time_steps_ls = [time_step for time_step in time_steps_ls if time_step in selected]
+    sites = reader.get_sites(stream_name)
+    for ids, columns in ((patch_id, reader.columns_patch_id), (h_id, reader.columns_habitat_id), (microsite_id, reader.columns_mocrosite_id)):
+        if ids is not None:
+            sites = sites[np.isin(columns[sites], np.atleast_1d(ids))]
+    values = np.array([recorded_dir[stream_name][time_step][sites] for time_step in time_steps_ls]).reshape(len(time_steps_ls), len(sites))
+    stream = reader.get_stream_info(stream_name)
+    return values if stream['sentinel'] is not None else values.astype(stream['dtype'])
+
+def test_reader_keeps_the_recorded_time_steps_and_sites_of_the_policies(recorded_run):
+    reader, recorded_dir, first_row_dir = recorded_run
+    for stream_name in recording_args_dir.keys():
+        assert list(reader.get_time_steps(stream_name)) == sorted(recorded_dir[stream_name].keys())
+    assert list(reader.get_time_steps('species')) == list(range(0, 50, 3))
+    assert len(reader.get_time_steps('micro_phenotype')) == 12
+    assert list(reader.get_time_steps('macro_phenotype')) == [42, 44, 46, 48]
+    assert len(reader.get_sites('species')) == 4*4*3
+    assert len(reader.get_sites('micro_phenotype')) == reader.sites_num
+
+selections_ls = [dict(),
+                 dict(time_steps=range(10, 30), patch_id='patch2'),
+                 dict(time_steps=slice(5, 45), h_id='h2'),
+                 dict(time_steps=[0, 3, 12, 47, 48], patch_id=['patch1', 'patch4']),
+                 dict(patch_id='patch3', h_id=['h1', 'h3'], microsite_id=['r0, c0', 'r2, c3', 'r4, c4']),
+                 dict(time_steps=[], patch_id='patch1')]
+
+@pytest.mark.parametrize('stream_name', list(recording_args_dir.keys()))
+@pytest.mark.parametrize('selection', selections_ls)
+def test_read_and_read_dataframe_select_the_recorded_values(recorded_run, stream_name, selection):
+    reader, recorded_dir, first_row_dir = recorded_run
+    values = reader.read(stream_name, **selection)
+    np.testing.assert_array_equal(values, expected_values(reader, recorded_dir, stream_name, **selection))
+
+    df = reader.read_dataframe(stream_name, **selection)
+    np.testing.assert_array_equal(df.values, values)
+    time_steps_ls = sorted(recorded_dir[stream_name].keys())
+    expected_index = ['time_step%d'%time_step for time_step in time_steps_ls]
+    if 'time_steps' in selection:
+        expected_index = ['time_step%d'%time_step for time_step in range(50)[selection['time_steps']]] if isinstance(selection['time_steps'], slice) else \
+                         ['time_step%d'%time_step for time_step in selection['time_steps']]
+        expected_index = [name for name in expected_index if int(name[len('time_step'):]) in time_steps_ls]
+    assert list(df.index) == expected_index
+    for patch_id, h_id, microsite_id in df.columns:
+        assert selection.get('patch_id') is None or patch_id in np.atleast_1d(selection['patch_id'])
+        assert selection.get('h_id') is None or h_id in np.atleast_1d(selection['h_id'])
+
+def test_selections_are_contiguous_slices_or_fancy_indexes(recorded_run):
+    reader, recorded_dir, first_row_dir = recorded_run
+    assert isinstance(reader.select_columns('micro_phenotype', patch_id='patch2'), slice)
+    assert isinstance(reader.select_columns('micro_phenotype', h_id='h2'), np.ndarray)
+    assert isinstance(reader.select_rows('species', time_steps=range(10, 30)), slice)
+    assert isinstance(reader.select_rows('micro_phenotype', time_steps=[0, 3, 12, 47, 48]), np.ndarray)
+
+def test_empty_microsites_are_read_as_nan(recorded_run):
+    reader, recorded_dir, first_row_dir = recorded_run
+    species = reader.read('species')
+    assert np.isnan(species).any() and not np.isnan(species).all()
+    raw = np.asarray(reader.get_memmap('species'))[1:]
+    assert np.array_equal(np.isnan(species), raw == reader.get_stream_info('species')['sentinel'])
+
+@pytest.mark.parametrize('stream_name', list(recording_args_dir.keys()))
+def test_read_first_row_is_the_reference_row(recorded_run, stream_name):
+    reader, recorded_dir, first_row_dir = recorded_run
+    expected = first_row_dir[stream_name][reader.get_sites(stream_name)]
+    stream = reader.get_stream_info(stream_name)
+    np.testing.assert_array_equal(reader.read_first_row(stream_name), expected if stream['sentinel'] is not None else expected.astype(stream['dtype']))
+
+@pytest.mark.parametrize('recording_args', [{'sites':[0, 1, 2]}, {'every':2, 'evrey':3}])
+def test_unknown_recording_arguments_are_rejected(recording_args):
+    meta, log_info = model.generating_empty_metacommunity('empty_metacommunity', 1, [(0, 0)], 0.5, 1, 1, 3, 3, [0.0], [0.0], 2,
+                                                          ('micro_environment', 'macro_environment'), (0.025, 0.025))
+    with pytest.raises(ValueError, match='inputed is no found'):
+        model.generating_recording_policy_dir(meta_object=meta, all_time_step=10, recording_args_dir={'species':recording_args})
+    assert model.generating_recording_policy_dir(meta_object=meta, all_time_step=10, recording_args_dir={'species':{'every':2, 'monitoring_sites_num':3}})['species'].get_recorded_num() == 5